@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
 
 from app.core.database import get_db
 from app.models.device import Device
 from app.models.credential import CredentialProfile
+from app.models.site import Site
 from app.schemas.device import DeviceCreate, DeviceResponse, DeviceUpdate
-from app.network.tasks import execute_command, fetch_interfaces, configure_ip, configure_bgp, configure_policy, backup_config
-from app.network.nornir_tasks import deploy_config_template_nornir
+from app.network.tasks import execute_command, execute_command_streaming, execute_commands, execute_commands_fleet, fetch_interfaces, configure_ip, configure_bgp, configure_policy, backup_config
+from app.network.deploy_jobs import create_deploy_job, get_deploy_job, get_deploy_job_hosts
+from app.network.nornir_processors import list_run_results, iter_run_results
+from app.network.templating import TemplateRenderer
+from jinja2 import TemplateSyntaxError
+from app.network.streaming import iter_sse_events
+from app.network.async_engine import supports_exec
+from app.network.task_events import get_task_metas, iter_task_state_events
+from app.network import result_cache
+from app.network.dedup import dispatch_deduplicated, get_stats as get_dedup_stats
+from app.core.result_store import get_blob, resolve_blob_refs
 from celery.result import AsyncResult
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 router = APIRouter()
 
@@ -64,6 +75,25 @@ def get_device(device_id: int, db: Session = Depends(get_db)):
 
 class CommandRequest(BaseModel):
     command: str
+    # Accept a cached result up to this many seconds old; 0 always goes to the device
+    max_age: Optional[int] = None
+
+class BatchCommandRequest(BaseModel):
+    commands: List[str] = Field(..., min_length=1)
+
+class MultiDeviceBatchCommandRequest(BaseModel):
+    device_ids: List[int] = []
+    # Shared ordered command list, run on every device in device_ids
+    commands: List[str] = []
+    # Optional per-device command lists; these override `commands` for the given device
+    device_commands: Dict[int, List[str]] = {}
+    # "celery": one worker task per device; "async": one task driving every device on an asyncio engine
+    engine: Literal["celery", "async"] = "celery"
+    max_concurrency: Optional[int] = None
+
+class TaskStatusBatchRequest(BaseModel):
+    task_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    resolve: bool = False
 
 class IPConfigRequest(BaseModel):
     interface: str
@@ -84,8 +114,19 @@ class PolicyConfigRequest(BaseModel):
 class BulkDeployRequest(BaseModel):
     tenant_id: int
     device_ids: List[int]
+    # Jinja2 template rendered per host from template_vars, the host's inventory data and host_vars
     template_content: str
+    template_vars: Dict[str, Any] = {}
+    # Per-device variable overrides, keyed by device id
+    host_vars: Dict[int, Dict[str, Any]] = {}
     dry_run: bool = False
+    # Rolling rollout: canary hosts first, then batches of `batch_size` hosts (a count or e.g. "10%"),
+    # per site when batch_per_site is set. Halts once the failure rate so far exceeds max_failure_rate.
+    canary_size: int = Field(default=0, ge=0)
+    batch_size: Optional[Union[int, Annotated[str, Field(pattern=r"^\d+(\.\d+)?%$")]]] = None
+    batch_per_site: bool = False
+    max_failure_rate: float = Field(default=1.0, ge=0, le=1)
+    num_workers: Optional[int] = Field(default=None, ge=1, le=200)
     
 @router.post("/{device_id}/execute")
 def execute_device_command(device_id: int, request: CommandRequest, db: Session = Depends(get_db)):
@@ -98,29 +139,229 @@ def execute_device_command(device_id: int, request: CommandRequest, db: Session
     if not credential:
         raise HTTPException(status_code=400, detail="Device has no valid credential profile")
 
+    cached = result_cache.get_cached(device.id, request.command, max_age=request.max_age)
+    if cached:
+        return {"task_id": None, "cached": True, "cache_age": cached["age"], "task_result": cached["result"]}
+
     # Dispatch to Celery
-    task = execute_command.delay(
+    # Identical requests already queued or running share that task instead of opening another session
+    task_id, deduplicated = dispatch_deduplicated(
+        execute_command,
         host=device.ip_address,
         vendor=device.vendor,
         username=credential.username,
         password=credential.encrypted_password, # In a real app, this would be decrypted here
-        command=request.command
+        command=request.command,
+        device_id=device.id, site_id=device.site_id
     )
     
-    return {"task_id": task.id, "message": "Command dispatched to background worker"}
+    return {"task_id": task_id, "deduplicated": deduplicated, "message": "Command dispatched to background worker"}
     
+@router.post("/{device_id}/execute/stream")
+def execute_device_command_streaming(device_id: int, request: CommandRequest, db: Session = Depends(get_db)):
+    """
+    Dispatches a command whose output is streamed live; read it from GET /devices/task/{task_id}/stream.
+    """
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+        
+    credential = db.query(CredentialProfile).filter(CredentialProfile.id == device.credential_id).first()
+    if not credential:
+        raise HTTPException(status_code=400, detail="Device has no valid credential profile")
+
+    # Streams are replayable from the start, so a duplicate request can follow the existing one
+    task_id, deduplicated = dispatch_deduplicated(
+        execute_command_streaming,
+        host=device.ip_address,
+        vendor=device.vendor,
+        username=credential.username,
+        password=credential.encrypted_password,
+        command=request.command,
+        device_id=device.id, site_id=device.site_id
+    )
+    
+    return {
+        "task_id": task_id,
+        "deduplicated": deduplicated,
+        "stream_url": f"/api/v1/devices/task/{task_id}/stream",
+        "message": "Command dispatched, output will be streamed"
+    }
+
+@router.post("/{device_id}/execute/batch")
+def execute_device_command_batch(device_id: int, request: BatchCommandRequest, db: Session = Depends(get_db)):
+    """
+    Runs an ordered list of commands on one device within a single SSH session.
+    """
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+        
+    credential = db.query(CredentialProfile).filter(CredentialProfile.id == device.credential_id).first()
+    if not credential:
+        raise HTTPException(status_code=400, detail="Device has no valid credential profile")
+
+    task_id, deduplicated = dispatch_deduplicated(
+        execute_commands,
+        host=device.ip_address,
+        vendor=device.vendor,
+        username=credential.username,
+        password=credential.encrypted_password,
+        commands=request.commands,
+        device_id=device.id, site_id=device.site_id
+    )
+    
+    return {"task_id": task_id, "deduplicated": deduplicated, "message": f"{len(request.commands)} commands dispatched to background worker"}
+
+@router.post("/execute/batch")
+def execute_multi_device_command_batch(request: MultiDeviceBatchCommandRequest, db: Session = Depends(get_db)):
+    """
+    Fans a command batch out over many devices, one task (and one SSH session) per device.
+    """
+    plan = {device_id: request.commands for device_id in request.device_ids}
+    plan.update(request.device_commands)
+    plan = {device_id: commands for device_id, commands in plan.items() if commands}
+    if not plan:
+        raise HTTPException(status_code=400, detail="No commands to execute")
+
+    rows = db.query(Device, CredentialProfile, Site.tenant_id).join(
+        CredentialProfile, Device.credential_id == CredentialProfile.id
+    ).outerjoin(Site, Device.site_id == Site.id).filter(Device.id.in_(plan.keys())).all()
+
+    fleet_devices = []
+    fleet_task_id = None
+    if request.engine == "async":
+        # Boxes that only take commands in an interactive shell fall back to one Celery task each
+        targets = [
+            {
+                "device_id": device.id,
+                "site_id": device.site_id,
+                "tenant_id": tenant_id,
+                "vendor": device.vendor,
+                "host": device.ip_address,
+                "port": device.port,
+                "username": credential.username,
+                "password": credential.encrypted_password,
+                "commands": plan[device.id]
+            }
+            for device, credential, tenant_id in rows if supports_exec(device.vendor)
+        ]
+        rows = [row for row in rows if not supports_exec(row[0].vendor)]
+        fleet_devices = [target["device_id"] for target in targets]
+        if targets:
+            fleet_task_id = execute_commands_fleet.delay(targets=targets, max_concurrency=request.max_concurrency).id
+
+    tasks = {}
+    deduplicated = []
+    for device, credential, _ in rows:
+        task_id, reused = dispatch_deduplicated(
+            execute_commands,
+            host=device.ip_address,
+            vendor=device.vendor,
+            username=credential.username,
+            password=credential.encrypted_password,
+            commands=plan[device.id],
+            device_id=device.id, site_id=device.site_id
+        )
+        tasks[device.id] = task_id
+        if reused:
+            deduplicated.append(device.id)
+
+    skipped = [device_id for device_id in plan if device_id not in tasks and device_id not in fleet_devices]
+    if request.engine == "async":
+        return {
+            "task_id": fleet_task_id,
+            "engine": "async",
+            "tasks": tasks,
+            "skipped": skipped,
+            "deduplicated": deduplicated,
+            "message": f"Command batches for {len(fleet_devices)} devices dispatched to async engine, {len(tasks)} to Celery workers"
+        }
+    return {
+        "tasks": tasks,
+        "skipped": skipped,
+        "deduplicated": deduplicated,
+        "message": f"Command batches dispatched to {len(tasks)} devices"
+    }
+
+@router.post("/task/status")
+def get_task_status_batch(request: TaskStatusBatchRequest):
+    """
+    Status of many tasks in one call, read from the result backend with a single MGET.
+    Results stay as blob references unless resolve=true.
+    """
+    tasks = []
+    for task_id, meta in zip(request.task_ids, get_task_metas(request.task_ids)):
+        status = meta["status"] if meta else "PENDING"
+        payload = meta.get("result") if meta and status in ("SUCCESS", "FAILURE") else None
+        tasks.append({
+            "task_id": task_id,
+            "task_status": status,
+            "task_result": resolve_blob_refs(payload) if request.resolve else payload
+        })
+    return {"tasks": tasks}
+
+@router.get("/task/events")
+def stream_task_state_events(task_ids: List[str] = Query(..., max_length=1000)):
+    """
+    Server-Sent Events feed of state transitions (STARTED, RETRY, SUCCESS, FAILURE) for the given
+    tasks, starting with a snapshot of their current state. Ends once every task has finished.
+    """
+    return StreamingResponse(
+        iter_task_state_events(task_ids),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/task/{task_id}")
-def get_task_status(task_id: str):
+def get_task_status(task_id: str, resolve: bool = True):
+    """
+    Large result fields are stored as blob references; they are loaded here unless resolve=false,
+    in which case clients fetch them individually from /devices/task/blob/{digest}.
+    """
     task_result = AsyncResult(task_id)
+    payload = task_result.result if task_result.ready() else None
     result = {
         "task_id": task_id,
         "task_status": task_result.status,
-        "task_result": task_result.result if task_result.ready() else None
+        "task_result": resolve_blob_refs(payload) if resolve else payload
     }
     return result
 
+@router.get("/task/blob/{digest}")
+def get_task_result_blob(digest: str):
+    content = get_blob(digest)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Result blob not found or expired")
+    return {"sha256": digest, "content": content}
+
+@router.get("/task/{task_id}/stream")
+def stream_task_output(task_id: str, last_event_id: Optional[str] = Header(default=None)):
+    """
+    Server-Sent Events feed of a streaming task's output chunks, ending with an `end` event.
+    """
+    return StreamingResponse(
+        iter_sse_events(task_id, last_event_id=last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/cache/stats")
+def get_show_cache_stats():
+    """
+    Hit/miss/invalidation counters for the show command result cache.
+    """
+    return result_cache.get_stats()
+
+@router.get("/dedup/stats")
+def get_task_dedup_stats():
+    """
+    How many dispatch requests were coalesced onto an identical in-flight task.
+    """
+    return get_dedup_stats()
+
 @router.post("/{device_id}/interfaces")
-def get_device_interfaces(device_id: int, db: Session = Depends(get_db)):
+def get_device_interfaces(device_id: int, max_age: Optional[int] = None, db: Session = Depends(get_db)):
     # Fetch device and credential
     device = db.query(Device).filter(Device.id == device_id).first()
     if not device:
@@ -130,15 +371,21 @@ def get_device_interfaces(device_id: int, db: Session = Depends(get_db)):
     if not credential:
         raise HTTPException(status_code=400, detail="Device has no valid credential profile")
 
+    cached = result_cache.get_cached(device.id, "show ip interface brief", parse_mode="textfsm", max_age=max_age)
+    if cached:
+        return {"task_id": None, "cached": True, "cache_age": cached["age"], "task_result": cached["result"]}
+
     # Dispatch to Celery to fetch structured interface data
-    task = fetch_interfaces.delay(
+    task_id, deduplicated = dispatch_deduplicated(
+        fetch_interfaces,
         host=device.ip_address,
         vendor=device.vendor,
         username=credential.username,
-        password=credential.encrypted_password 
+        password=credential.encrypted_password,
+        device_id=device.id, site_id=device.site_id
     )
     
-    return {"task_id": task.id, "message": "Fetching interfaces in background"}
+    return {"task_id": task_id, "deduplicated": deduplicated, "message": "Fetching interfaces in background"}
 
 @router.post("/{device_id}/configure/ip")
 def configure_device_ip(device_id: int, request: IPConfigRequest, db: Session = Depends(get_db)):
@@ -149,7 +396,7 @@ def configure_device_ip(device_id: int, request: IPConfigRequest, db: Session =
     
     task = configure_ip.delay(
         host=device.ip_address, vendor=device.vendor, username=credential.username, password=credential.encrypted_password,
-        interface=request.interface, ip_address=request.ip_address, subnet_mask=request.subnet_mask
+        interface=request.interface, ip_address=request.ip_address, subnet_mask=request.subnet_mask, device_id=device.id, site_id=device.site_id
     )
     return {"task_id": task.id, "message": "IP Configuration sent to worker"}
 
@@ -160,7 +407,7 @@ def configure_device_bgp(device_id: int, request: BGPConfigRequest, db: Session
     
     task = configure_bgp.delay(
         host=device.ip_address, vendor=device.vendor, username=credential.username, password=credential.encrypted_password,
-        local_as=request.local_as, neighbor_ip=request.neighbor_ip, remote_as=request.remote_as
+        local_as=request.local_as, neighbor_ip=request.neighbor_ip, remote_as=request.remote_as, device_id=device.id, site_id=device.site_id
     )
     return {"task_id": task.id, "message": "BGP Configuration sent to worker"}
 
@@ -171,7 +418,7 @@ def configure_device_policy(device_id: int, request: PolicyConfigRequest, db: Se
     
     task = configure_policy.delay(
         host=device.ip_address, vendor=device.vendor, username=credential.username, password=credential.encrypted_password,
-        map_name=request.map_name, action=request.action, sequence=request.sequence, match_prefix=request.match_prefix
+        map_name=request.map_name, action=request.action, sequence=request.sequence, match_prefix=request.match_prefix, device_id=device.id, site_id=device.site_id
     )
     return {"task_id": task.id, "message": "Routing Policy Configuration sent to worker"}
 
@@ -185,81 +432,214 @@ def backup_device_config(device_id: int, db: Session = Depends(get_db)):
     if not credential:
         raise HTTPException(status_code=400, detail="Device has no valid credential profile")
 
-    task = backup_config.delay(
-        host=device.ip_address, vendor=device.vendor, username=credential.username, password=credential.encrypted_password, tenant_id=device.tenant_id
+    task_id, deduplicated = dispatch_deduplicated(
+        backup_config,
+        host=device.ip_address, vendor=device.vendor, username=credential.username, password=credential.encrypted_password, tenant_id=_device_tenant(db, device).id, device_id=device.id, site_id=device.site_id
     )
     
-    return {"task_id": task.id, "message": "Device configuration backup started"}
+    return {"task_id": task_id, "deduplicated": deduplicated, "message": "Device configuration backup started"}
 
 @router.post("/config/deploy")
 def bulk_deploy_config(request: BulkDeployRequest, db: Session = Depends(get_db)):
     """
     Eksekusi konfigurasi ke banyak perangkat secara simultan dengan fitur Dry-run.
-    Uses Nornir to run against all targeted inventory devices concurrently.
+    Queues a Nornir deploy job and returns immediately; follow it by job ID.
     """
     try:
-        results = deploy_config_template_nornir(
-            db=db,
-            template_content=request.template_content,
-            tenant_id=request.tenant_id,
-            device_ids=request.device_ids,
-            dry_run=request.dry_run
-        )
-        return {"message": "Bulk deployment successful", "results": results}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        TemplateRenderer(request.template_content)
+    except TemplateSyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template (line {e.lineno}): {e.message}")
+    job = create_deploy_job(
+        db,
+        template_content=request.template_content,
+        tenant_id=request.tenant_id,
+        device_ids=request.device_ids,
+        dry_run=request.dry_run,
+        template_vars=request.template_vars,
+        host_vars=request.host_vars,
+        canary_size=request.canary_size,
+        batch_size=request.batch_size,
+        batch_per_site=request.batch_per_site,
+        max_failure_rate=request.max_failure_rate,
+        num_workers=request.num_workers
+    )
+    if not job["job_id"]:
+        raise HTTPException(status_code=404, detail="No deployable devices found for this tenant")
+    return {
+        **job,
+        "status_url": f"/api/v1/devices/config/deploy/{job['job_id']}",
+        "hosts_url": f"/api/v1/devices/config/deploy/{job['job_id']}/hosts",
+        "stream_url": f"/api/v1/devices/config/deploy/{job['job_id']}/stream",
+        "results_url": f"/api/v1/devices/config/runs/{job['job_id']}/results",
+        "message": f"Deployment to {job['total']} devices queued"
+    }
 
-from app.core.git_manager import GitManager
-from app.models.tenant import Tenant
+@router.get("/config/deploy/{job_id}")
+def get_bulk_deploy_status(job_id: str):
+    """
+    Per-state host counts, progress and (once finished) batch summary of a deploy job.
+    """
+    job = get_deploy_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deploy job not found or expired")
+    return job
 
-@router.get("/{device_id}/backup/history")
-def get_device_backup_history(device_id: int, db: Session = Depends(get_db)):
+@router.get("/config/deploy/{job_id}/hosts")
+def get_bulk_deploy_hosts(job_id: str, offset: int = 0, limit: int = 100, state: Optional[str] = None):
     """
-    Mengambil data riwayat konfigurasi dari Git.
+    Paginated per-host progress records: pending, running, succeeded, failed or skipped.
     """
+    hosts = get_deploy_job_hosts(job_id, offset=offset, limit=min(limit, 1000), state=state)
+    if hosts is None:
+        raise HTTPException(status_code=404, detail="Deploy job not found or expired")
+    return hosts
+
+@router.get("/config/runs/{run_id}/results")
+def get_config_run_results(run_id: str, after_id: int = 0, limit: int = 100, status: Optional[Literal["success", "fail"]] = None):
+    """
+    Host outcomes of a Nornir run (deploy job ID or mitigation task ID) in completion order,
+    stored as each host finishes. Page with after_id = the last id seen.
+    """
+    items = list_run_results(run_id, after_id=after_id, limit=min(limit, 1000), status=status)
+    return {"run_id": run_id, "items": items, "next_after_id": items[-1]["id"] if items else after_id}
+
+@router.get("/config/runs/{run_id}/live")
+def stream_config_run_results(run_id: str):
+    """
+    Server-Sent Events of a Nornir run: stored host results first, then each host as it completes.
+    """
+    return StreamingResponse(
+        iter_run_results(run_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/config/deploy/{job_id}/stream")
+def stream_bulk_deploy(job_id: str, last_event_id: Optional[str] = Header(default=None)):
+    """
+    Server-Sent Events feed: a `job` event once a worker picks the job up, then one `host` event
+    per host state change, ending with an `end` event when the job finishes.
+    """
+    return StreamingResponse(
+        iter_sse_events(job_id, last_event_id=last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+from datetime import datetime, timedelta, timezone
+from app.core.git_manager import GitManager
+from app.models.tenant import Tenant
+from app.models.config_backup import ConfigBackup
+from app.network.backup_index import list_device_backups, list_changed_backups, oldest_backup
+
+def _device_tenant(db: Session, device: Device) -> Optional[Tenant]:
+    # Devices belong to a tenant through their site
+    return db.query(Tenant).join(Site, Site.tenant_id == Tenant.id).filter(Site.id == device.site_id).first()
+
+def _backup_git_manager(db: Session, device_id: int):
     device = db.query(Device).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-        
-    tenant = db.query(Tenant).filter(Tenant.id == device.tenant_id).first()
+
+    tenant = _device_tenant(db, device)
     if not tenant or not tenant.git_repo_url:
          raise HTTPException(status_code=400, detail="Tenant does not have a configured Git Repository")
-         
+
     git_manager = GitManager(
         tenant_id=tenant.id, 
         repo_url=tenant.git_repo_url, 
         branch=tenant.git_branch, 
         token=tenant.git_token
     )
-    
-    history = git_manager.get_commit_history(hostname=device.ip_address)
-    return {"device_id": device.id, "hostname": device.ip_address, "history": history}
+    return device, git_manager
 
-@router.get("/{device_id}/backup/history/{commit_hash}")
-def get_device_backup_content(device_id: int, commit_hash: str, db: Session = Depends(get_db)):
+def _sync_if_requested(git_manager: GitManager, refresh: bool):
+    if refresh:
+        try:
+            git_manager.fetch()
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Failed to fetch the Git repository: {str(e)}")
+
+def _history_before_index(db: Session, device: Device, git_manager: GitManager, before_commit: Optional[str], limit: int) -> Dict[str, Any]:
     """
-    Mendapatkan isi konfigurasi spesifik pada titik commit Git tertentu.
+    One page of the device's Git commits made before its first indexed backup, newest first.
+    Pass next_before_commit back as before_commit for the next page.
+    """
+    oldest = oldest_backup(db, device.id)
+    until = None
+    if oldest is not None:
+        until = oldest.collected_at if oldest.collected_at.tzinfo else oldest.collected_at.replace(tzinfo=timezone.utc)
+    history = git_manager.get_commit_history(hostname=device.ip_address, limit=limit + 1, until=until, before_commit=before_commit)
+    next_before_commit = history[limit - 1]["commit_hash"] if len(history) > limit else None
+    history = history[:limit]
+    # The first indexed backup's own commit predates its collected_at; it is listed by the index already
+    indexed = {sha for (sha,) in db.query(ConfigBackup.commit_sha).filter(
+        ConfigBackup.device_id == device.id, ConfigBackup.commit_sha.in_([commit["commit_hash"] for commit in history])
+    )}
+    return {"history": [commit for commit in history if commit["commit_hash"] not in indexed], "next_before_commit": next_before_commit}
+
+@router.get("/backups/changed")
+def get_changed_backups(tenant_id: int, since_hours: float = 24, before_id: Optional[int] = None, limit: int = 100,
+                        db: Session = Depends(get_db)):
+    """
+    Backups across a tenant's fleet whose configuration changed in the last `since_hours`, newest first.
+    Pass next_before_id back as before_id for the next page.
+    """
+    since = datetime.now(timezone.utc) - timedelta(hours=since_hours)
+    page = list_changed_backups(db, tenant_id=tenant_id, since=since, before_id=before_id, limit=min(limit, 1000))
+    return {"tenant_id": tenant_id, "since": since.isoformat(), **page}
+
+@router.get("/{device_id}/backup/history")
+def get_device_backup_history(device_id: int, before_id: Optional[int] = None, limit: int = 50, changed_only: bool = True,
+                              refresh: bool = False, db: Session = Depends(get_db)):
+    """
+    Mengambil data riwayat konfigurasi dari Git.
+    Listed from the config_backups index, newest first; pass next_before_id back as before_id for
+    the next page. Git commits that predate the index are listed by /backup/legacy-history. Devices
+    with no indexed backups yet fall back to the local Git clone, whose `freshness` tells when it
+    last matched the remote (refresh=true fetches before answering). Entries from either source
+    carry commit_hash (None for unversioned backups), author, date and message.
     """
     device = db.query(Device).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-        
-    tenant = db.query(Tenant).filter(Tenant.id == device.tenant_id).first()
-    if not tenant or not tenant.git_repo_url:
-         raise HTTPException(status_code=400, detail="Tenant does not have a configured Git Repository")
-         
-    git_manager = GitManager(
-        tenant_id=tenant.id, 
-        repo_url=tenant.git_repo_url, 
-        branch=tenant.git_branch, 
-        token=tenant.git_token
-    )
-    
+
+    page = list_device_backups(db, device_id=device.id, before_id=before_id, limit=min(limit, 500), changed_only=changed_only)
+    if page["items"] or before_id is not None:
+        return {"device_id": device.id, "hostname": device.ip_address, "history": page["items"], "next_before_id": page["next_before_id"]}
+
+    device, git_manager = _backup_git_manager(db, device_id)
+    _sync_if_requested(git_manager, refresh)
+    history = git_manager.get_commit_history(hostname=device.ip_address, limit=min(limit, 500))
+    return {"device_id": device.id, "hostname": device.ip_address, "history": history, "next_before_id": None,
+            "freshness": git_manager.freshness()}
+
+@router.get("/{device_id}/backup/legacy-history")
+def get_device_legacy_backup_history(device_id: int, before_commit: Optional[str] = None, limit: int = 50,
+                                     refresh: bool = False, db: Session = Depends(get_db)):
+    """
+    Git commits of the device made before its first indexed backup (the history the
+    config_backups index does not cover), newest first, read from the local Git clone.
+    Pass next_before_commit back as before_commit for the next page.
+    """
+    device, git_manager = _backup_git_manager(db, device_id)
+    _sync_if_requested(git_manager, refresh)
+    page = _history_before_index(db, device, git_manager, before_commit=before_commit, limit=min(limit, 500))
+    return {"device_id": device.id, "hostname": device.ip_address, **page, "freshness": git_manager.freshness()}
+
+@router.get("/{device_id}/backup/history/{commit_hash}")
+def get_device_backup_content(device_id: int, commit_hash: str, refresh: bool = False, db: Session = Depends(get_db)):
+    """
+    Mendapatkan isi konfigurasi spesifik pada titik commit Git tertentu.
+    """
+    device, git_manager = _backup_git_manager(db, device_id)
+    _sync_if_requested(git_manager, refresh)
+
     content = git_manager.get_file_content_at_commit(hostname=device.ip_address, commit_hash=commit_hash)
     if not content:
         raise HTTPException(status_code=404, detail="Configuration file not found for this commit")
         
-    return {"device_id": device.id, "commit_hash": commit_hash, "content": content}
+    return {"device_id": device.id, "commit_hash": commit_hash, "content": content, "freshness": git_manager.freshness()}
 
 @router.get("/db/migrate")
 def trigger_backend_migration():
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+
+from app.core.database import get_db
+from app.network.bulk_jobs import create_bulk_job, get_job_status, get_job_results
+from app.network.backup_runs import get_backup_run
+
+router = APIRouter()
+
+class DeviceSelector(BaseModel):
+    tenant_id: Optional[int] = None
+    site_id: Optional[int] = None
+    vendor: Optional[str] = None
+    device_ids: Optional[List[int]] = None
+    include_inactive: bool = False
+
+class BulkJobRequest(BaseModel):
+    action: Literal["backup", "execute", "interfaces"]
+    selector: DeviceSelector
+    # Required for the "execute" action, run in order within one session per device
+    commands: Optional[List[str]] = None
+
+@router.post("/bulk")
+def create_bulk_device_job(request: BulkJobRequest, db: Session = Depends(get_db)):
+    """
+    Fans one action out over every device matching the selector and returns a single job ID.
+    """
+    if request.action == "execute" and not request.commands:
+        raise HTTPException(status_code=400, detail="Commands are required for the execute action")
+    if not any([request.selector.tenant_id, request.selector.site_id, request.selector.vendor, request.selector.device_ids]):
+        raise HTTPException(status_code=400, detail="Selector must narrow the fleet by tenant, site, vendor or device IDs")
+
+    job = create_bulk_job(db, request.action, commands=request.commands, **request.selector.model_dump())
+    if not job["job_id"]:
+        if job.get("skipped_inflight"):
+            raise HTTPException(status_code=409, detail="A backup is already queued or running for every matching device")
+        raise HTTPException(status_code=404, detail="No reachable devices match the selector")
+    return {**job, "message": f"Bulk {request.action} dispatched to {job['total']} devices"}
+
+@router.get("/backup-runs/{run_id}")
+def get_backup_run_status(run_id: str):
+    """
+    A tenant backup run: how many configs were staged, the commits they went into,
+    and whether each device's config changed.
+    """
+    run = get_backup_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Backup run not found or expired")
+    return run
+
+@router.get("/{job_id}")
+def get_bulk_job_status(job_id: str):
+    """
+    Aggregate progress of a bulk job: queued/running/succeeded/failed counts and an ETA.
+    """
+    status = get_job_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return status
+
+@router.get("/{job_id}/results")
+def get_bulk_job_results(job_id: str, offset: int = 0, limit: int = 100, state: Optional[str] = None, resolve: bool = False):
+    """
+    Paginated per-device results. Large fields stay blob references unless resolve=true.
+    """
+    results = get_job_results(job_id, offset=offset, limit=min(limit, 1000), state=state, resolve=resolve)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return results
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models.device import Device
 from app.network.telegraf_config import generate_telegraf_config
-from app.network.nornir_tasks import deploy_config_template_nornir
+from app.network.nornir_tasks import deploy_mitigation
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,7 +28,7 @@ def rebuild_telegraf_config(db: Session = Depends(get_db)):
     raise HTTPException(status_code=500, detail="Failed to rebuild Telegraf configuration.")
 
 @router.post("/anomaly-webhook")
-def fastnetmon_anomaly_webhook(alert: FastNetMonAlert, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def fastnetmon_anomaly_webhook(alert: FastNetMonAlert, db: Session = Depends(get_db)):
     """
     Webhook endpoint to receive anomaly alerts from FastNetMon (or similar systems).
     Triggers an automated BGP Blackhole mitigation script if severity is high.
@@ -54,14 +54,16 @@ def fastnetmon_anomaly_webhook(alert: FastNetMonAlert, background_tasks: Backgro
       network {alert.client_ip} mask 255.255.255.255 route-map RM-BLACKHOLE
     """
     
-    # Dispatch Nornir task to the background to push the mitigation config
-    background_tasks.add_task(
-        deploy_config_template_nornir,
-        db=db,
+    # Dispatch the Nornir push to the dedicated mitigation queue
+    task = deploy_mitigation.delay(
         template_content=blackhole_template,
         tenant_id=alert.tenant_id,
-        device_ids=device_ids,
-        dry_run=False
+        device_ids=device_ids
     )
     
-    return {"status": "alert_received", "message": f"Auto-mitigation initiated for {alert.client_ip}"}
+    return {
+        "status": "alert_received",
+        "task_id": task.id,
+        "results_url": f"/api/v1/devices/config/runs/{task.id}/live",
+        "message": f"Auto-mitigation initiated for {alert.client_ip}"
+    }
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.endpoints import tenant, site, device, auth, monitoring, erp
+from app.api.endpoints import tenant, site, device, auth, monitoring, erp, jobs
 
 api_router = APIRouter()
 
@@ -9,3 +9,4 @@ api_router.include_router(tenant.router, prefix="/tenants", tags=["tenants"])
 api_router.include_router(site.router, prefix="/sites", tags=["sites"])
 api_router.include_router(device.router, prefix="/devices", tags=["devices"])
 api_router.include_router(monitoring.router, prefix="/monitoring", tags=["monitoring"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
@@ -1,11 +1,41 @@
-from celery import Celery
+from celery import Celery, Task
+from kombu import Exchange, Queue
 from app.core.config import settings
+from app.core.result_store import offload_large_fields, prune_blobs
+
+class OffloadingTask(Task):
+    """
+    Moves large result fields (configs, command outputs) to the blob store before the
+    result reaches the Redis backend, which then only holds a reference and digest.
+    """
+    def __call__(self, *args, **kwargs):
+        return offload_large_fields(super().__call__(*args, **kwargs))
 
 celery_app = Celery(
     "network_worker",
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
-    include=["app.network.tasks"]
+    include=["app.network.tasks", "app.network.nornir_tasks", "app.network.bulk_jobs", "app.network.backup_scheduler", "app.network.backup_runs", "app.network.dedup", "app.network.task_events", "app.network.deploy_jobs"],
+    task_cls=OffloadingTask
+)
+
+# Workload classes. Each queue is consumed by its own worker profile in docker-compose.yml,
+# so a fleet-wide backup burst can never sit in front of an interactive read or a mitigation push.
+# Interactive and backup tasks are safe on a gevent pool; bulk (asyncio fan-out), config and
+# mitigation (Nornir thread pools) must be consumed by prefork workers.
+QUEUE_INTERACTIVE = "interactive"
+QUEUE_CONFIG = "config"
+QUEUE_BACKUP = "backup"
+QUEUE_BULK = "bulk"
+QUEUE_MITIGATION = "mitigation"
+
+# Read-only or naturally idempotent tasks; safe to run again if a worker dies mid-task
+IDEMPOTENT_TASKS = (
+    "app.network.tasks.execute_command",
+    "app.network.tasks.execute_command_streaming",
+    "app.network.tasks.execute_commands",
+    "app.network.tasks.fetch_interfaces",
+    "app.network.tasks.backup_config",
 )
 
 celery_app.conf.update(
@@ -14,4 +44,65 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+
+    task_queues=[
+        Queue(name, Exchange(name), routing_key=name)
+        for name in (QUEUE_INTERACTIVE, QUEUE_CONFIG, QUEUE_BACKUP, QUEUE_BULK, QUEUE_MITIGATION)
+    ],
+    task_default_queue=QUEUE_INTERACTIVE,
+    # Priority 0 is served first on the Redis transport
+    task_routes={
+        "app.network.tasks.execute_command": {"queue": QUEUE_INTERACTIVE, "priority": 0},
+        "app.network.tasks.execute_command_streaming": {"queue": QUEUE_INTERACTIVE, "priority": 0},
+        "app.network.tasks.execute_commands": {"queue": QUEUE_INTERACTIVE, "priority": 1},
+        "app.network.tasks.fetch_interfaces": {"queue": QUEUE_INTERACTIVE, "priority": 0},
+        "app.network.tasks.configure_*": {"queue": QUEUE_CONFIG, "priority": 2},
+        "app.network.tasks.backup_config": {"queue": QUEUE_BACKUP, "priority": 6},
+        "app.network.tasks.execute_commands_fleet": {"queue": QUEUE_BULK, "priority": 8},
+        "app.network.nornir_tasks.deploy_mitigation": {"queue": QUEUE_MITIGATION, "priority": 0},
+        "app.network.deploy_jobs.*": {"queue": QUEUE_CONFIG, "priority": 2},
+        "app.network.bulk_jobs.*": {"queue": QUEUE_BULK, "priority": 5},
+        "app.network.backup_scheduler.*": {"queue": QUEUE_BACKUP, "priority": 3},
+        "app.network.backup_runs.*": {"queue": QUEUE_BACKUP, "priority": 3},
+    },
+    task_default_priority=5,
+    broker_transport_options={
+        # Unacknowledged messages (late-acked tasks, and every task still waiting for its ETA) are
+        # redelivered after this long; it must exceed the longest late-acked runtime plus ETA
+        "visibility_timeout": settings.BROKER_VISIBILITY_TIMEOUT,
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+    },
+
+    # Long device tasks must not be hoarded by one worker while others sit idle
+    worker_prefetch_multiplier=1,
+    # Only read and backup tasks are acknowledged late (see task_annotations): redelivering them after
+    # a worker crash is harmless, whereas a redelivered configuration push would run on devices twice
+    task_acks_late=False,
+    task_annotations={name: {"acks_late": True} for name in IDEMPOTENT_TASKS},
+    # Lets job progress tell running tasks apart from queued ones
+    task_track_started=True,
+
+    # Results (and the blobs they reference) are kept for a bounded time only
+    result_expires=settings.RESULT_EXPIRES,
+    beat_schedule={
+        "schedule-fleet-backups": {
+            "task": "app.network.backup_scheduler.schedule_fleet_backups",
+            "schedule": float(settings.BACKUP_SCHEDULER_TICK),
+        },
+        "flush-stale-backup-runs": {
+            "task": "app.network.backup_runs.flush_stale_backup_runs",
+            "schedule": float(settings.BACKUP_SCHEDULER_TICK),
+        },
+        "prune-result-blobs": {
+            "task": "app.core.celery_app.prune_result_blobs",
+            "schedule": 3600.0,
+            "options": {"queue": QUEUE_BULK},
+        },
+    },
 )
+
+@celery_app.task(name="app.core.celery_app.prune_result_blobs")
+def prune_result_blobs():
+    return {"removed": prune_blobs()}
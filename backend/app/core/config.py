@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,6 +9,92 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     API_V1_STR: str = "/api/v1"
 
+    # Worker-local SSH connection pool (see app/network/connection_pool.py)
+    SSH_POOL_MAX_PER_HOST: int = 2
+    SSH_POOL_MAX_IDLE: int = 64
+    SSH_POOL_IDLE_TIMEOUT: float = 120.0
+    SSH_POOL_ACQUIRE_TIMEOUT: float = 30.0
+
+    # Asyncio SSH engine for fleet-wide fan-out (see app/network/async_engine.py)
+    ASYNC_SSH_MAX_CONCURRENCY: int = 500
+    ASYNC_SSH_CONNECT_TIMEOUT: float = 15.0
+    ASYNC_SSH_COMMAND_TIMEOUT: float = 60.0
+
+    # Streamed command output (Redis Streams, relayed to clients over SSE)
+    TASK_STREAM_TTL: int = 300
+    TASK_STREAM_MAXLEN: int = 10000
+
+    # TTL cache for read-only show command results (see app/network/result_cache.py)
+    SHOW_CACHE_DEFAULT_TTL: int = 15
+    SHOW_CACHE_MAX_TTL: int = 3600
+    # JSON object of command prefix -> TTL seconds, e.g. {"show ip route": 10}
+    SHOW_CACHE_TTL_OVERRIDES: Dict[str, int] = {}
+
+    # Distributed per-device / per-site concurrency limits across all workers (0 disables).
+    # Pooled SSH sessions keep their device slot while parked and close once another worker queues for it
+    DEVICE_CONCURRENCY_LIMIT: int = 1
+    # JSON object of device IP -> limit for boxes that tolerate more (or fewer) parallel sessions
+    DEVICE_CONCURRENCY_OVERRIDES: Dict[str, int] = {}
+    SITE_CONCURRENCY_LIMIT: int = 0
+    # Renewed while the slot is held; only bounds how long a dead worker's slot lingers
+    DEVICE_LOCK_LEASE: float = 900.0
+    DEVICE_LOCK_TIMEOUT: float = 300.0
+
+    # SSH phase timing export; histograms are always kept in Redis, InfluxDB is optional
+    INFLUXDB_URL: Optional[str] = None
+    INFLUXDB_DB: str = "telegraf"
+    INFLUXDB_USER: str = "admin"
+    INFLUXDB_PASSWORD: str = ""
+
+    # Large task results are stored zstd-compressed on a volume shared by API and workers
+    RESULT_BLOB_DIR: str = "/app/result_blobs"
+    RESULT_OFFLOAD_THRESHOLD: int = 16384
+    RESULT_BLOB_ZSTD_LEVEL: int = 3
+    RESULT_EXPIRES: int = 86400
+
+    # Fleet backup scheduler; per-tenant cadence and window live on the Tenant row
+    BACKUP_SCHEDULER_TICK: int = 300
+    BACKUP_JITTER_SECONDS: int = 60
+    BACKUP_INFLIGHT_TTL: int = 3600
+
+    # Redis broker redelivers unacknowledged messages after this long. Above the longest late-acked
+    # task (a backup, bounded by BACKUP_INFLIGHT_TTL) plus the longest ETA (a scheduler tick plus jitter)
+    BROKER_VISIBILITY_TIMEOUT: int = 21600
+
+    # Identical read-only requests coalesce onto one in-flight task; the key lapses after this long
+    DEDUP_TTL: int = 600
+
+    # SQLAlchemy pool per worker process. Under the gevent pool one process runs hundreds of tasks,
+    # so sessions queue (cooperatively) for these connections rather than opening one each
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+
+    # Process-level Nornir inventory cache; a refresh is forced after this many seconds even without
+    # a change notification (catches edits made outside the ORM)
+    INVENTORY_CACHE_MAX_STALENESS: float = 300.0
+    # Incremental refreshes re-read rows stamped up to this many seconds before the watermark: updated_at
+    # is the writing transaction's start time, so a slow transaction commits rows older than the watermark
+    INVENTORY_WATERMARK_OVERLAP: float = 60.0
+
+    # Default Nornir thread count per deploy; a request can lower it to spare the management network
+    NORNIR_NUM_WORKERS: int = 20
+
+    # Rendered per-host deploy configs, keyed by (template hash, vars hash)
+    RENDER_CACHE_TTL: int = 3600
+
+    # Max wait for the per-tenant lock on a local Git working copy
+    GIT_LOCK_TIMEOUT: float = 120.0
+
+    # Git history reads are served from the local clone; one older than this is fetched in the background
+    GIT_FETCH_INTERVAL: float = 60.0
+
+    # Extra per-vendor volatile-line rules (JSON, same shape as config_normalizer.DEFAULT_RULES)
+    CONFIG_NORMALIZATION_RULES_FILE: Optional[str] = None
+
+    # Backup runs: staged configs are committed per tenant in chunks of this many files, one push per run
+    GIT_COMMIT_CHUNK_SIZE: int = 500
+
     class Config:
         env_file = ".env"
 
@@ -1,14 +1,36 @@
 import os
 import git
+import time
+import fcntl
 import logging
-from typing import List, Dict, Any
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
 from git.exc import GitCommandError
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 # Base directory inside the Docker container to store local repo clones
 BASE_REPO_DIR = "/app/config_backups"
 
+# Open repositories per working copy for the life of the process, so reads never re-open or pull.
+# A Repo's git helper processes are not thread-safe, hence one read lock per working copy.
+_repos: Dict[str, git.Repo] = {}
+_read_locks: Dict[str, threading.Lock] = {}
+_fetching: set = set()
+_registry_lock = threading.Lock()
+
+class GitPushError(Exception):
+    """
+    Raised when commits were made locally but could not be pushed. `outcome` holds what was
+    committed; the next commit to the repository pushes them along with its own.
+    """
+    def __init__(self, message: str, outcome: Dict[str, Optional[str]]):
+        super().__init__(message)
+        self.outcome = outcome
+
 class GitManager:
     """
     Handles cloning, committing, and retrieving configuration history from Git repositories.
@@ -25,6 +47,28 @@ class GitManager:
             return url.replace("https://", f"https://oauth2:{token}@")
         return url
 
+    @contextmanager
+    def _repo_lock(self):
+        """
+        Serializes use of the tenant's working copy across worker processes and green threads.
+        The flock is polled non-blocking so a waiting greenlet yields instead of stalling the hub.
+        """
+        os.makedirs(BASE_REPO_DIR, exist_ok=True)
+        with open(f"{self.local_path}.lock", "w") as lock_file:
+            deadline = time.monotonic() + settings.GIT_LOCK_TIMEOUT
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for the Git lock of tenant {self.tenant_id}")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
     def _ensure_repo_ready(self) -> git.Repo:
         """Clones the repo if not exists, otherwise pulls the latest changes."""
         if not os.path.exists(self.local_path):
@@ -32,6 +76,7 @@ class GitManager:
             try:
                 logger.info(f"Cloning repo for Tenant {self.tenant_id} into {self.local_path}")
                 repo = git.Repo.clone_from(self.repo_url, self.local_path, branch=self.branch)
+                self._mark_fetched()
                 return repo
             except GitCommandError as e:
                 logger.error(f"Failed to clone repository: {str(e)}")
@@ -40,59 +85,224 @@ class GitManager:
             try:
                 repo = git.Repo(self.local_path)
                 repo.remotes.origin.pull(self.branch)
+                self._mark_fetched()
                 return repo
             except GitCommandError as e:
                 logger.error(f"Failed to pull repository updates: {str(e)}")
                 raise
 
+    def _fetch_stamp(self) -> str:
+        return f"{self.local_path}.fetched"
+
+    def _cached_repo(self) -> git.Repo:
+        """
+        The process's open handle on the tenant's working copy. Only the very first use (no local
+        clone yet) goes to the network.
+        """
+        with _registry_lock:
+            repo = _repos.get(self.local_path)
+        if repo is not None and os.path.isdir(self.local_path):
+            return repo
+        with self._repo_lock():
+            if os.path.exists(self.local_path):
+                repo = git.Repo(self.local_path)
+            else:
+                repo = self._ensure_repo_ready()
+        with _registry_lock:
+            _repos[self.local_path] = repo
+            _read_locks.setdefault(self.local_path, threading.Lock())
+        return repo
+
+    def _mark_fetched(self):
+        # A stamp file rather than process state, so every process sharing the clone sees the same watermark
+        with open(self._fetch_stamp(), "w"):
+            pass
+
+    def fetched_at(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self._fetch_stamp())
+        except OSError:
+            return None
+
+    def fetch(self):
+        """
+        Fetches the branch and fast-forwards the working copy, under the same lock as commits.
+        A working copy with unpushed local commits is left for the next commit's pull to reconcile.
+        """
+        repo = self._cached_repo()
+        with self._repo_lock():
+            origin = repo.remotes.origin
+            origin.fetch(self.branch)
+            remote_head = origin.refs[self.branch].commit
+            if repo.head.commit != remote_head and repo.is_ancestor(repo.head.commit, remote_head):
+                repo.head.reset(remote_head, index=True, working_tree=True)
+            self._mark_fetched()
+        logger.info(f"Fetched Git repository of Tenant {self.tenant_id}")
+
+    def refresh_in_background(self, force: bool = False) -> bool:
+        """
+        Starts a fetch on a background thread when the local copy is older than GIT_FETCH_INTERVAL
+        (or always with force). At most one fetch per working copy runs in this process.
+        """
+        fetched_at = self.fetched_at()
+        if not force and fetched_at is not None and time.time() - fetched_at < settings.GIT_FETCH_INTERVAL:
+            return False
+        with _registry_lock:
+            if self.local_path in _fetching:
+                return False
+            _fetching.add(self.local_path)
+
+        def run():
+            try:
+                self.fetch()
+            except Exception as e:
+                logger.warning(f"Background fetch for Tenant {self.tenant_id} failed: {str(e)}")
+            finally:
+                with _registry_lock:
+                    _fetching.discard(self.local_path)
+
+        threading.Thread(target=run, name=f"git-fetch-{self.tenant_id}", daemon=True).start()
+        return True
+
+    def freshness(self) -> Dict[str, Any]:
+        """Watermark for read responses: when the local copy last matched the remote."""
+        fetched_at = self.fetched_at()
+        age = time.time() - fetched_at if fetched_at is not None else None
+        return {
+            "fetched_at": datetime.fromtimestamp(fetched_at, timezone.utc).isoformat() if fetched_at is not None else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": age is None or age > settings.GIT_FETCH_INTERVAL,
+        }
+
+    @contextmanager
+    def _reading(self, refresh: bool = True):
+        """Local, lock-protected read access; a stale copy triggers a background fetch, never a wait."""
+        repo = self._cached_repo()
+        if refresh:
+            self.refresh_in_background()
+        with _read_locks[self.local_path]:
+            yield repo
+
+    def line_stats(self, commit_shas) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        Lines added and removed per hostname in each of the given commits, read from the local copy.
+        """
+        stats = {}
+        with self._reading(refresh=False) as repo:
+            for sha in commit_shas:
+                stats[sha] = {
+                    filename[:-len(".conf")]: {"added": counts["insertions"], "removed": counts["deletions"]}
+                    for filename, counts in repo.commit(sha).stats.files.items() if filename.endswith(".conf")
+                }
+        return stats
+
+    def _push_pending(self, repo: git.Repo) -> bool:
+        """
+        Pushes every local commit the remote branch lacks, including ones an earlier failed push
+        left behind. Returns False when there was nothing to push.
+        """
+        if not repo.head.is_valid():
+            return False
+        tracking = repo.active_branch.tracking_branch()
+        if tracking is not None and tracking.is_valid() and not any(True for _ in repo.iter_commits(f"{tracking.commit.hexsha}..HEAD", max_count=1)):
+            return False
+        repo.remotes.origin.push().raise_if_error()
+        return True
+
     def commit_device_config(self, hostname: str, config_content: str, commit_message: str = "Automated config backup") -> bool:
         """
         Writes the device configuration to a file and commits it if there are changes.
         """
         try:
-            repo = self._ensure_repo_ready()
-            
-            # Save configuration to a file named after the device
-            file_path = os.path.join(self.local_path, f"{hostname}.conf")
-            with open(file_path, "w") as f:
-                f.write(config_content)
+            with self._repo_lock():
+                repo = self._ensure_repo_ready()
                 
-            # Add and check for diffs
-            repo.index.add([f"{hostname}.conf"])
-            
-            if not repo.is_dirty():
-                logger.info(f"No configuration changes detected for {hostname}. Skipping commit.")
-                return False
+                # Save configuration to a file named after the device
+                file_path = os.path.join(self.local_path, f"{hostname}.conf")
+                with open(file_path, "w") as f:
+                    f.write(config_content)
+                    
+                # Add and check for diffs
+                repo.index.add([f"{hostname}.conf"])
                 
-            # Commit and push
-            repo.index.commit(commit_message)
-            repo.remotes.origin.push()
-            logger.info(f"Successfully backed up configuration for {hostname}")
-            return True
+                if not repo.is_dirty():
+                    logger.info(f"No configuration changes detected for {hostname}. Skipping commit.")
+                    self._push_pending(repo)
+                    return False
+                    
+                # Commit and push
+                repo.index.commit(commit_message)
+                self._push_pending(repo)
+                logger.info(f"Successfully backed up configuration for {hostname}")
+                return True
             
         except Exception as e:
             logger.error(f"Error during git commit operation for {hostname}: {str(e)}")
             return False
 
-    def get_commit_history(self, hostname: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def commit_device_configs(self, configs: Dict[str, str], commit_message: str = "Automated config backup",
+                              chunk_size: int = None) -> Dict[str, Optional[str]]:
         """
-        Retrieves the commit history for a specific device configuration file.
+        Writes many device configurations in one pass: a single pull, commits of at most `chunk_size`
+        changed files each, and a single push at the end. Files whose content is already on disk are
+        not touched. Returns the commit hash per changed hostname and None for unchanged ones.
+        Commits left unpushed by an earlier failed push go out with this push, even if nothing changed;
+        a failing push raises GitPushError.
         """
-        try:
+        chunk_size = chunk_size or settings.GIT_COMMIT_CHUNK_SIZE
+        outcome: Dict[str, Optional[str]] = dict.fromkeys(configs)
+        with self._repo_lock():
             repo = self._ensure_repo_ready()
+
+            changed = []
+            for hostname, config_content in configs.items():
+                file_path = os.path.join(self.local_path, f"{hostname}.conf")
+                if os.path.exists(file_path):
+                    with open(file_path) as f:
+                        if f.read() == config_content:
+                            continue
+                with open(file_path, "w") as f:
+                    f.write(config_content)
+                changed.append(hostname)
+
+            for start in range(0, len(changed), chunk_size):
+                chunk = changed[start:start + chunk_size]
+                repo.index.add([f"{hostname}.conf" for hostname in chunk])
+                message = commit_message if len(chunk) == 1 else f"{commit_message} ({len(chunk)} devices)"
+                commit = repo.index.commit(f"{message}\n\n" + "\n".join(chunk))
+                for hostname in chunk:
+                    outcome[hostname] = commit.hexsha
+
+            try:
+                pushed = self._push_pending(repo)
+            except Exception as e:
+                raise GitPushError(f"Committed locally but the push failed: {str(e)}", outcome) from e
+            logger.info(f"Tenant {self.tenant_id} backup: {len(changed)}/{len(configs)} configs changed, "
+                        f"{-(-len(changed) // chunk_size)} commits, {1 if pushed else 0} push")
+        return outcome
+
+    def get_commit_history(self, hostname: str, limit: int = 10, until: Optional[datetime] = None,
+                           before_commit: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieves the commit history for a specific device configuration file,
+        optionally only commits made up to `until` and/or older than `before_commit`.
+        """
+        try:
             filename = f"{hostname}.conf"
-            
-            commits = list(repo.iter_commits(paths=filename, max_count=limit))
-            history = []
-            
-            for commit in commits:
-                history.append({
-                    "commit_hash": commit.hexsha,
-                    "author": commit.author.name,
-                    "date": commit.committed_datetime.isoformat(),
-                    "message": commit.message.strip()
-                })
-                
+            options = {"until": until.isoformat()} if until else {}
+            rev = f"{before_commit}^" if before_commit else None
+            with self._reading() as repo:
+                commits = list(repo.iter_commits(rev, paths=filename, max_count=limit, **options))
+                history = []
+
+                for commit in commits:
+                    history.append({
+                        "commit_hash": commit.hexsha,
+                        "author": commit.author.name,
+                        "date": commit.committed_datetime.isoformat(),
+                        "message": commit.message.strip()
+                    })
+
             return history
         except Exception as e:
             logger.error(f"Failed to get git history for {hostname}: {str(e)}")
@@ -103,11 +313,11 @@ class GitManager:
         Retrieves the exact content of the configuration file at a specific Git commit hash.
         """
         try:
-            repo = self._ensure_repo_ready()
             filename = f"{hostname}.conf"
-            commit = repo.commit(commit_hash)
-            target_file = commit.tree / filename
-            return target_file.data_stream.read().decode('utf-8')
+            with self._reading() as repo:
+                commit = repo.commit(commit_hash)
+                target_file = commit.tree / filename
+                return target_file.data_stream.read().decode('utf-8')
         except Exception as e:
             logger.error(f"Failed to read file content at commit {commit_hash}: {str(e)}")
             return ""
@@ -0,0 +1,220 @@
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import httpx
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Histogram of per-phase durations, aggregated in Redis so every worker process feeds one series
+# and the API can expose it to Prometheus without multiprocess client plumbing.
+PHASE_HISTOGRAM_KEY = "metrics:ssh_phase_duration_seconds"
+BYTES_COUNTER_KEY = "metrics:ssh_bytes_total"
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_operation: contextvars.ContextVar[Optional["OperationTimer"]] = contextvars.ContextVar("current_operation", default=None)
+
+# device_id -> (site_id, tenant_id, expires_at), so tagging costs one query per device per worker
+_device_tags_cache: Dict[int, Tuple[Optional[int], Optional[int], float]] = {}
+_DEVICE_TAGS_TTL = 300.0
+
+def _device_tags(device_id: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+    if device_id is None:
+        return None, None
+    cached = _device_tags_cache.get(device_id)
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
+
+    from app.core.database import SessionLocal
+    from app.models.device import Device
+    from app.models.site import Site
+    db = SessionLocal()
+    try:
+        row = db.query(Device.site_id, Site.tenant_id).join(Site, Device.site_id == Site.id).filter(Device.id == device_id).first()
+    except Exception as e:
+        logger.debug(f"Could not resolve metric tags for device {device_id}: {str(e)}")
+        row = None
+    finally:
+        db.close()
+    site_id, tenant_id = row if row else (None, None)
+    _device_tags_cache[device_id] = (site_id, tenant_id, time.monotonic() + _DEVICE_TAGS_TTL)
+    return site_id, tenant_id
+
+class OperationTimer:
+    """
+    Records per-phase durations and bytes transferred for one device operation.
+
+    Phases are timed with `phase(name)`; code deeper in the stack (e.g. the connection factory)
+    reaches the active timer through `current_operation()`. On exit the measurements are added to
+    the Redis-backed histograms and, when INFLUXDB_URL is set, written as line protocol.
+    """
+    def __init__(self, operation: str, vendor: str, device_id: int = None, site_id: int = None, tenant_id: int = None):
+        self.operation = operation
+        self.vendor = vendor
+        self.device_id = device_id
+        self.site_id = site_id
+        self.tenant_id = tenant_id
+        self.phases: List[Tuple[str, float]] = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.failed = False
+        self._token = None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_phase(name, time.perf_counter() - start)
+
+    def _add_phase(self, name: str, duration: float):
+        # A phase entered more than once (e.g. site then device slot wait) is reported as one
+        for i, (existing, total) in enumerate(self.phases):
+            if existing == name:
+                self.phases[i] = (name, total + duration)
+                return
+        self.phases.append((name, duration))
+
+    def add_bytes(self, sent: int = 0, received: int = 0):
+        self.bytes_sent += sent
+        self.bytes_received += received
+
+    def __enter__(self):
+        self._token = _current_operation.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_operation.reset(self._token)
+        self.failed = exc_type is not None
+        try:
+            self._export()
+        except Exception as e:
+            logger.warning(f"Failed to export SSH timing metrics: {str(e)}")
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _current_operation.reset(self._token)
+        self.failed = exc_type is not None
+        # The tag lookup, Redis pipeline and InfluxDB write all block; keep them off the event loop
+        try:
+            await asyncio.to_thread(self._export)
+        except Exception as e:
+            logger.warning(f"Failed to export SSH timing metrics: {str(e)}")
+        return False
+
+    def _tags(self) -> Dict[str, str]:
+        if self.site_id is None or self.tenant_id is None:
+            site_id, tenant_id = _device_tags(self.device_id)
+            self.site_id = site_id if self.site_id is None else self.site_id
+            self.tenant_id = tenant_id if self.tenant_id is None else self.tenant_id
+        return {
+            "operation": self.operation,
+            "vendor": self.vendor,
+            "site": str(self.site_id if self.site_id is not None else "unknown"),
+            "tenant": str(self.tenant_id if self.tenant_id is not None else "unknown"),
+        }
+
+    def _export(self):
+        tags = self._tags()
+        labels = ",".join(f'{k}="{v}"' for k, v in tags.items())
+
+        pipe = redis_client.pipeline(transaction=False)
+        for name, duration in self.phases:
+            series = f'{labels},phase="{name}"'
+            for bound in PHASE_BUCKETS:
+                if duration <= bound:
+                    pipe.hincrby(PHASE_HISTOGRAM_KEY, f"{series}|{bound}", 1)
+            pipe.hincrby(PHASE_HISTOGRAM_KEY, f"{series}|+Inf", 1)
+            pipe.hincrbyfloat(PHASE_HISTOGRAM_KEY, f"{series}|sum", duration)
+        pipe.hincrby(BYTES_COUNTER_KEY, f'{labels},direction="sent"', self.bytes_sent)
+        pipe.hincrby(BYTES_COUNTER_KEY, f'{labels},direction="received"', self.bytes_received)
+        pipe.execute()
+
+        if settings.INFLUXDB_URL:
+            self._write_influx(tags)
+
+    def _write_influx(self, tags: Dict[str, str]):
+        tag_str = ",".join(f"{k}={_escape_tag(v)}" for k, v in tags.items())
+        now_ns = time.time_ns()
+        lines = [f"ssh_phase,{tag_str},phase={_escape_tag(name)} duration={duration:.6f} {now_ns}" for name, duration in self.phases]
+        lines.append(
+            f"ssh_operation,{tag_str} total={sum(d for _, d in self.phases):.6f},bytes_sent={self.bytes_sent}i,"
+            f"bytes_received={self.bytes_received}i,failed={str(self.failed).lower()} {now_ns}"
+        )
+        httpx.post(
+            f"{settings.INFLUXDB_URL}/write",
+            params={"db": settings.INFLUXDB_DB, "u": settings.INFLUXDB_USER, "p": settings.INFLUXDB_PASSWORD},
+            content="\n".join(lines),
+            timeout=2.0,
+        )
+
+def _escape_tag(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+def current_operation() -> Optional[OperationTimer]:
+    return _current_operation.get()
+
+@contextmanager
+def timed_phase(name: str):
+    """Times a phase against the active operation, or does nothing outside of one."""
+    timer = current_operation()
+    if timer is None:
+        yield
+        return
+    with timer.phase(name):
+        yield
+
+def record_phase(name: str, duration: float):
+    """Adds an already measured duration to a phase of the active operation, if any."""
+    timer = current_operation()
+    if timer is not None:
+        timer._add_phase(name, duration)
+
+def add_bytes(sent: int = 0, received: int = 0):
+    timer = current_operation()
+    if timer is not None:
+        timer.add_bytes(sent=sent, received=received)
+
+def render_prometheus() -> str:
+    """
+    Renders the Redis-aggregated histograms and counters in Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP ssh_phase_duration_seconds Duration of each phase of a device SSH operation.",
+        "# TYPE ssh_phase_duration_seconds histogram",
+    ]
+    histogram = redis_client.hgetall(PHASE_HISTOGRAM_KEY)
+    for field in sorted(histogram, key=_histogram_sort_key):
+        series, suffix = field.rsplit("|", 1)
+        value = histogram[field]
+        if suffix == "sum":
+            lines.append(f"ssh_phase_duration_seconds_sum{{{series}}} {value}")
+        else:
+            lines.append(f'ssh_phase_duration_seconds_bucket{{{series},le="{suffix}"}} {value}')
+            if suffix == "+Inf":
+                lines.append(f"ssh_phase_duration_seconds_count{{{series}}} {value}")
+
+    lines += [
+        "# HELP ssh_bytes_total Bytes exchanged with devices during SSH operations.",
+        "# TYPE ssh_bytes_total counter",
+    ]
+    for series, value in sorted(redis_client.hgetall(BYTES_COUNTER_KEY).items()):
+        lines.append(f"ssh_bytes_total{{{series}}} {value}")
+    return "\n".join(lines) + "\n"
+
+def _histogram_sort_key(field: str):
+    # Buckets in ascending order, then +Inf (which also emits _count), then _sum
+    series, suffix = field.rsplit("|", 1)
+    if suffix == "sum":
+        return series, 2, 0.0
+    if suffix == "+Inf":
+        return series, 1, 0.0
+    return series, 0, float(suffix)
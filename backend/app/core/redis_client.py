@@ -0,0 +1,6 @@
+import redis
+from app.core.config import settings
+
+# Shared Redis client for application-level state (streams, caches, locks).
+# Connections are opened lazily from redis-py's internal pool, so importing this is cheap.
+redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from typing import Any, Optional
+import zstandard
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BLOB_MARKER = "$blob"
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(settings.RESULT_BLOB_DIR, digest[:2], f"{digest}.json.zst")
+
+def put_blob(data: bytes) -> dict:
+    """
+    Writes a zstd-compressed payload to the content-addressed blob store and returns its reference.
+    Identical payloads (e.g. unchanged configs) share one file.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = _blob_path(digest)
+    if os.path.exists(path):
+        # Touch so pruning measures age from the last reference, not the first write
+        os.utime(path)
+        compressed_size = os.path.getsize(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zstandard.ZstdCompressor(level=settings.RESULT_BLOB_ZSTD_LEVEL).compress(data)
+        # Write-then-rename so a concurrent reader never sees a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        compressed_size = len(compressed)
+    return {BLOB_MARKER: digest, "sha256": digest, "size": len(data), "compressed_size": compressed_size}
+
+def get_blob(digest: str) -> Optional[Any]:
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        data = zstandard.ZstdDecompressor().decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        logger.error(f"Result blob {digest} failed its digest check")
+        return None
+    return json.loads(data)
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and BLOB_MARKER in value
+
+def offload_large_fields(result: Any) -> Any:
+    """
+    Replaces every top-level field of a task result whose JSON encoding exceeds
+    RESULT_OFFLOAD_THRESHOLD bytes with a blob reference, so Redis only holds small metadata.
+    """
+    if not isinstance(result, dict):
+        return result
+    offloaded = {}
+    for field, value in result.items():
+        if isinstance(value, (str, list, dict)) and not is_blob_ref(value):
+            encoded = json.dumps(value).encode()
+            if len(encoded) >= settings.RESULT_OFFLOAD_THRESHOLD:
+                try:
+                    value = put_blob(encoded)
+                except OSError as e:
+                    logger.error(f"Failed to offload result field '{field}', keeping it inline: {str(e)}")
+        offloaded[field] = value
+    return offloaded
+
+def resolve_blob_refs(result: Any) -> Any:
+    """
+    Loads offloaded fields back into a task result. Missing (pruned) blobs resolve to None.
+    """
+    if not isinstance(result, dict):
+        return result
+    return {field: get_blob(value[BLOB_MARKER]) if is_blob_ref(value) else value for field, value in result.items()}
+
+def prune_blobs(max_age: float = None) -> int:
+    """
+    Deletes blobs not written or referenced within `max_age` seconds (defaults to RESULT_EXPIRES,
+    matching the lifetime of the task results that point at them).
+    """
+    max_age = settings.RESULT_EXPIRES if max_age is None else max_age
+    cutoff = time.time() - max_age
+    removed = 0
+    if not os.path.isdir(settings.RESULT_BLOB_DIR):
+        return 0
+    for root, _, files in os.walk(settings.RESULT_BLOB_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
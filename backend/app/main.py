@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.database import Base, engine
 
 from app.api.router import api_router
+from app.core.metrics import render_prometheus
 
 # Create database tables (For dev only. In prod use Alembic)
 Base.metadata.create_all(bind=engine)
@@ -21,4 +23,11 @@ app.add_middleware(
 def read_root():
     return {"message": "Welcome to Network Dashboard API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint for SSH phase timing histograms aggregated across all workers.
+    """
+    return render_prometheus()
+
 app.include_router(api_router, prefix="/api/v1")
@@ -4,3 +4,5 @@ from app.models.credential import CredentialProfile
 from app.models.device import Device
 from app.models.user import User
 from app.models.audit_log import AuditLog
+from app.models.deploy_result import DeployHostResult
+from app.models.config_backup import ConfigBackup
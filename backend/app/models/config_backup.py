@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class ConfigBackup(Base):
+    """
+    One collected configuration backup. Git keeps the content; this index answers "which backups
+    does this device have" and "what changed across the fleet" without walking the repository.
+    """
+    __tablename__ = "config_backups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+
+    commit_sha = Column(String(40), nullable=True) # commit holding this content; None if the tenant has no Git repo
+    content_sha256 = Column(String(64), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    changed = Column(Boolean, nullable=False)
+    lines_added = Column(Integer, nullable=False, default=0)
+    lines_removed = Column(Integer, nullable=False, default=0)
+
+    collected_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Per-device history, newest first, paged by id
+        Index("ix_config_backups_device_id_id", "device_id", "id"),
+        # Fleet-wide "changed since" queries per tenant, newest first, paged by (collected_at, id)
+        Index("ix_config_backups_tenant_id_changed_collected_at_id", "tenant_id", "changed", "collected_at", "id"),
+    )
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class DeployHostResult(Base):
+    """
+    Outcome of one host in a Nornir run (bulk deploy job or mitigation push), written as soon as
+    that host finishes so results are queryable while slower hosts are still running.
+    """
+    __tablename__ = "deploy_host_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String, nullable=False) # deploy job ID or mitigation task ID
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True, index=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="SET NULL"), nullable=True)
+    hostname = Column(String, nullable=False)
+
+    operation = Column(String, nullable=False) # e.g., 'deploy_config', 'mitigation'
+    status = Column(String, nullable=False) # 'success', 'fail'
+    result = Column(Text, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+
+    finished_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_deploy_host_results_run_id_id", "run_id", "id"),
+    )
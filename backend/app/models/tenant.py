@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Boolean
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -13,6 +13,13 @@ class Tenant(Base):
     git_repo_url = Column(String, nullable=True)
     git_branch = Column(String, default="main")
     git_token = Column(String, nullable=True)
+
+    # Scheduled Backups: every `backup_interval_hours`, spread across a window starting at `backup_window_start_hour` (UTC)
+    backup_enabled = Column(Boolean, nullable=False, default=True)
+    backup_interval_hours = Column(Integer, nullable=False, default=24)
+    backup_window_start_hour = Column(Integer, nullable=False, default=0)
+    backup_window_hours = Column(Integer, nullable=False, default=4)
+    backup_max_concurrency = Column(Integer, nullable=False, default=20)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional
+import asyncssh
+from app.core.config import settings
+from app.core.metrics import OperationTimer
+from app.network.device_limiter import device_slot_async
+
+logger = logging.getLogger(__name__)
+
+# Netmiko device types whose SSH servers run commands on exec channels. IOS, Huawei VRP and
+# similar boxes only take commands in an interactive shell and stay on the Celery engine.
+EXEC_CHANNEL_VENDORS = ("juniper", "arista_eos", "cisco_xr", "cisco_nxos", "linux")
+
+def supports_exec(vendor: Optional[str]) -> bool:
+    return (vendor or "").lower().startswith(EXEC_CHANNEL_VENDORS)
+
+class AsyncSSHEngine:
+    """
+    Asyncio execution engine for large-fleet fan-out.
+
+    A single worker process drives thousands of concurrent device sessions on one event loop
+    instead of holding a process (Celery prefork) or thread (Nornir) per device. Concurrency is
+    bounded by a semaphore so the worker never exceeds `max_concurrency` open sessions, and every
+    session holds the device's (and its site's) fleet-wide slot like the synchronous tasks do.
+
+    Commands run over SSH exec channels multiplexed on one authenticated connection per device,
+    so no prompt detection or paging setup is needed; only vendors in EXEC_CHANNEL_VENDORS are
+    accepted. Slot bookkeeping and metric export run in the default executor so Redis and HTTP
+    round trips never stall the loop. Results use the same shape as the synchronous
+    `execute_commands` task.
+    """
+    def __init__(self, max_concurrency: int = None, connect_timeout: float = None, command_timeout: float = None):
+        self.max_concurrency = max_concurrency or settings.ASYNC_SSH_MAX_CONCURRENCY
+        self.connect_timeout = connect_timeout or settings.ASYNC_SSH_CONNECT_TIMEOUT
+        self.command_timeout = command_timeout or settings.ASYNC_SSH_COMMAND_TIMEOUT
+
+    async def run_device(self, target: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        host = target["host"]
+        commands = target["commands"]
+        outputs = {}
+        if not supports_exec(target.get("vendor")):
+            return {"status": "error", "message": f"{target.get('vendor')} does not support SSH exec channels", "outputs": outputs}
+        async with semaphore:
+            try:
+                async with OperationTimer("execute_commands_fleet", vendor=target["vendor"], device_id=target.get("device_id"),
+                                          site_id=target.get("site_id"), tenant_id=target.get("tenant_id")) as timer:
+                    async with AsyncExitStack() as stack:
+                        with timer.phase("slot_wait"):
+                            await stack.enter_async_context(device_slot_async(host, site_id=target.get("site_id")))
+                        with timer.phase("connect"):
+                            conn = await stack.enter_async_context(asyncssh.connect(
+                                host,
+                                port=int(target.get("port", 22)),
+                                username=target["username"],
+                                password=target["password"],
+                                known_hosts=None,
+                                connect_timeout=self.connect_timeout,
+                            ))
+                        with timer.phase("command"):
+                            for command in commands:
+                                result = await asyncio.wait_for(conn.run(command, check=False), timeout=self.command_timeout)
+                                outputs[command] = result.stdout or ""
+                                timer.add_bytes(sent=len(command), received=len(outputs[command]))
+                return {"status": "success", "outputs": outputs}
+            except Exception as e:
+                logger.error(f"Async execution failed on {host} after {len(outputs)}/{len(commands)} commands: {str(e)}")
+                return {"status": "error", "message": str(e) or type(e).__name__, "outputs": outputs}
+
+    async def run_fleet(self, targets: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Runs every target concurrently (bounded) and returns the results keyed by target id.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        keys = [str(target.get("device_id", target["host"])) for target in targets]
+        results = await asyncio.gather(*(self.run_device(target, semaphore) for target in targets))
+        return dict(zip(keys, results))
+
+def execute_fleet(targets: List[Dict[str, Any]], max_concurrency: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Synchronous entrypoint used by Celery tasks to drive the async engine on a fresh event loop.
+    """
+    engine = AsyncSSHEngine(max_concurrency=max_concurrency)
+    return asyncio.run(engine.run_fleet(targets))
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
+from app.models.config_backup import ConfigBackup
+
+logger = logging.getLogger(__name__)
+
+# device_id -> "<content sha256> <commit sha>" of the device's last indexed backup
+DIGESTS_KEY = "backup_digests"
+
+# Index rows are listed in the same shape as Git history entries; every backup is automated
+BACKUP_AUTHOR = "NMS Bot"
+
+def content_digest(config_content: str) -> str:
+    return hashlib.sha256(config_content.encode()).hexdigest()
+
+def latest_backups(db: Session, device_ids: List[int]) -> Dict[int, ConfigBackup]:
+    """The most recent backup row of each given device, in one query."""
+    if not device_ids:
+        return {}
+    latest_ids = db.query(func.max(ConfigBackup.id)).filter(
+        ConfigBackup.device_id.in_(device_ids)
+    ).group_by(ConfigBackup.device_id)
+    return {row.device_id: row for row in db.query(ConfigBackup).filter(ConfigBackup.id.in_(latest_ids))}
+
+def record_backups(db: Session, tenant_id: int, entries: List[Dict[str, Any]]) -> List[ConfigBackup]:
+    """
+    Indexes a set of collected configs. Each entry has device_id and config_content, plus
+    commit_sha, changed, lines_added and lines_removed when Git produced them. Unchanged configs
+    keep pointing at the commit that holds their content; without a changed flag the content
+    digest is compared against the device's previous backup.
+    """
+    previous = latest_backups(db, [entry["device_id"] for entry in entries])
+    rows = []
+    for entry in entries:
+        digest = content_digest(entry["config_content"])
+        last = previous.get(entry["device_id"])
+        changed = entry.get("changed")
+        if changed is None:
+            changed = last is None or last.content_sha256 != digest
+        commit_sha = entry.get("commit_sha") or (last.commit_sha if last and not changed else None)
+        rows.append(ConfigBackup(
+            device_id=entry["device_id"], tenant_id=tenant_id, commit_sha=commit_sha,
+            content_sha256=digest, size_bytes=len(entry["config_content"].encode()), changed=changed,
+            lines_added=entry.get("lines_added", 0), lines_removed=entry.get("lines_removed", 0)
+        ))
+    db.add_all(rows)
+    db.commit()
+    remember_digests(rows)
+    return rows
+
+def remember_digests(rows: List[ConfigBackup]):
+    try:
+        redis_client.hset(DIGESTS_KEY, mapping={row.device_id: f"{row.content_sha256} {row.commit_sha or ''}" for row in rows})
+    except Exception as e:
+        logger.warning(f"Failed to cache backup digests: {str(e)}")
+
+def previous_backup(device_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Digest and commit of the device's last indexed backup: from Redis, else from the index table
+    (which then re-warms Redis).
+    """
+    try:
+        cached = redis_client.hget(DIGESTS_KEY, device_id)
+    except Exception as e:
+        logger.debug(f"Backup digest lookup failed for device {device_id}: {str(e)}")
+        cached = None
+    if cached:
+        digest, _, commit_sha = cached.partition(" ")
+        return {"content_sha256": digest, "commit_sha": commit_sha or None}
+
+    db = SessionLocal()
+    try:
+        row = latest_backups(db, [device_id]).get(device_id)
+    finally:
+        db.close()
+    if row is None:
+        return None
+    remember_digests([row])
+    return {"content_sha256": row.content_sha256, "commit_sha": row.commit_sha}
+
+def find_unchanged(device_id: int, config_content: str, versioned: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    The previous backup when this config is identical to it, so the caller can skip staging,
+    file writes and Git entirely; None when the config is new or changed. For a tenant with a Git
+    repository the previous backup must also have a commit: content indexed before the repository
+    was configured, or whose commit failed, still has to reach Git.
+    """
+    if device_id is None:
+        return None
+    previous = previous_backup(device_id)
+    if not previous or previous["content_sha256"] != content_digest(config_content):
+        return None
+    if versioned and not previous["commit_sha"]:
+        return None
+    return previous
+
+def _row_message(row: ConfigBackup) -> str:
+    if not row.changed:
+        return "No change since last backup"
+    return "Automated config backup" if row.commit_sha else "Configuration changed (not versioned)"
+
+def _row_to_dict(row: ConfigBackup) -> Dict[str, Any]:
+    collected_at = row.collected_at.isoformat() if row.collected_at else None
+    return {
+        "id": row.id,
+        "device_id": row.device_id,
+        "commit_hash": row.commit_sha,
+        "author": BACKUP_AUTHOR,
+        "date": collected_at,
+        "message": _row_message(row),
+        "content_sha256": row.content_sha256,
+        "size_bytes": row.size_bytes,
+        "changed": row.changed,
+        "lines_added": row.lines_added,
+        "lines_removed": row.lines_removed,
+        "collected_at": collected_at,
+    }
+
+def _page(query, before_id: Optional[int], limit: int, by_collected_at: bool = False) -> Dict[str, Any]:
+    """
+    Keyset page, newest first. Pass next_before_id back as before_id for the next page.
+    Ordered by id, or by (collected_at, id) for listings served by the collected_at index.
+    """
+    if not by_collected_at:
+        if before_id is not None:
+            query = query.filter(ConfigBackup.id < before_id)
+        rows = query.order_by(ConfigBackup.id.desc()).limit(limit + 1).all()
+    else:
+        if before_id is not None:
+            cursor = query.session.query(ConfigBackup.collected_at).filter(ConfigBackup.id == before_id).scalar()
+            if cursor is None:
+                return {"items": [], "next_before_id": None}
+            query = query.filter(tuple_(ConfigBackup.collected_at, ConfigBackup.id) < tuple_(cursor, before_id))
+        rows = query.order_by(ConfigBackup.collected_at.desc(), ConfigBackup.id.desc()).limit(limit + 1).all()
+    items = [_row_to_dict(row) for row in rows[:limit]]
+    return {"items": items, "next_before_id": items[-1]["id"] if len(rows) > limit else None}
+
+def list_device_backups(db: Session, device_id: int, before_id: int = None, limit: int = 50,
+                        changed_only: bool = False) -> Dict[str, Any]:
+    query = db.query(ConfigBackup).filter(ConfigBackup.device_id == device_id)
+    if changed_only:
+        query = query.filter(ConfigBackup.changed.is_(True))
+    return _page(query, before_id, limit)
+
+def oldest_backup(db: Session, device_id: int) -> Optional[ConfigBackup]:
+    """The device's first indexed backup; Git commits before it predate the index."""
+    return db.query(ConfigBackup).filter(ConfigBackup.device_id == device_id).order_by(ConfigBackup.id.asc()).first()
+
+def list_changed_backups(db: Session, tenant_id: int, since: datetime, before_id: int = None, limit: int = 100) -> Dict[str, Any]:
+    """Backups of a tenant's devices whose config changed since a point in time."""
+    query = db.query(ConfigBackup).filter(
+        ConfigBackup.tenant_id == tenant_id, ConfigBackup.changed.is_(True), ConfigBackup.collected_at >= since
+    )
+    return _page(query, before_id, limit, by_collected_at=True)
@@ -0,0 +1,254 @@
+import json
+import time
+import uuid
+import logging
+from typing import Any, Dict, List, Optional
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
+from app.core.git_manager import GitManager, GitPushError
+from app.core.result_store import put_blob, get_blob
+from app.models.tenant import Tenant
+from app.network.backup_index import record_backups
+
+logger = logging.getLogger(__name__)
+
+OPEN_RUNS_KEY = "backup_runs:open"
+
+# Stages a config unless a committer has already claimed the run.
+# KEYS: run hash, staged hash. ARGV: device id, staged entry, ttl
+_STAGE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'committer') == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+return 1
+"""
+
+# Claims the run for one committer and drains what was staged, in one step, so the last device and
+# the stale-run sweeper can never both commit it. Returns nil when already claimed.
+# KEYS: run hash, staged hash. ARGV: committer id
+_CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('HSETNX', KEYS[1], 'committer', ARGV[1]) == 0 then
+    return false
+end
+redis.call('HSET', KEYS[1], 'status', 'committing')
+local staged = redis.call('HGETALL', KEYS[2])
+redis.call('DEL', KEYS[2])
+return staged
+"""
+
+# Counts a device as reported only the first time it reports, so a redelivered task (acks_late)
+# cannot settle the run before every device has. Returns the devices still outstanding, or -1
+# for a repeat report.
+# KEYS: run hash, done set. ARGV: device id, ttl
+_DONE_SCRIPT = """
+if redis.call('SADD', KEYS[2], ARGV[1]) == 0 then
+    return -1
+end
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[2]))
+return redis.call('HINCRBY', KEYS[1], 'remaining', -1)
+"""
+
+_stage = redis_client.register_script(_STAGE_SCRIPT)
+_claim = redis_client.register_script(_CLAIM_SCRIPT)
+_done = redis_client.register_script(_DONE_SCRIPT)
+
+def _run_key(run_id: str) -> str:
+    return f"backup_run:{run_id}"
+
+def _staged_key(run_id: str) -> str:
+    return f"backup_run:{run_id}:staged"
+
+def _results_key(run_id: str) -> str:
+    return f"backup_run:{run_id}:results"
+
+def _done_key(run_id: str) -> str:
+    return f"backup_run:{run_id}:done"
+
+def start_backup_run(tenant_id: int, device_ids: List[int], run_id: str = None) -> str:
+    """
+    Opens a backup run for a set of a tenant's devices. Each device's backup stages its config
+    into the run; the last one to report hands the run to commit_backup_run. Callers that claim
+    the devices first (see mark_backup_inflight) pass the run ID they claimed them under.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    meta = {
+        "run_id": run_id,
+        "tenant_id": tenant_id,
+        "total": len(device_ids),
+        "remaining": len(device_ids),
+        "status": "collecting",
+        "created_at": time.time(),
+        "committed_at": "",
+        "commits": 0,
+        "error": "",
+    }
+    pipe = redis_client.pipeline()
+    pipe.hset(_run_key(run_id), mapping=meta)
+    pipe.expire(_run_key(run_id), settings.RESULT_EXPIRES)
+    pipe.zadd(OPEN_RUNS_KEY, {run_id: meta["created_at"]})
+    pipe.execute()
+    return run_id
+
+def _device_done(run_id: str, device_id: int):
+    remaining = _done(keys=[_run_key(run_id), _done_key(run_id)], args=[device_id, settings.RESULT_EXPIRES])
+    if remaining == 0:
+        commit_backup_run.apply_async(kwargs=dict(run_id=run_id))
+
+def stage_config(run_id: str, device_id: int, hostname: str, config_content: str):
+    """
+    Parks a collected config in the shared blob store (the task result offload already put the
+    same bytes there) and records it against the run; no Git work happens on the device path.
+    A config arriving after the run was committed (e.g. flushed as stale) goes into a follow-up run.
+    """
+    ref = put_blob(json.dumps(config_content).encode())
+    entry = json.dumps({"hostname": hostname, "blob": ref["sha256"]})
+    if not _stage(keys=[_run_key(run_id), _staged_key(run_id)], args=[device_id, entry, settings.RESULT_EXPIRES]):
+        tenant_id = redis_client.hget(_run_key(run_id), "tenant_id")
+        if tenant_id is None:
+            raise RuntimeError(f"Backup run {run_id} has expired")
+        follow_up = start_backup_run(int(tenant_id), [device_id])
+        logger.info(f"Backup run {run_id} already committed; {hostname} goes into follow-up run {follow_up}")
+        pipe = redis_client.pipeline()
+        pipe.hset(_results_key(run_id), device_id, json.dumps({"hostname": hostname, "status": "late", "follow_up_run": follow_up}))
+        pipe.expire(_results_key(run_id), settings.RESULT_EXPIRES)
+        pipe.execute()
+        stage_config(follow_up, device_id, hostname, config_content)
+        return
+    _device_done(run_id, device_id)
+
+def record_unchanged(run_id: str, device_id: int, hostname: str, commit_sha: Optional[str]):
+    """Settles a device whose config matched its last backup; nothing is staged for the committer."""
+    pipe = redis_client.pipeline()
+    pipe.hset(_results_key(run_id), device_id, json.dumps({"hostname": hostname, "status": "unchanged", "commit": commit_sha}))
+    pipe.expire(_results_key(run_id), settings.RESULT_EXPIRES)
+    pipe.execute()
+    _device_done(run_id, device_id)
+
+def record_failure(run_id: str, device_id: int, hostname: str, message: str):
+    pipe = redis_client.pipeline()
+    pipe.hset(_results_key(run_id), device_id, json.dumps({"hostname": hostname, "status": "failed", "message": message}))
+    pipe.expire(_results_key(run_id), settings.RESULT_EXPIRES)
+    pipe.execute()
+    _device_done(run_id, device_id)
+
+@celery_app.task(bind=True, name="app.network.backup_runs.commit_backup_run")
+def commit_backup_run(self, run_id: str):
+    """
+    Per-tenant committer: writes every staged config of the run through one pull, chunked
+    commits and one push, then records changed/unchanged per device.
+    """
+    drained = _claim(keys=[_run_key(run_id), _staged_key(run_id)], args=[self.request.id or uuid.uuid4().hex])
+    if drained is None:
+        return {"status": "skipped", "run_id": run_id}
+    tenant_id = int(redis_client.hget(_run_key(run_id), "tenant_id"))
+
+    staged = {int(drained[i]): json.loads(drained[i + 1]) for i in range(0, len(drained), 2)}
+    configs, results, hostnames = {}, {}, {}
+    for device_id, entry in staged.items():
+        content = get_blob(entry["blob"])
+        if content is None:
+            results[device_id] = {"hostname": entry["hostname"], "status": "failed", "message": "Staged config expired"}
+            continue
+        configs[entry["hostname"]] = content
+        hostnames[device_id] = entry["hostname"]
+
+    db = SessionLocal()
+    try:
+        tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    finally:
+        db.close()
+
+    status, error, commits = "completed", "", 0
+    index_entries = []
+    if not configs:
+        pass
+    elif not tenant or not tenant.git_repo_url:
+        for device_id, hostname in hostnames.items():
+            results[device_id] = {"hostname": hostname, "status": "not_versioned"}
+            index_entries.append({"device_id": device_id, "config_content": configs[hostname]})
+    else:
+        git_manager = GitManager(tenant_id=tenant_id, repo_url=tenant.git_repo_url, branch=tenant.git_branch, token=tenant.git_token)
+        try:
+            try:
+                outcome = git_manager.commit_device_configs(configs, commit_message="Automated config backup")
+            except GitPushError as e:
+                # The commits stay in the working copy and go out with the tenant's next push
+                logger.error(f"Backup run {run_id}: push for tenant {tenant_id} failed: {str(e)}")
+                status, error, outcome = "push_failed", str(e), e.outcome
+            shas = {sha for sha in outcome.values() if sha}
+            commits = len(shas)
+            line_stats = git_manager.line_stats(shas)
+            for device_id, hostname in hostnames.items():
+                sha = outcome.get(hostname)
+                results[device_id] = {"hostname": hostname, "status": "changed" if sha else "unchanged", "commit": sha}
+                delta = line_stats.get(sha, {}).get(hostname, {})
+                index_entries.append({
+                    "device_id": device_id, "config_content": configs[hostname], "commit_sha": sha, "changed": bool(sha),
+                    "lines_added": delta.get("added", 0), "lines_removed": delta.get("removed", 0)
+                })
+        except Exception as e:
+            logger.error(f"Backup run {run_id}: Git commit for tenant {tenant_id} failed: {str(e)}")
+            status, error = "failed", str(e)
+            for device_id, hostname in hostnames.items():
+                results[device_id] = {"hostname": hostname, "status": "failed", "message": f"Git commit failed: {str(e)}"}
+
+    if index_entries:
+        db = SessionLocal()
+        try:
+            record_backups(db, tenant_id, index_entries)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Backup run {run_id}: failed to index backups of tenant {tenant_id}: {str(e)}")
+        finally:
+            db.close()
+
+    pipe = redis_client.pipeline()
+    if results:
+        pipe.hset(_results_key(run_id), mapping={device_id: json.dumps(result) for device_id, result in results.items()})
+        pipe.expire(_results_key(run_id), settings.RESULT_EXPIRES)
+    pipe.hset(_run_key(run_id), mapping={"status": status, "committed_at": time.time(), "commits": commits, "error": error})
+    pipe.zrem(OPEN_RUNS_KEY, run_id)
+    pipe.execute()
+    logger.info(f"Backup run {run_id}: {len(configs)} configs of tenant {tenant_id} in {commits} commits ({status})")
+    return {"status": status, "run_id": run_id, "configs": len(configs), "commits": commits}
+
+@celery_app.task(name="app.network.backup_runs.flush_stale_backup_runs")
+def flush_stale_backup_runs():
+    """
+    Beat entrypoint. Commits whatever runs have staged once they are older than a device backup
+    may take (a worker died, or a device task was lost), so staged configs are never stranded.
+    """
+    cutoff = time.time() - settings.BACKUP_INFLIGHT_TTL
+    flushed = []
+    for run_id in redis_client.zrangebyscore(OPEN_RUNS_KEY, "-inf", cutoff):
+        # A committer that races with this one finds the run already claimed and skips it
+        if redis_client.exists(_run_key(run_id)) and not redis_client.hexists(_run_key(run_id), "committer"):
+            commit_backup_run.apply_async(kwargs=dict(run_id=run_id))
+            flushed.append(run_id)
+        else:
+            redis_client.zrem(OPEN_RUNS_KEY, run_id)
+    return {"flushed": flushed}
+
+def get_backup_run(run_id: str) -> Optional[Dict[str, Any]]:
+    meta = redis_client.hgetall(_run_key(run_id))
+    if not meta:
+        return None
+    devices = {int(device_id): json.loads(raw) for device_id, raw in redis_client.hgetall(_results_key(run_id)).items()}
+    counts = {"changed": 0, "unchanged": 0, "not_versioned": 0, "failed": 0, "late": 0}
+    for result in devices.values():
+        counts[result["status"]] += 1
+    return {
+        "run_id": run_id,
+        "tenant_id": int(meta["tenant_id"]),
+        "status": meta["status"],
+        "total": int(meta["total"]),
+        "staged": redis_client.hlen(_staged_key(run_id)),
+        **counts,
+        "commits": int(meta["commits"]),
+        "error": meta["error"] or None,
+        "devices": [{"device_id": device_id, **result} for device_id, result in sorted(devices.items())],
+    }
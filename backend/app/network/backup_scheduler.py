@@ -0,0 +1,114 @@
+import time
+import uuid
+import random
+import hashlib
+import logging
+from sqlalchemy.orm import Session
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
+from app.models.tenant import Tenant
+from app.models.site import Site
+from app.models.device import Device
+from app.models.credential import CredentialProfile
+from app.network.tasks import backup_config
+from app.network.device_limiter import mark_backup_inflight
+from app.network.backup_runs import start_backup_run
+
+logger = logging.getLogger(__name__)
+
+LAST_TICK_KEY = "backup_scheduler:last_tick"
+
+def slot_offset(device_id: int, window_seconds: int) -> int:
+    """
+    Consistent-hash position of a device inside its backup window. A device keeps the same slot
+    every cycle, and slots spread evenly no matter how device IDs are allocated.
+    """
+    digest = hashlib.sha1(f"backup-slot:{device_id}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % max(window_seconds, 1)
+
+def current_window(tenant: Tenant, now: float):
+    """
+    Returns (window_start, window_end) epoch seconds for the tenant's current backup cycle.
+    Cycles are aligned to backup_window_start_hour UTC and repeat every backup_interval_hours.
+    """
+    interval = max(tenant.backup_interval_hours or 24, 1) * 3600
+    offset = (tenant.backup_window_start_hour or 0) * 3600
+    window = min(max(tenant.backup_window_hours or 1, 1) * 3600, interval)
+    cycle_start = (now - offset) // interval * interval + offset
+    return cycle_start, cycle_start + window
+
+def schedule_tenant(db: Session, tenant: Tenant, tick_start: float, tick_end: float) -> dict:
+    """
+    Dispatches backups for every active device whose slot falls in [tick_start, tick_end),
+    each with an ETA at its slot plus jitter. The tick's devices form one backup run, committed
+    to the tenant's repository together once the last of them reports.
+    """
+    # A tick can straddle a cycle boundary, so check the windows of both ends
+    windows = [
+        (start, end) for start, end in {current_window(tenant, tick_start), current_window(tenant, tick_end)}
+        if tick_start < end and start < tick_end
+    ]
+    if not windows:
+        return {"dispatched": 0, "skipped_inflight": 0, "backup_run_id": None}
+
+    rows = db.query(Device, CredentialProfile).join(
+        CredentialProfile, Device.credential_id == CredentialProfile.id
+    ).join(Site, Device.site_id == Site.id).filter(
+        Site.tenant_id == tenant.id, Device.status == "active"
+    ).all()
+
+    run_id = uuid.uuid4().hex
+    due = []
+    skipped = 0
+    for device, credential in rows:
+        slots = [start + slot_offset(device.id, int(end - start)) for start, end in windows]
+        slot = next((slot for slot in slots if tick_start <= slot < tick_end), None)
+        if slot is None:
+            continue
+        if not mark_backup_inflight(device.id, run_id):
+            skipped += 1
+            continue
+        due.append((device, credential, slot))
+    if not due:
+        return {"dispatched": 0, "skipped_inflight": skipped, "backup_run_id": None}
+
+    start_backup_run(tenant.id, [device.id for device, _, _ in due], run_id=run_id)
+    for device, credential, slot in due:
+        eta = slot + random.uniform(0, settings.BACKUP_JITTER_SECONDS)
+        backup_config.apply_async(
+            kwargs=dict(
+                host=device.ip_address, vendor=device.vendor, username=credential.username,
+                password=credential.encrypted_password, tenant_id=tenant.id, device_id=device.id, site_id=device.site_id,
+                tenant_concurrency=tenant.backup_max_concurrency, backup_run_id=run_id
+            ),
+            countdown=max(eta - time.time(), 0)
+        )
+    return {"dispatched": len(due), "skipped_inflight": skipped, "backup_run_id": run_id}
+
+@celery_app.task(name="app.network.backup_scheduler.schedule_fleet_backups")
+def schedule_fleet_backups():
+    """
+    Beat entrypoint. Each run covers the time since the previous run (tracked in Redis), so
+    slots are neither skipped nor dispatched twice if beat is late or restarted.
+    """
+    now = time.time()
+    tick_end = now + settings.BACKUP_SCHEDULER_TICK
+    last_end = redis_client.get(LAST_TICK_KEY)
+    # After downtime longer than a tick, missed slots simply wait for the next cycle
+    tick_start = float(last_end) if last_end and float(last_end) > now - settings.BACKUP_SCHEDULER_TICK else now
+    redis_client.set(LAST_TICK_KEY, tick_end)
+
+    db = SessionLocal()
+    summary = {}
+    try:
+        tenants = db.query(Tenant).filter(Tenant.backup_enabled.is_(True)).all()
+        for tenant in tenants:
+            result = schedule_tenant(db, tenant, tick_start, tick_end)
+            if result["dispatched"] or result["skipped_inflight"]:
+                summary[tenant.id] = result
+                logger.info(f"Backup scheduler: tenant {tenant.id} {result}")
+    finally:
+        db.close()
+    return {"tick_start": tick_start, "tick_end": tick_end, "tenants": summary}
@@ -0,0 +1,205 @@
+import json
+import time
+import uuid
+import logging
+from typing import Any, Dict, List, Optional
+from celery import chord, group
+from sqlalchemy.orm import Session
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.core.result_store import resolve_blob_refs
+from app.models.device import Device
+from app.models.site import Site
+from app.models.credential import CredentialProfile
+from app.network.tasks import backup_config, execute_commands, fetch_interfaces
+from app.network.task_events import get_task_metas
+from app.network.backup_runs import start_backup_run
+from app.network.device_limiter import mark_backup_inflight
+
+logger = logging.getLogger(__name__)
+
+BULK_ACTIONS = ("backup", "execute", "interfaces")
+
+def _job_key(job_id: str) -> str:
+    return f"bulk_job:{job_id}"
+
+def _job_tasks_key(job_id: str) -> str:
+    return f"bulk_job:{job_id}:tasks"
+
+def select_devices(db: Session, tenant_id: int = None, site_id: int = None, vendor: str = None,
+                   device_ids: List[int] = None, include_inactive: bool = False):
+    """
+    Resolves a device selector to (device, credential, tenant_id) rows in a single query.
+    Devices without a credential profile (e.g. SNMP-only) cannot be reached over SSH and are skipped.
+    """
+    query = db.query(Device, CredentialProfile, Site.tenant_id).join(
+        CredentialProfile, Device.credential_id == CredentialProfile.id
+    ).join(Site, Device.site_id == Site.id)
+
+    if tenant_id is not None:
+        query = query.filter(Site.tenant_id == tenant_id)
+    if site_id is not None:
+        query = query.filter(Device.site_id == site_id)
+    if vendor:
+        query = query.filter(Device.vendor.ilike(f"%{vendor}%"))
+    if device_ids:
+        query = query.filter(Device.id.in_(device_ids))
+    if not include_inactive:
+        query = query.filter(Device.status == "active")
+    return query.order_by(Device.id).all()
+
+def _signature(action: str, device: Device, credential: CredentialProfile, tenant_id: int, commands: Optional[List[str]],
+               backup_run_id: str = None):
+    params = dict(
+        host=device.ip_address, vendor=device.vendor, username=credential.username,
+        password=credential.encrypted_password, device_id=device.id, site_id=device.site_id
+    )
+    if action == "backup":
+        return backup_config.s(tenant_id=tenant_id, backup_run_id=backup_run_id, **params)
+    if action == "execute":
+        return execute_commands.s(commands=commands, **params)
+    return fetch_interfaces.s(**params)
+
+def create_bulk_job(db: Session, action: str, commands: Optional[List[str]] = None, **selector) -> Dict[str, Any]:
+    """
+    Fans one action out over every selected device as a Celery chord and records the job in Redis.
+    """
+    rows = select_devices(db, **selector)
+    job_id = uuid.uuid4().hex
+    if not rows:
+        return {"job_id": None, "total": 0}
+
+    # Backups are committed per tenant, once every device of the tenant has reported. Devices whose
+    # scheduled (or another bulk) backup is still queued or running are left to that backup.
+    backup_runs = {}
+    skipped_inflight = []
+    if action == "backup":
+        run_ids: Dict[int, str] = {}
+        by_tenant: Dict[int, List[int]] = {}
+        claimed = []
+        for row in rows:
+            device, _, tenant_id = row
+            run_id = run_ids.setdefault(tenant_id, uuid.uuid4().hex)
+            if not mark_backup_inflight(device.id, run_id):
+                skipped_inflight.append(device.id)
+                continue
+            by_tenant.setdefault(tenant_id, []).append(device.id)
+            claimed.append(row)
+        rows = claimed
+        if not rows:
+            return {"job_id": None, "total": 0, "skipped_inflight": skipped_inflight}
+        backup_runs = {
+            tenant_id: start_backup_run(tenant_id, device_ids, run_id=run_ids[tenant_id])
+            for tenant_id, device_ids in by_tenant.items()
+        }
+
+    signatures = []
+    task_ids = {}
+    for device, credential, tenant_id in rows:
+        sig = _signature(action, device, credential, tenant_id, commands, backup_runs.get(tenant_id))
+        # Freeze to pre-assign task ids so the job index exists before any worker picks a task up
+        task_ids[str(device.id)] = sig.freeze().id
+        signatures.append(sig)
+
+    meta = {
+        "job_id": job_id,
+        "action": action,
+        "selector": json.dumps(selector),
+        "backup_runs": json.dumps(backup_runs),
+        "total": len(signatures),
+        "created_at": time.time(),
+        "finished_at": "",
+    }
+    pipe = redis_client.pipeline()
+    pipe.hset(_job_key(job_id), mapping=meta)
+    pipe.hset(_job_tasks_key(job_id), mapping=task_ids)
+    pipe.expire(_job_key(job_id), settings.RESULT_EXPIRES)
+    pipe.expire(_job_tasks_key(job_id), settings.RESULT_EXPIRES)
+    pipe.execute()
+
+    chord(group(signatures))(finish_bulk_job.si(job_id))
+    logger.info(f"Bulk job {job_id}: {action} dispatched to {len(signatures)} devices")
+    return {"job_id": job_id, "total": len(signatures), "backup_runs": backup_runs, "skipped_inflight": skipped_inflight}
+
+@celery_app.task(name="app.network.bulk_jobs.finish_bulk_job")
+def finish_bulk_job(job_id: str):
+    redis_client.hset(_job_key(job_id), "finished_at", time.time())
+    return {"job_id": job_id}
+
+def _classify(meta: Optional[Dict[str, Any]]) -> str:
+    if meta is None or meta.get("status") == "PENDING":
+        return "queued"
+    status = meta.get("status")
+    if status in ("STARTED", "RETRY"):
+        return "running"
+    if status == "SUCCESS":
+        result = meta.get("result")
+        return "failed" if isinstance(result, dict) and result.get("status") == "error" else "succeeded"
+    return "failed"
+
+def get_job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    meta = redis_client.hgetall(_job_key(job_id))
+    if not meta:
+        return None
+    task_ids = redis_client.hvals(_job_tasks_key(job_id))
+
+    counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+    for state in get_task_metas(task_ids):
+        counts[_classify(state)] += 1
+
+    total = int(meta["total"])
+    done = counts["succeeded"] + counts["failed"]
+    created_at = float(meta["created_at"])
+    finished_at = float(meta["finished_at"]) if meta.get("finished_at") else None
+    elapsed = (finished_at or time.time()) - created_at
+
+    eta = None
+    if done and done < total:
+        eta = round(elapsed / done * (total - done), 1)
+
+    return {
+        "job_id": job_id,
+        "action": meta["action"],
+        "selector": json.loads(meta["selector"]),
+        "backup_runs": json.loads(meta.get("backup_runs") or "{}"),
+        "total": total,
+        **counts,
+        "progress": round(done / total, 4) if total else 1.0,
+        "status": "completed" if finished_at or done == total else "running",
+        "elapsed_seconds": round(elapsed, 1),
+        "eta_seconds": eta,
+    }
+
+def get_job_results(job_id: str, offset: int = 0, limit: int = 100, state: str = None, resolve: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Paginated per-device results, ordered by device id. Optionally filtered to one state.
+    """
+    if not redis_client.exists(_job_key(job_id)):
+        return None
+    task_ids = redis_client.hgetall(_job_tasks_key(job_id))
+    device_ids = sorted(task_ids, key=int)
+
+    total = len(device_ids)
+    if not state:
+        # Without a state filter only the requested page needs to be looked up
+        device_ids = device_ids[offset:offset + limit]
+
+    entries = []
+    metas = get_task_metas([task_ids[d] for d in device_ids])
+    for device_id, meta in zip(device_ids, metas):
+        device_state = _classify(meta)
+        if state and device_state != state:
+            continue
+        result = meta.get("result") if meta and device_state in ("succeeded", "failed") else None
+        entries.append({
+            "device_id": int(device_id),
+            "task_id": task_ids[device_id],
+            "state": device_state,
+            "result": resolve_blob_refs(result) if resolve else result,
+        })
+
+    if state:
+        total = len(entries)
+        entries = entries[offset:offset + limit]
+    return {"job_id": job_id, "total": total, "offset": offset, "limit": limit, "items": entries}
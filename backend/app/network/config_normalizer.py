@@ -0,0 +1,125 @@
+import io
+import re
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lines that change on every pull without the configuration changing. Keys are matched against the
+# Netmiko device type (e.g. "cisco_ios" matches "cisco"); "*" applies to every vendor.
+# "drop" removes matching lines, "replace" rewrites the matched part of a line.
+DEFAULT_RULES: Dict[str, Dict[str, list]] = {
+    "*": {
+        "drop": [],
+        "replace": [],
+    },
+    "cisco": {
+        "drop": [
+            r"Building configuration\.\.\.\s*$",
+            r"Current configuration\s*:\s*\d+ bytes",
+            r"! Last configuration change at ",
+            r"! NVRAM config last updated at ",
+            r"! No configuration change since last restart",
+            r"!! Last configuration change at ",
+            r"!Time: ",
+            r"!Running configuration last done at: ",
+            r"ntp clock-period \d+",
+            r"Cryptochecksum:[0-9a-f]+",
+            # IOS XR prefixes show output with the device clock, e.g. "Mon Jan  1 10:00:00.123 UTC"
+            r"(Mon|Tue|Wed|Thu|Fri|Sat|Sun) \w{3} +\d+ \d\d:\d\d:\d\d(\.\d+)? \S+\s*$",
+        ],
+        "replace": [],
+    },
+    "junos": {
+        "drop": [
+            r"## Last commit: ",
+            r"## Last changed: ",
+        ],
+        "replace": [],
+    },
+    "huawei": {
+        "drop": [
+            r"!Last configuration was (updated|saved) at ",
+            r"!Time: ",
+        ],
+        "replace": [],
+    },
+    "arista": {
+        "drop": [
+            r"! Time: ",
+        ],
+        "replace": [],
+    },
+    "mikrotik": {
+        "drop": [
+            r"# \S+ \d\d:\d\d:\d\d by RouterOS ",
+        ],
+        "replace": [],
+    },
+}
+
+# Vendors whose device types do not contain the rule key
+VENDOR_ALIASES = {"juniper": "junos"}
+
+def _load_rules() -> Dict[str, Dict[str, list]]:
+    """Default rules extended by CONFIG_NORMALIZATION_RULES_FILE (same shape, JSON), if set."""
+    rules = {vendor: {"drop": list(rule["drop"]), "replace": list(rule["replace"])} for vendor, rule in DEFAULT_RULES.items()}
+    if settings.CONFIG_NORMALIZATION_RULES_FILE:
+        try:
+            with open(settings.CONFIG_NORMALIZATION_RULES_FILE) as f:
+                custom = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring config normalization rules file: {str(e)}")
+            custom = {}
+        for vendor, rule in custom.items():
+            target = rules.setdefault(vendor, {"drop": [], "replace": []})
+            target["drop"].extend(rule.get("drop", []))
+            target["replace"].extend(rule.get("replace", []))
+    return rules
+
+@lru_cache(maxsize=None)
+def _rule_keys(vendor: str) -> Tuple[str, ...]:
+    vendor = (vendor or "").lower()
+    rules = _load_rules()
+    keys = [key for key in rules if key != "*" and key in vendor]
+    keys += [target for alias, target in VENDOR_ALIASES.items() if alias in vendor and target not in keys]
+    return ("*", *keys)
+
+@lru_cache(maxsize=None)
+def compiled_rules(vendor: str):
+    """
+    The vendor's rules compiled once per process: all drop patterns as one anchored alternation,
+    and the (pattern, replacement) pairs in order.
+    """
+    rules = _load_rules()
+    drops: List[str] = []
+    replaces: List[Tuple[re.Pattern, str]] = []
+    for key in _rule_keys(vendor):
+        rule = rules.get(key, {})
+        drops.extend(rule.get("drop", []))
+        replaces.extend((re.compile(pattern), replacement) for pattern, replacement in rule.get("replace", []))
+    drop = re.compile("|".join(f"(?:{pattern})" for pattern in drops)) if drops else None
+    return drop, replaces
+
+def iter_normalized(lines: Iterable[str], vendor: str) -> Iterator[str]:
+    """
+    Normalizes a configuration line by line: line endings and trailing whitespace are stripped,
+    volatile lines dropped and volatile fragments rewritten. Works on any line iterator, so a
+    config never has to be split into a list first.
+    """
+    drop, replaces = compiled_rules(vendor)
+    for line in lines:
+        line = line.rstrip()
+        if drop is not None and drop.match(line.lstrip()):
+            continue
+        for pattern, replacement in replaces:
+            line = pattern.sub(replacement, line)
+        yield line
+
+def normalize_config(config_content: str, vendor: str) -> str:
+    """The configuration as it is hashed and committed: real changes kept, per-pull churn removed."""
+    normalized = "\n".join(iter_normalized(io.StringIO(config_content), vendor))
+    return f"{normalized}\n" if normalized else ""
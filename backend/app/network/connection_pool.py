@@ -0,0 +1,400 @@
+import os
+import time
+import socket
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import paramiko
+from netmiko import BaseConnection, ConnectHandler
+from app.core.config import settings
+from app.core.metrics import record_phase, timed_phase
+from app.network.device_limiter import SlotTimeout, device_semaphore
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, int, str, str]
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection slot frees up for a host within the acquire timeout."""
+
+
+# Netmiko internals timed_connect drives the connection through. They are stable across the
+# pinned netmiko release (see requirements.txt); should one go missing, connections fall back to
+# a plain ConnectHandler timed as a single phase.
+_NETMIKO_HOOKS = ("_modify_connection_params", "_connect_params_dict", "_try_session_preparation")
+_PHASE_TIMING = (
+    all(hasattr(BaseConnection, hook) for hook in _NETMIKO_HOOKS)
+    and "transport_factory" in inspect.signature(paramiko.SSHClient.connect).parameters
+)
+
+
+class _TimedTransport(paramiko.Transport):
+    """Paramiko transport that adds the time spent in key exchange and authentication to `spent`."""
+
+    def __init__(self, *args, spent: Dict[str, float], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spent = spent
+
+    def _timed(self, phase: str, method: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._spent[phase] += time.perf_counter() - start
+
+    def start_client(self, *args, **kwargs):
+        return self._timed("ssh_kex", super().start_client, *args, **kwargs)
+
+    def auth_none(self, *args, **kwargs):
+        return self._timed("ssh_auth", super().auth_none, *args, **kwargs)
+
+    def auth_password(self, *args, **kwargs):
+        return self._timed("ssh_auth", super().auth_password, *args, **kwargs)
+
+    def auth_publickey(self, *args, **kwargs):
+        return self._timed("ssh_auth", super().auth_publickey, *args, **kwargs)
+
+    def auth_interactive(self, *args, **kwargs):
+        return self._timed("ssh_auth", super().auth_interactive, *args, **kwargs)
+
+
+def _timed_method(method: Callable, spent: Dict[str, float], phase: str) -> Callable:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            spent[phase] += time.perf_counter() - start
+    return wrapper
+
+
+def timed_connect(**device) -> Any:
+    """
+    ConnectHandler equivalent that times each step of bringing up a session against the active
+    operation: TCP connect, SSH key exchange, authentication, shell channel setup, prompt
+    detection (channel read + base prompt) and terminal setup (width + paging).
+    """
+    if device["device_type"].endswith("_telnet") or not _PHASE_TIMING:
+        with timed_phase("connect"):
+            return ConnectHandler(**device)
+
+    with timed_phase("tcp_connect"):
+        sock = socket.create_connection((device["host"], int(device.get("port", 22))), timeout=device.get("conn_timeout", 10))
+    try:
+        net_connect = ConnectHandler(**device, sock=sock, auto_connect=False)
+        spent = {"ssh_kex": 0.0, "ssh_auth": 0.0, "terminal_setup": 0.0}
+        connect_params = net_connect._connect_params_dict
+        net_connect._connect_params_dict = lambda: {
+            **connect_params(), "transport_factory": lambda *args, **kwargs: _TimedTransport(*args, spent=spent, **kwargs)
+        }
+        # Vendor drivers override session_preparation but all call these two for terminal setup
+        net_connect.set_terminal_width = _timed_method(net_connect.set_terminal_width, spent, "terminal_setup")
+        net_connect.disable_paging = _timed_method(net_connect.disable_paging, spent, "terminal_setup")
+
+        start = time.perf_counter()
+        net_connect._modify_connection_params()
+        net_connect.establish_connection()
+        established = time.perf_counter()
+        record_phase("ssh_kex", spent["ssh_kex"])
+        record_phase("ssh_auth", spent["ssh_auth"])
+        record_phase("channel_open", max(established - start - spent["ssh_kex"] - spent["ssh_auth"], 0.0))
+
+        net_connect._try_session_preparation()
+        record_phase("prompt_detection", max(time.perf_counter() - established - spent["terminal_setup"], 0.0))
+        record_phase("terminal_setup", spent["terminal_setup"])
+        return net_connect
+    except Exception:
+        sock.close()
+        raise
+
+class _PooledConnection:
+    def __init__(self, key: PoolKey, connection: Any, slot: Any = None):
+        self.key = key
+        self.connection = connection
+        # Fleet-wide device slot the session holds for as long as it is open, idle or not
+        self.slot = slot
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Worker-local pool of persistent Netmiko SSH sessions.
+
+    Sessions are keyed by (host, port, device_type, username) so back-to-back tasks against
+    the same device reuse an authenticated channel instead of paying the TCP + SSH handshake,
+    login and prompt detection again. At most `max_per_host` sessions are open to one host,
+    whatever port or user they log in with. Idle sessions expire after `idle_timeout` seconds,
+    are liveness-checked before reuse and the least recently used one is evicted once more than
+    `max_idle` sessions are parked.
+
+    With a `slot` factory (see device_limiter.device_semaphore) every session holds a fleet-wide
+    device slot from connect to disconnect, so parked sessions count against the device's
+    concurrency limit. A parked session is closed, freeing its slot, as soon as another worker
+    queues for that slot.
+    """
+    # How often idle sessions are checked for expiry and for other workers waiting on their slot
+    REAP_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        max_per_host: int = 2,
+        max_idle: int = 64,
+        idle_timeout: float = 120.0,
+        acquire_timeout: float = 30.0,
+        connect: Callable[..., Any] = timed_connect,
+        slot: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ):
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect
+        self._slot = slot
+        # Idle sessions ordered from least to most recently used, one entry per parked session
+        self._idle: "OrderedDict[int, _PooledConnection]" = OrderedDict()
+        # Checked-out sessions by id(connection), so release() finds the slot they hold
+        self._checked_out: Dict[int, _PooledConnection] = {}
+        # Open sessions (idle + checked out) per host, used to enforce max_per_host
+        self._open: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._reaper_pid = None
+
+    @staticmethod
+    def make_key(device: Dict[str, Any]) -> PoolKey:
+        return (device["host"], int(device.get("port", 22)), device["device_type"], device["username"])
+
+    def _take_idle(self, key: PoolKey) -> Optional[_PooledConnection]:
+        for entry_id, pooled in reversed(self._idle.items()):
+            if pooled.key == key:
+                del self._idle[entry_id]
+                return pooled
+        return None
+
+    def _has_idle(self, key: PoolKey) -> bool:
+        with self._cond:
+            return any(pooled.key == key for pooled in self._idle.values())
+
+    def _forget(self, key: PoolKey):
+        """Frees the host slot of a session that is being closed. Caller must hold the lock."""
+        host = key[0]
+        self._open[host] -= 1
+        if self._open[host] <= 0:
+            del self._open[host]
+        self._cond.notify_all()
+
+    @staticmethod
+    def _disconnect(closing: List[_PooledConnection]):
+        """Logs out of sessions already forgotten by the pool and frees their device slots; called without the lock held."""
+        for pooled in closing:
+            try:
+                pooled.connection.disconnect()
+            except Exception as e:
+                logger.debug(f"Ignoring error while closing pooled session to {pooled.key[0]}: {str(e)}")
+            if pooled.slot is not None:
+                try:
+                    pooled.slot.release()
+                except Exception as e:
+                    logger.warning(f"Failed to release the device slot of {pooled.key[0]}: {str(e)}")
+
+    def _reap_expired(self) -> List[_PooledConnection]:
+        now = time.monotonic()
+        closing = []
+        for entry_id, pooled in list(self._idle.items()):
+            if now - pooled.last_used > self.idle_timeout:
+                del self._idle[entry_id]
+                self._forget(pooled.key)
+                closing.append(pooled)
+        return closing
+
+    def _evict(self, host: str = None) -> List[_PooledConnection]:
+        """Evicts the least recently used idle session (of `host`, if given)."""
+        for entry_id, pooled in self._idle.items():
+            if host is None or pooled.key[0] == host:
+                del self._idle[entry_id]
+                logger.debug(f"Evicting least recently used session to {pooled.key[0]}")
+                self._forget(pooled.key)
+                return [pooled]
+        return []
+
+    def _reap(self):
+        """Background loop closing expired idle sessions and parked ones whose slot another worker waits for."""
+        while True:
+            time.sleep(self.REAP_INTERVAL)
+            with self._cond:
+                closing = self._reap_expired()
+                parked = [(entry_id, pooled) for entry_id, pooled in self._idle.items() if pooled.slot is not None]
+            self._disconnect(closing)
+
+            wanted = []
+            for entry_id, pooled in parked:
+                try:
+                    if pooled.slot.has_waiters():
+                        wanted.append(entry_id)
+                except Exception as e:
+                    logger.debug(f"Slot waiter check failed for {pooled.key[0]}: {str(e)}")
+            closing = []
+            with self._cond:
+                for entry_id in wanted:
+                    pooled = self._idle.pop(entry_id, None)
+                    if pooled is not None:
+                        logger.debug(f"Closing idle session to {pooled.key[0]}; another worker is waiting for its slot")
+                        self._forget(pooled.key)
+                        closing.append(pooled)
+            self._disconnect(closing)
+
+    def _start_reaper(self):
+        """Starts the reaper once per process (threads do not survive a fork). Caller must hold the lock."""
+        if self._reaper_pid != os.getpid():
+            self._reaper_pid = os.getpid()
+            threading.Thread(target=self._reap, name="ssh-pool-reaper", daemon=True).start()
+
+    def _revive(self, pooled: _PooledConnection) -> bool:
+        """Whether an idle session can be handed out again: its slot is still held and it is alive."""
+        if pooled.slot is not None and not pooled.slot.resume():
+            logger.info(f"Discarding pooled session to {pooled.key[0]}; its device slot lapsed")
+            return False
+        try:
+            alive = pooled.connection.is_alive()
+        except Exception:
+            alive = False
+        if not alive:
+            logger.info(f"Discarding dead pooled session to {pooled.key[0]}")
+        return alive
+
+    def acquire(self, device: Dict[str, Any]) -> Any:
+        """
+        Returns a live session for the device, reusing an idle one when possible.
+        """
+        key = self.make_key(device)
+        host = key[0]
+        deadline = time.monotonic() + self.acquire_timeout
+
+        while True:
+            closing = []
+            with self._cond:
+                while True:
+                    closing += self._reap_expired()
+                    pooled = self._take_idle(key)
+                    if pooled is not None:
+                        break
+                    if self._open.get(host, 0) < self.max_per_host:
+                        self._open[host] = self._open.get(host, 0) + 1
+                        break
+                    # Host is at its limit; an idle session for another user/port may be blocking us
+                    evicted = self._evict(host)
+                    if evicted:
+                        closing += evicted
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._disconnect(closing)
+                        raise PoolExhausted(f"No SSH session slot available for {host} after {self.acquire_timeout}s")
+                    self._cond.wait(timeout=remaining)
+            self._disconnect(closing)
+
+            if pooled is not None:
+                # Probed outside the lock so a slow device does not hold up checkouts for every other host
+                if self._revive(pooled):
+                    with self._cond:
+                        self._checked_out[id(pooled.connection)] = pooled
+                    return pooled.connection
+                with self._cond:
+                    self._forget(key)
+                self._disconnect([pooled])
+                continue
+
+            slot = self._slot(device) if self._slot else None
+            if slot is not None:
+                # Another task of this worker may park a session (and its slot) while we queue
+                with timed_phase("slot_wait"):
+                    acquired = slot.acquire(give_up=lambda: self._has_idle(key))
+                if not acquired:
+                    with self._cond:
+                        self._forget(key)
+                    if self._has_idle(key):
+                        continue
+                    raise SlotTimeout(f"Timed out after {slot.timeout}s waiting for a '{slot.name}' slot")
+            break
+
+        # Connect outside the lock so a slow handshake doesn't block other hosts
+        try:
+            connection = self._connect(**device)
+        except Exception:
+            with self._cond:
+                self._forget(key)
+            if slot is not None:
+                slot.release()
+            raise
+        with self._cond:
+            self._checked_out[id(connection)] = _PooledConnection(key, connection, slot)
+        return connection
+
+    def release(self, device: Dict[str, Any], connection: Any, discard: bool = False):
+        """
+        Hands a session back to the pool, or closes it when `discard` is set (e.g. after an error).
+        """
+        key = self.make_key(device)
+        with self._cond:
+            pooled = self._checked_out.pop(id(connection), None)
+        pooled = pooled or _PooledConnection(key, connection)
+        if not discard and pooled.slot is not None:
+            # Parked before it becomes visible to other tasks; the reaper closes it before the lease lapses
+            try:
+                discard = not pooled.slot.park(self.idle_timeout + 10 * self.REAP_INTERVAL)
+            except Exception as e:
+                logger.warning(f"Failed to park the device slot of {key[0]}: {str(e)}")
+                discard = True
+
+        with self._cond:
+            if discard:
+                self._forget(key)
+                closing = [pooled]
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle[id(pooled)] = pooled
+                closing = []
+                while len(self._idle) > self.max_idle:
+                    closing += self._evict()
+                self._start_reaper()
+                self._cond.notify_all()
+        self._disconnect(closing)
+
+    @contextmanager
+    def connection(self, device: Dict[str, Any], keep: bool = True):
+        """
+        Context manager drop-in for `with ConnectHandler(**device) as conn:`.
+        The session is returned to the pool on success (closed instead when `keep` is false)
+        and discarded if the block raises.
+        """
+        conn = self.acquire(device)
+        try:
+            yield conn
+        except BaseException:
+            self.release(device, conn, discard=True)
+            raise
+        else:
+            self.release(device, conn, discard=not keep)
+
+    def close_all(self):
+        with self._cond:
+            closing = []
+            while self._idle:
+                closing += self._evict()
+        self._disconnect(closing)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"open": sum(self._open.values()), "idle": len(self._idle)}
+
+
+connection_pool = ConnectionPool(
+    max_per_host=settings.SSH_POOL_MAX_PER_HOST,
+    max_idle=settings.SSH_POOL_MAX_IDLE,
+    idle_timeout=settings.SSH_POOL_IDLE_TIMEOUT,
+    acquire_timeout=settings.SSH_POOL_ACQUIRE_TIMEOUT,
+    slot=device_semaphore,
+)
@@ -0,0 +1,71 @@
+import json
+import uuid
+import hashlib
+import logging
+from typing import Any, Dict, Tuple
+from celery import states
+from celery.result import AsyncResult
+from celery.signals import task_postrun
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "dedup:stats"
+
+def idempotency_key(task_name: str, kwargs: Dict[str, Any]) -> str:
+    digest = hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+    return f"dedup:{task_name}:{digest}"
+
+def dispatch_deduplicated(task, **kwargs) -> Tuple[str, bool]:
+    """
+    Dispatches `task` with `kwargs` unless an identical task is already queued or running,
+    in which case the existing task ID is returned instead. Returns (task_id, deduplicated).
+    """
+    key = idempotency_key(task.name, kwargs)
+    task_id = uuid.uuid4().hex
+    try:
+        if not redis_client.set(key, task_id, nx=True, ex=settings.DEDUP_TTL):
+            existing = redis_client.get(key)
+            if existing and AsyncResult(existing, app=celery_app).state not in states.READY_STATES:
+                redis_client.hincrby(STATS_KEY, "hits", 1)
+                return existing, True
+            # The previous task finished without its key being cleared; take over the key
+            redis_client.set(key, task_id, ex=settings.DEDUP_TTL)
+    except Exception as e:
+        logger.warning(f"Dedup lookup failed, dispatching without coalescing: {str(e)}")
+
+    try:
+        task.apply_async(kwargs=kwargs, task_id=task_id)
+    except Exception:
+        # Nothing was queued under the key; leaving it would coalesce requests onto a task that never runs
+        try:
+            if redis_client.get(key) == task_id:
+                redis_client.delete(key)
+        except Exception as e:
+            logger.warning(f"Failed to release idempotency key after dispatch error: {str(e)}")
+        raise
+    redis_client.hincrby(STATS_KEY, "dispatched", 1)
+    return task_id, False
+
+@task_postrun.connect
+def release_idempotency_key(sender=None, task_id=None, kwargs=None, state=None, **extra):
+    """Frees the key once the task finishes so the next identical request runs fresh."""
+    # A task waiting on a retry is still in flight and keeps its key
+    if sender is None or kwargs is None or state not in states.READY_STATES:
+        return
+    key = idempotency_key(sender.name, kwargs)
+    try:
+        if redis_client.get(key) == task_id:
+            redis_client.delete(key)
+    except Exception as e:
+        logger.debug(f"Failed to release idempotency key for {task_id}: {str(e)}")
+
+def get_stats() -> Dict[str, Any]:
+    stats = {name: int(value) for name, value in redis_client.hgetall(STATS_KEY).items()}
+    for name in ("hits", "dispatched"):
+        stats.setdefault(name, 0)
+    requests = stats["hits"] + stats["dispatched"]
+    stats["dedup_ratio"] = round(stats["hits"] / requests, 4) if requests else 0.0
+    return stats
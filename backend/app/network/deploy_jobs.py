@@ -0,0 +1,180 @@
+import json
+import time
+import uuid
+import logging
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
+from app.network.bulk_jobs import select_devices
+from app.network.nornir_tasks import deploy_config_template_nornir
+from app.network.nornir_processors import HostResultProcessor, host_result_record
+from app.network.streaming import TaskOutputStream
+
+logger = logging.getLogger(__name__)
+
+HOST_STATES = ("pending", "running", "succeeded", "failed", "skipped")
+
+def _job_key(job_id: str) -> str:
+    return f"deploy_job:{job_id}"
+
+def _hosts_key(job_id: str) -> str:
+    return f"deploy_job:{job_id}:hosts"
+
+def _set_host(job_id: str, device_id: int, record: Dict[str, Any], stream: TaskOutputStream = None):
+    record = {**record, "device_id": device_id, "updated_at": time.time()}
+    redis_client.hset(_hosts_key(job_id), device_id, json.dumps(record))
+    if stream:
+        stream.record("host", record)
+
+class DeployProgressProcessor:
+    """
+    Nornir processor that records each host's progress as soon as it starts and finishes,
+    so job status and streams advance host by host instead of batch by batch.
+    """
+    def __init__(self, job_id: str, stream: TaskOutputStream = None):
+        self.job_id = job_id
+        self.stream = stream or TaskOutputStream(job_id)
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        _set_host(self.job_id, host.data.get("device_id"), {"hostname": host.name, "ip": host.hostname, "state": "running"}, self.stream)
+
+    def task_instance_completed(self, task, host, result):
+        record = host_result_record(host, result)
+        record["state"] = "failed" if record["failed"] else "succeeded"
+        _set_host(self.job_id, host.data.get("device_id"), record, self.stream)
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        pass
+
+def create_deploy_job(db: Session, template_content: str, tenant_id: int, device_ids: List[int], dry_run: bool = False,
+                      template_vars: Dict[str, Any] = None, host_vars: Dict[int, Dict[str, Any]] = None,
+                      **rollout) -> Dict[str, Any]:
+    """
+    Records a deploy job with a pending entry per target device and hands it to a config worker.
+    An empty device_ids list targets every device of the tenant.
+    """
+    rows = select_devices(db, tenant_id=tenant_id, device_ids=device_ids or None, include_inactive=True)
+    targets = [device.id for device, _, _ in rows]
+    unreachable = sorted(set(device_ids or []) - set(targets))
+    if not targets:
+        return {"job_id": None, "total": 0, "unreachable": unreachable}
+
+    job_id = uuid.uuid4().hex
+    meta = {
+        "job_id": job_id,
+        "tenant_id": tenant_id,
+        "dry_run": int(dry_run),
+        "rollout": json.dumps(rollout),
+        "total": len(targets),
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": "",
+        "finished_at": "",
+        "summary": "",
+    }
+    pending = {device.id: json.dumps({"device_id": device.id, "hostname": device.hostname, "ip": device.ip_address, "state": "pending"})
+               for device, _, _ in rows}
+    pipe = redis_client.pipeline()
+    pipe.hset(_job_key(job_id), mapping=meta)
+    pipe.hset(_hosts_key(job_id), mapping=pending)
+    pipe.expire(_job_key(job_id), settings.RESULT_EXPIRES)
+    pipe.expire(_hosts_key(job_id), settings.RESULT_EXPIRES)
+    pipe.execute()
+
+    run_deploy_job.apply_async(kwargs=dict(
+        job_id=job_id, template_content=template_content, tenant_id=tenant_id,
+        device_ids=targets, dry_run=dry_run, rollout=rollout,
+        template_vars=template_vars or {}, host_vars=host_vars or {}
+    ))
+    logger.info(f"Deploy job {job_id}: {len(targets)} devices of tenant {tenant_id} queued")
+    return {"job_id": job_id, "total": len(targets), "unreachable": unreachable}
+
+@celery_app.task(bind=True, name="app.network.deploy_jobs.run_deploy_job")
+def run_deploy_job(self, job_id: str, template_content: str, tenant_id: int, device_ids: List[int], dry_run: bool, rollout: dict,
+                   template_vars: dict = None, host_vars: dict = None):
+    redis_client.hset(_job_key(job_id), mapping={"status": "running", "started_at": time.time()})
+    stream = TaskOutputStream(job_id)
+    stream.record("job", {"status": "running"})
+    results = HostResultProcessor(job_id, tenant_id, "deploy_config")
+
+    db = SessionLocal()
+    try:
+        outcome = deploy_config_template_nornir(
+            db=db, template_content=template_content, tenant_id=tenant_id, device_ids=device_ids,
+            dry_run=dry_run, processors=[DeployProgressProcessor(job_id, stream), results],
+            template_vars=template_vars, host_vars=host_vars, **rollout
+        )
+    except Exception as e:
+        logger.error(f"Deploy job {job_id} failed: {str(e)}")
+        redis_client.hset(_job_key(job_id), mapping={"status": "failed", "finished_at": time.time(), "summary": json.dumps({"error": str(e)})})
+        stream.end("error", str(e))
+        results.finish("error")
+        return {"status": "error", "job_id": job_id, "message": str(e)}
+    finally:
+        db.close()
+
+    # Hosts a halted rollout never reached, and devices that dropped out of the inventory, stay pending otherwise
+    reached = set()
+    for detail in outcome["details"]:
+        reached.add(detail["device_id"])
+        if detail.get("skipped"):
+            _set_host(job_id, detail["device_id"], {**detail, "state": "skipped"}, stream)
+    for device_id in set(device_ids) - reached:
+        _set_host(job_id, device_id, {"state": "skipped", "result": "Not in inventory"}, stream)
+
+    summary = {"batches": outcome["batches"], "halted": outcome["halted"]}
+    redis_client.hset(_job_key(job_id), mapping={"status": outcome["status"], "finished_at": time.time(), "summary": json.dumps(summary)})
+    stream.end(outcome["status"])
+    results.finish(outcome["status"])
+    return {"status": "success", "job_id": job_id, **summary}
+
+def _host_records(job_id: str) -> List[Dict[str, Any]]:
+    records = [json.loads(raw) for raw in redis_client.hvals(_hosts_key(job_id))]
+    return sorted(records, key=lambda record: record["device_id"])
+
+def get_deploy_job(job_id: str) -> Optional[Dict[str, Any]]:
+    meta = redis_client.hgetall(_job_key(job_id))
+    if not meta:
+        return None
+    counts = dict.fromkeys(HOST_STATES, 0)
+    for record in _host_records(job_id):
+        counts[record["state"]] += 1
+
+    total = int(meta["total"])
+    done = counts["succeeded"] + counts["failed"] + counts["skipped"]
+    finished_at = float(meta["finished_at"]) if meta.get("finished_at") else None
+    return {
+        "job_id": job_id,
+        "tenant_id": int(meta["tenant_id"]),
+        "dry_run": bool(int(meta["dry_run"])),
+        "rollout": json.loads(meta["rollout"]),
+        "status": meta["status"],
+        "total": total,
+        **counts,
+        "progress": round(done / total, 4) if total else 1.0,
+        "elapsed_seconds": round((finished_at or time.time()) - float(meta["created_at"]), 1),
+        **(json.loads(meta["summary"]) if meta.get("summary") else {}),
+    }
+
+def get_deploy_job_hosts(job_id: str, offset: int = 0, limit: int = 100, state: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Paginated per-host progress records, ordered by device id. Optionally filtered to one state.
+    """
+    if not redis_client.exists(_job_key(job_id)):
+        return None
+    records = _host_records(job_id)
+    if state:
+        records = [record for record in records if record["state"] == state]
+    return {"job_id": job_id, "total": len(records), "offset": offset, "limit": limit, "items": records[offset:offset + limit]}
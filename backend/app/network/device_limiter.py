@@ -0,0 +1,290 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager, AsyncExitStack, ExitStack
+from typing import Callable, Optional
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+class SlotTimeout(Exception):
+    """Raised when a concurrency slot could not be acquired within the timeout."""
+
+# Fair (FIFO) counting semaphore.
+# KEYS: holders zset (token -> lease expiry), queue zset (token -> ticket), heartbeat zset (token -> last poll), ticket counter
+# ARGV: token, limit, lease seconds, seconds after which a silent waiter is dropped from the queue
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local token, limit, lease, stale = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+for _, waiter in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now - stale)) do
+    redis.call('ZREM', KEYS[2], waiter)
+    redis.call('ZREM', KEYS[3], waiter)
+end
+
+if not redis.call('ZSCORE', KEYS[2], token) then
+    redis.call('ZADD', KEYS[2], redis.call('INCR', KEYS[4]), token)
+end
+redis.call('ZADD', KEYS[3], now, token)
+
+local acquired = 0
+local free = limit - redis.call('ZCARD', KEYS[1])
+if free > 0 and redis.call('ZRANK', KEYS[2], token) < free then
+    redis.call('ZREM', KEYS[2], token)
+    redis.call('ZREM', KEYS[3], token)
+    redis.call('ZADD', KEYS[1], now + lease, token)
+    acquired = 1
+end
+
+for i = 1, 4 do
+    redis.call('EXPIRE', KEYS[i], math.ceil(lease) * 2)
+end
+return acquired
+"""
+
+# Extends a holder's lease, unless the slot was already lost (lease lapsed, Redis restarted).
+# KEYS: holders zset. ARGV: token, lease seconds
+_RENEW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+if redis.call('TTL', KEYS[1]) < math.ceil(tonumber(ARGV[2])) * 2 then
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) * 2)
+end
+return 1
+"""
+
+# Counts waiters that polled recently; ones that died without dequeuing are ignored.
+# KEYS: heartbeat zset. ARGV: seconds after which a silent waiter is dropped from the queue
+_WAITERS_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+return redis.call('ZCOUNT', KEYS[1], now - tonumber(ARGV[1]), '+inf')
+"""
+
+# Deletes a backup-inflight marker only if it still belongs to the given backup run.
+# KEYS: marker. ARGV: owning run id
+_CLEAR_INFLIGHT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_acquire = redis_client.register_script(_ACQUIRE_SCRIPT)
+_clear_inflight = redis_client.register_script(_CLEAR_INFLIGHT_SCRIPT)
+_renew = redis_client.register_script(_RENEW_SCRIPT)
+_waiters = redis_client.register_script(_WAITERS_SCRIPT)
+
+# Waiters poll at most every 0.5s; one silent for this long has given up or died
+_WAITER_STALE_AFTER = 5.0
+
+class _LeaseKeeper:
+    """
+    Renews the lease of every slot this process holds, a third of a lease at a time, so an
+    operation that outlives DEVICE_LOCK_LEASE keeps its slot. A process that dies stops renewing
+    and its slots lapse as before.
+    """
+    def __init__(self):
+        self._held = set()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add(self, semaphore: "DistributedSemaphore"):
+        with self._lock:
+            self._held.add(semaphore)
+            # Threads do not survive a fork; each prefork child starts its own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="slot-lease-keeper", daemon=True).start()
+
+    def discard(self, semaphore: "DistributedSemaphore"):
+        with self._lock:
+            self._held.discard(semaphore)
+
+    def _run(self):
+        while True:
+            time.sleep(settings.DEVICE_LOCK_LEASE / 3)
+            with self._lock:
+                held = list(self._held)
+            for semaphore in held:
+                try:
+                    if not semaphore.renew():
+                        logger.warning(f"Lost the '{semaphore.name}' slot before it was released")
+                        self.discard(semaphore)
+                except Exception as e:
+                    logger.warning(f"Failed to renew the '{semaphore.name}' slot lease: {str(e)}")
+
+_lease_keeper = _LeaseKeeper()
+
+class DistributedSemaphore:
+    """
+    Redis-backed counting semaphore shared by every worker process.
+
+    Waiters are served first-come first-served by ticket number, so a busy device does not
+    starve whoever queued first. Holders carry a lease so a crashed worker cannot leak a slot;
+    the lease is renewed in the background for as long as the slot is held.
+    """
+    def __init__(self, name: str, limit: int, lease: float = None, timeout: float = None):
+        self.name = name
+        self.limit = limit
+        self.lease = lease or settings.DEVICE_LOCK_LEASE
+        self.timeout = settings.DEVICE_LOCK_TIMEOUT if timeout is None else timeout
+        self.token = None
+        base = f"sem:{name}"
+        self._keys = [f"{base}:holders", f"{base}:queue", f"{base}:heartbeat", f"{base}:ticket"]
+
+    def _try_acquire(self, token: str) -> bool:
+        if _acquire(keys=self._keys, args=[token, self.limit, self.lease, _WAITER_STALE_AFTER]):
+            self.token = token
+            _lease_keeper.add(self)
+            return True
+        return False
+
+    def renew(self, lease: float = None) -> bool:
+        """Extends the held slot's lease (by `lease` seconds, default the full lease). False if it was lost."""
+        if not self.token:
+            return False
+        return bool(_renew(keys=self._keys[:1], args=[self.token, lease or self.lease]))
+
+    def park(self, lease: float):
+        """
+        Keeps the slot for an idle pooled session: no longer renewed in the background, it lapses
+        after `lease` seconds unless resumed. False if it was already lost.
+        """
+        _lease_keeper.discard(self)
+        return self.renew(lease)
+
+    def resume(self) -> bool:
+        """Takes a parked slot back into use with a full, renewed lease. False if it lapsed meanwhile."""
+        if not self.renew():
+            self.token = None
+            return False
+        _lease_keeper.add(self)
+        return True
+
+    def has_waiters(self) -> bool:
+        return _waiters(keys=self._keys[2:3], args=[_WAITER_STALE_AFTER]) > 0
+
+    def _give_up(self, token: str):
+        redis_client.zrem(self._keys[1], token)
+        redis_client.zrem(self._keys[2], token)
+
+    def acquire(self, give_up: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Waits up to `timeout` for a slot. `give_up` is polled between attempts; when it returns
+        True the wait is abandoned (e.g. a pooled session holding a slot became available).
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        delay = 0.05
+        while True:
+            if self._try_acquire(token):
+                return True
+            if time.monotonic() >= deadline or (give_up is not None and give_up()):
+                self._give_up(token)
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def acquire_async(self) -> bool:
+        """acquire() for event loops: Redis calls run in the default executor, waits never block other coroutines."""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        delay = 0.05
+        while True:
+            if await asyncio.to_thread(self._try_acquire, token):
+                return True
+            if time.monotonic() >= deadline:
+                await asyncio.to_thread(self._give_up, token)
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def release(self):
+        if self.token:
+            _lease_keeper.discard(self)
+            redis_client.zrem(self._keys[0], self.token)
+            self.token = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise SlotTimeout(f"Timed out after {self.timeout}s waiting for a '{self.name}' slot")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        if not await self.acquire_async():
+            raise SlotTimeout(f"Timed out after {self.timeout}s waiting for a '{self.name}' slot")
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.to_thread(self.release)
+
+def device_limit(host: str) -> int:
+    return settings.DEVICE_CONCURRENCY_OVERRIDES.get(host, settings.DEVICE_CONCURRENCY_LIMIT)
+
+def device_semaphore(device: dict) -> Optional[DistributedSemaphore]:
+    """The device's fleet-wide session slot, or None when its concurrency is not limited."""
+    limit = device_limit(device["host"])
+    return DistributedSemaphore(f"device:{device['host']}", limit) if limit > 0 else None
+
+@contextmanager
+def site_slot(site_id: int = None):
+    """Holds a per-site slot for the duration of an operation when SITE_CONCURRENCY_LIMIT is set."""
+    if site_id is None or settings.SITE_CONCURRENCY_LIMIT <= 0:
+        yield
+        return
+    with DistributedSemaphore(f"site:{site_id}", settings.SITE_CONCURRENCY_LIMIT):
+        yield
+
+@contextmanager
+def device_slot(host: str, site_id: int = None):
+    """
+    Holds a per-device slot (and a per-site slot when SITE_CONCURRENCY_LIMIT is set) for the
+    duration of an operation. The site slot is always taken first so two operations can never
+    hold each other's second slot.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(site_slot(site_id))
+        semaphore = device_semaphore({"host": host})
+        if semaphore is not None:
+            stack.enter_context(semaphore)
+        yield
+
+@asynccontextmanager
+async def device_slot_async(host: str, site_id: int = None):
+    """device_slot() for coroutines on the async engine's event loop."""
+    async with AsyncExitStack() as stack:
+        if site_id is not None and settings.SITE_CONCURRENCY_LIMIT > 0:
+            await stack.enter_async_context(DistributedSemaphore(f"site:{site_id}", settings.SITE_CONCURRENCY_LIMIT))
+        limit = device_limit(host)
+        if limit > 0:
+            await stack.enter_async_context(DistributedSemaphore(f"device:{host}", limit))
+        yield
+
+def _backup_inflight_key(device_id: int) -> str:
+    return f"backup_inflight:{device_id}"
+
+def mark_backup_inflight(device_id: int, run_id: str) -> bool:
+    """
+    Claims the device for a backup run. Returns False if a backup is already queued or running.
+    The marker expires on its own in case a worker dies mid-backup.
+    """
+    return bool(redis_client.set(_backup_inflight_key(device_id), run_id, nx=True, ex=settings.BACKUP_INFLIGHT_TTL))
+
+def clear_backup_inflight(device_id: int, run_id: str):
+    """Releases the claim of the given run; a marker set by another run (or none) is left alone."""
+    if device_id is not None and run_id is not None:
+        _clear_inflight(keys=[_backup_inflight_key(device_id)], args=[run_id])
@@ -1,8 +1,91 @@
-from nornir.core.inventory import Inventory, Host, Group, Defaults
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Dict, List, Optional, Set
+from nornir.core.inventory import Inventory, Host, Group, Defaults, ParentGroups, ConnectionOptions
+from sqlalchemy import event, func, inspect, or_, select
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
 from app.models.device import Device
+from app.models.site import Site
 from app.models.credential import CredentialProfile
 
+logger = logging.getLogger(__name__)
+
+def _platform(vendor: str) -> str:
+    # Map DB vendor names to Nornir platforms (Netmiko/NAPALM standard)
+    platform = vendor.lower()
+    if "cisco" in platform:
+        platform = "ios"
+    elif "juniper" in platform:
+        platform = "junos"
+    elif "huawei" in platform:
+        platform = "huawei"
+    return platform
+
+DEFAULT_SSH_PORT = 22
+
+def inventory_defaults() -> Defaults:
+    return Defaults(port=DEFAULT_SSH_PORT)
+
+def _platform_group(groups: Dict[str, Group], platform: str) -> Group:
+    name = f"platform_{platform}"
+    if name not in groups:
+        # Connection options shared by every host of the platform (matches the Celery tasks' Netmiko settings)
+        groups[name] = Group(name, platform=platform, connection_options={
+            "netmiko": ConnectionOptions(extras={"fast_cli": True}),
+        })
+    return groups[name]
+
+def _site_group(groups: Dict[str, Group], site_id: int, tenant_id: int) -> Group:
+    tenant_name, site_name = f"tenant_{tenant_id}", f"site_{site_id}"
+    if tenant_name not in groups:
+        groups[tenant_name] = Group(tenant_name, data={"tenant_id": tenant_id})
+    if site_name not in groups:
+        groups[site_name] = Group(site_name, data={"site_id": site_id}, groups=ParentGroups([groups[tenant_name]]))
+    return groups[site_name]
+
+def _credential_group(groups: Dict[str, Group], credential: CredentialProfile) -> Group:
+    name = f"credential_{credential.id}"
+    group = groups.get(name)
+    # Replaced (not mutated) on change; every host using the profile is rebuilt in the same refresh
+    if group is None or group.username != credential.username or group.password != credential.encrypted_password:
+        group = groups[name] = Group(name, username=credential.username, password=credential.encrypted_password)
+    return group
+
+def _build_host(device: Device, credential: CredentialProfile, tenant_id: int, groups: Dict[str, Group], defaults: Defaults) -> Host:
+    """
+    Builds a host that carries only its own values; platform, credentials, site and tenant come
+    from shared groups (site -> tenant, platform, credential profile) registered in `groups`.
+    """
+    return Host(
+        name=device.hostname,
+        hostname=device.ip_address,
+        port=device.port if device.port and device.port != DEFAULT_SSH_PORT else None,
+        groups=ParentGroups([
+            _site_group(groups, device.site_id, tenant_id),
+            _platform_group(groups, _platform(device.vendor)),
+            _credential_group(groups, credential),
+        ]),
+        data={"device_id": device.id},
+        defaults=defaults
+    )
+
+def _copy_host(host: Host, defaults: Defaults) -> Host:
+    """
+    Per-run copy of a cached host. Runs write into host data and hold connections on the host,
+    so the cached objects themselves are never handed to Nornir. Groups are shared as-is.
+    """
+    own = lambda attr: object.__getattribute__(host, attr)
+    return Host(
+        name=host.name, hostname=own("hostname"), port=own("port"), username=own("username"), password=own("password"),
+        platform=own("platform"), groups=host.groups, data=dict(host.data), defaults=defaults
+    )
+
 class SQLAlchemyInventory:
     """
     Nornir Dynamic Inventory Plugin that fetches devices from the PostgreSQL database.
@@ -14,41 +97,252 @@ class SQLAlchemyInventory:
 
     def load(self) -> Inventory:
         hosts = {}
-        
+        groups = {}
+        defaults = inventory_defaults()
+
         # Build query
-        query = self.db.query(Device, CredentialProfile).join(
+        query = self.db.query(Device, CredentialProfile, Site.tenant_id).join(
             CredentialProfile, Device.credential_id == CredentialProfile.id
-        )
-        
+        ).join(Site, Device.site_id == Site.id)
+
         if self.tenant_id is not None:
-            query = query.filter(Device.tenant_id == self.tenant_id)
-            
+            query = query.filter(Site.tenant_id == self.tenant_id)
+
         if self.device_ids:
             query = query.filter(Device.id.in_(self.device_ids))
-            
+
         results = query.all()
-        
-        for device, credential in results:
-            # Map DB vendor names to Nornir platforms (Netmiko/NAPALM standard)
-            platform = device.vendor.lower()
-            if "cisco" in platform:
-                platform = "ios"
-            elif "juniper" in platform:
-                platform = "junos"
-            elif "huawei" in platform:
-                platform = "huawei"
-                
-            hosts[device.hostname] = Host(
-                name=device.hostname,
-                hostname=device.ip_address,
-                username=credential.username,
-                password=credential.encrypted_password,
-                platform=platform,
-                data={
-                    "site_id": device.site_id,
-                    "tenant_id": device.tenant_id,
-                    "device_id": device.id,
-                }
-            )
-            
-        return Inventory(hosts=hosts, groups={}, defaults=Defaults())
+
+        for device, credential, tenant_id in results:
+            hosts[device.hostname] = _build_host(device, credential, tenant_id, groups, defaults)
+
+        return Inventory(hosts=hosts, groups=groups, defaults=defaults)
+
+def _version_key(tenant_id: int) -> str:
+    return f"inventory:version:{tenant_id}"
+
+class _TenantInventory:
+    def __init__(self):
+        self.hosts: Dict[int, Host] = {}
+        self.groups: Dict[str, Group] = {}
+        self.watermark: Optional[datetime] = None
+        self.version: Optional[str] = None
+        self.checked_at = 0.0
+
+class InventoryCache:
+    """
+    Process-level Nornir inventory, kept per tenant and refreshed incrementally.
+
+    Writes to devices, sites and credentials bump a per-tenant version in Redis (see the session
+    hooks below), so a warm lookup costs one Redis GET and no DB query. When the version moved, only
+    rows changed since the tenant's updated_at watermark, less INVENTORY_WATERMARK_OVERLAP, are
+    reloaded. MAX_STALENESS bounds how long changes made outside the ORM (raw SQL, migrations) can
+    go unnoticed: those leave updated_at untouched, so a refresh forced by the timeout reloads the
+    tenant in full.
+    """
+    def __init__(self, max_staleness: float = None):
+        self.max_staleness = settings.INVENTORY_CACHE_MAX_STALENESS if max_staleness is None else max_staleness
+        self._tenants: Dict[int, _TenantInventory] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._refreshing: Set[int] = set()
+        self._guard = threading.Lock()
+        self.defaults = inventory_defaults()
+
+    def _lock(self, tenant_id: int) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(tenant_id, threading.Lock())
+
+    def _current_version(self, tenant_id: int) -> Optional[str]:
+        try:
+            return redis_client.get(_version_key(tenant_id))
+        except Exception as e:
+            logger.debug(f"Inventory version lookup failed for tenant {tenant_id}: {str(e)}")
+            return None
+
+    def _staleness(self, tenant_id: int, entry: _TenantInventory) -> Optional[str]:
+        """None when fresh, "expired" past MAX_STALENESS, "changed" when the version moved."""
+        if time.monotonic() - entry.checked_at > self.max_staleness:
+            return "expired"
+        if self._current_version(tenant_id) != entry.version:
+            return "changed"
+        return None
+
+    def refresh(self, tenant_id: int, full: bool = False):
+        """
+        Loads the tenant on first use, afterwards applies only rows changed since the last watermark
+        and drops devices that were deleted or lost their credential. With full, everything is
+        reloaded regardless of the watermark.
+        """
+        with self._lock(tenant_id):
+            entry = self._tenants.get(tenant_id)
+            if entry is None or full:
+                entry = _TenantInventory()
+            # Read the version before querying so a write racing with this refresh triggers another one
+            version = self._current_version(tenant_id)
+            db = SessionLocal()
+            try:
+                device_changed = func.coalesce(Device.updated_at, Device.created_at)
+                credential_changed = func.coalesce(CredentialProfile.updated_at, CredentialProfile.created_at)
+                # A site moved in from another tenant brings its devices along without touching them
+                site_changed = func.coalesce(Site.updated_at, Site.created_at)
+                query = db.query(Device, CredentialProfile, site_changed).join(
+                    CredentialProfile, Device.credential_id == CredentialProfile.id
+                ).join(Site, Device.site_id == Site.id).filter(Site.tenant_id == tenant_id)
+
+                if entry.watermark is not None:
+                    # Rows are stamped with their transaction's start, so one committed after the last refresh
+                    # can carry an older stamp; re-read an overlap window behind the watermark
+                    since = entry.watermark - timedelta(seconds=settings.INVENTORY_WATERMARK_OVERLAP)
+                    query = query.filter(or_(device_changed >= since, credential_changed >= since, site_changed >= since))
+                changed = query.all()
+
+                live_ids = None
+                if entry.watermark is not None:
+                    live_ids = {row[0] for row in db.query(Device.id).join(Site, Device.site_id == Site.id).filter(
+                        Site.tenant_id == tenant_id, Device.credential_id.isnot(None)
+                    )}
+            finally:
+                db.close()
+
+            hosts, groups = dict(entry.hosts), dict(entry.groups)
+            watermark = entry.watermark
+            for device, credential, site_stamp in changed:
+                hosts[device.id] = _build_host(device, credential, tenant_id, groups, self.defaults)
+                for stamp in (device.updated_at or device.created_at, credential.updated_at or credential.created_at, site_stamp):
+                    if stamp and (watermark is None or stamp > watermark):
+                        watermark = stamp
+            if live_ids is not None:
+                hosts = {device_id: host for device_id, host in hosts.items() if device_id in live_ids}
+
+            refreshed = _TenantInventory()
+            refreshed.hosts, refreshed.groups, refreshed.watermark = hosts, groups, watermark
+            refreshed.version, refreshed.checked_at = version, time.monotonic()
+            # Swap in one assignment so concurrent readers always see a complete snapshot
+            self._tenants[tenant_id] = refreshed
+            logger.info(f"Inventory for tenant {tenant_id}: {len(changed)} hosts (re)loaded, {len(hosts)} cached")
+
+    def _refresh_in_background(self, tenant_id: int, full: bool = False):
+        with self._guard:
+            if tenant_id in self._refreshing:
+                return
+            self._refreshing.add(tenant_id)
+
+        def run():
+            try:
+                self.refresh(tenant_id, full=full)
+            except Exception as e:
+                logger.error(f"Background inventory refresh failed for tenant {tenant_id}: {str(e)}")
+            finally:
+                with self._guard:
+                    self._refreshing.discard(tenant_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, tenant_id: int, device_ids: List[int] = None, site_id: int = None, platform: str = None,
+            wait: bool = True) -> Inventory:
+        """
+        Returns a filtered view of the tenant's cached inventory with fresh Host copies.
+        With wait=False a stale cache is served as-is while it refreshes in the background; only
+        requested devices missing from the cache are looked up directly.
+        """
+        entry = self._tenants.get(tenant_id)
+        staleness = self._staleness(tenant_id, entry) if entry is not None else None
+        if entry is None:
+            self.refresh(tenant_id)
+        elif staleness:
+            full = staleness == "expired"
+            if wait:
+                self.refresh(tenant_id, full=full)
+            else:
+                self._refresh_in_background(tenant_id, full=full)
+        entry = self._tenants[tenant_id]
+
+        wanted = set(device_ids) if device_ids else None
+        groups = dict(entry.groups)
+        hosts = {}
+        for device_id, host in entry.hosts.items():
+            if wanted is not None and device_id not in wanted:
+                continue
+            if site_id is not None and host.get("site_id") != site_id:
+                continue
+            if platform and host.platform != platform:
+                continue
+            hosts[host.name] = _copy_host(host, self.defaults)
+
+        missing = wanted - set(entry.hosts) if wanted is not None else set()
+        if missing and not wait:
+            # Devices added after the served snapshot; fetch just those rather than the whole tenant
+            db = SessionLocal()
+            try:
+                extra = SQLAlchemyInventory(db, tenant_id=tenant_id, device_ids=list(missing)).load()
+            finally:
+                db.close()
+            for host in extra.hosts.values():
+                if (site_id is None or host.get("site_id") == site_id) and (not platform or host.platform == platform):
+                    hosts[host.name] = host
+            for name, group in extra.groups.items():
+                groups.setdefault(name, group)
+        return Inventory(hosts=hosts, groups=groups, defaults=self.defaults)
+
+    def invalidate(self, tenant_id: int = None):
+        if tenant_id is None:
+            self._tenants.clear()
+        else:
+            self._tenants.pop(tenant_id, None)
+
+    def stats(self) -> Dict[int, dict]:
+        return {
+            tenant_id: {"hosts": len(entry.hosts), "groups": len(entry.groups), "watermark": entry.watermark.isoformat() if entry.watermark else None}
+            for tenant_id, entry in self._tenants.items()
+        }
+
+inventory_cache = InventoryCache()
+
+def _load_previous_owner(target, value, oldvalue, initiator):
+    pass
+
+# active_history loads an expired owner column before it is overwritten, so the flush hook below
+# can see which tenant or site an object is moving away from
+for _owner in (Device.site_id, Site.tenant_id, CredentialProfile.tenant_id):
+    event.listen(_owner, "set", _load_previous_owner, active_history=True)
+
+def _owners(obj, attr: str) -> Set[int]:
+    """The object's current and, when this flush changed it, previous value of `attr`."""
+    history = inspect(obj).attrs[attr].history
+    return {value for value in chain(history.added, history.unchanged, history.deleted) if value is not None}
+
+@event.listens_for(Session, "after_flush")
+def _collect_inventory_changes(session, flush_context):
+    """
+    Notes which tenants' inventories a flush touched; published once the transaction commits.
+    A device, site or credential moved to another owner touches both the old and the new one.
+    """
+    tenants = session.info.setdefault("inventory_tenants", set())
+    site_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, CredentialProfile):
+            tenants.update(_owners(obj, "tenant_id"))
+        elif isinstance(obj, Site):
+            tenants.update(_owners(obj, "tenant_id"))
+        elif isinstance(obj, Device):
+            site_ids.update(_owners(obj, "site_id"))
+    if site_ids:
+        rows = session.connection().execute(select(Site.tenant_id).where(Site.id.in_(site_ids)))
+        tenants.update(row[0] for row in rows)
+
+@event.listens_for(Session, "after_commit")
+def _publish_inventory_changes(session):
+    tenants = session.info.pop("inventory_tenants", None)
+    if not tenants:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for tenant_id in tenants:
+            pipe.incr(_version_key(tenant_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish inventory changes for tenants {sorted(tenants)}: {str(e)}")
+
+@event.listens_for(Session, "after_rollback")
+def _discard_inventory_changes(session):
+    session.info.pop("inventory_tenants", None)
@@ -0,0 +1,168 @@
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+from nornir.core.inventory import Host
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
+from app.core.config import settings
+from app.models.deploy_result import DeployHostResult
+
+logger = logging.getLogger(__name__)
+
+def results_channel(run_id: str) -> str:
+    return f"nornir_results:{run_id}"
+
+def _done_key(run_id: str) -> str:
+    return f"nornir_results:{run_id}:done"
+
+def host_result_record(host: Host, task_result) -> Dict[str, Any]:
+    """
+    API-facing outcome of one host's deploy. Push errors are caught into host data rather than
+    failing the Nornir task, so both are checked.
+    """
+    is_failed = task_result.failed or "error" in host.data
+    return {
+        "hostname": host.name,
+        "ip": host.hostname,
+        "device_id": host.data.get("device_id"),
+        "failed": is_failed,
+        "result": task_result[0].result if not is_failed and task_result else str(task_result.exception) if task_result.exception else host.data.get("error", "Unknown error")
+    }
+
+def _row_to_dict(row: DeployHostResult) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "device_id": row.device_id,
+        "hostname": row.hostname,
+        "status": row.status,
+        "result": row.result,
+        "duration_seconds": row.duration_seconds,
+        "finished_at": row.finished_at.isoformat() if row.finished_at else None,
+    }
+
+class HostResultProcessor:
+    """
+    Nornir processor that emits each host's outcome the moment that host completes: a row in
+    deploy_host_results plus a message on the run's Redis pub/sub channel. Call finish() once
+    the run is over so live listeners know to stop.
+    """
+    def __init__(self, run_id: str, tenant_id: Optional[int], operation: str):
+        self.run_id = run_id
+        self.tenant_id = tenant_id
+        self.operation = operation
+        self._started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        with self._lock:
+            self._started[host.name] = time.monotonic()
+
+    def task_instance_completed(self, task, host, result):
+        with self._lock:
+            started = self._started.pop(host.name, None)
+        record = host_result_record(host, result)
+        row = DeployHostResult(
+            run_id=self.run_id, tenant_id=self.tenant_id, device_id=record["device_id"], hostname=record["hostname"],
+            operation=self.operation, status="fail" if record["failed"] else "success",
+            result=None if record["result"] is None else str(record["result"]),
+            duration_seconds=round(time.monotonic() - started, 3) if started else None
+        )
+        # Runs on a Nornir worker thread, so each write gets its own short-lived session
+        db = SessionLocal()
+        try:
+            db.add(row)
+            db.commit()
+            payload = _row_to_dict(row)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to store {self.operation} result for {host.name}: {str(e)}")
+            payload = {"id": None, "device_id": row.device_id, "hostname": row.hostname, "status": row.status, "result": row.result,
+                       "duration_seconds": row.duration_seconds, "finished_at": None}
+        finally:
+            db.close()
+        try:
+            redis_client.publish(results_channel(self.run_id), json.dumps({"type": "host", **payload}))
+        except Exception as e:
+            logger.debug(f"Failed to publish result for {host.name}: {str(e)}")
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        pass
+
+    def finish(self, status: str):
+        try:
+            redis_client.set(_done_key(self.run_id), status, ex=settings.RESULT_EXPIRES)
+            redis_client.publish(results_channel(self.run_id), json.dumps({"type": "end", "status": status}))
+        except Exception as e:
+            logger.debug(f"Failed to publish end of run {self.run_id}: {str(e)}")
+
+def list_run_results(run_id: str, after_id: int = 0, limit: int = 100, status: str = None) -> List[Dict[str, Any]]:
+    """
+    Host results of a run in completion order. Pass the last seen id as after_id for the next page.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(DeployHostResult).filter(DeployHostResult.run_id == run_id, DeployHostResult.id > after_id)
+        if status:
+            query = query.filter(DeployHostResult.status == status)
+        return [_row_to_dict(row) for row in query.order_by(DeployHostResult.id).limit(limit)]
+    finally:
+        db.close()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def iter_run_results(run_id: str, keepalive: float = 15.0, max_wait: float = 3600.0) -> Iterator[str]:
+    """
+    Server-Sent Events of a run's host results: everything stored so far, then each new host as
+    it completes, ending when the run finishes. Subscribes before reading the table so nothing
+    completing in between is lost; results seen in both are sent once.
+    """
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(results_channel(run_id))
+    try:
+        sent = set()
+        after_id = 0
+        while True:
+            page = list_run_results(run_id, after_id=after_id, limit=500)
+            for item in page:
+                sent.add(item["id"])
+                yield _sse("host", item)
+            if len(page) < 500:
+                break
+            after_id = page[-1]["id"]
+
+        done = redis_client.get(_done_key(run_id))
+        if done:
+            yield _sse("end", {"status": done})
+            return
+
+        deadline = time.monotonic() + max_wait
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=1.0)
+            if message is None:
+                if time.monotonic() - last_sent >= keepalive:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                continue
+            event = json.loads(message["data"])
+            last_sent = time.monotonic()
+            if event.pop("type") == "end":
+                yield _sse("end", event)
+                return
+            if event["id"] is None or event["id"] not in sent:
+                yield _sse("host", event)
+        yield _sse("end", {"status": "timeout"})
+    finally:
+        pubsub.close()
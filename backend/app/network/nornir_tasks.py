@@ -1,40 +1,147 @@
+import math
 import logging
-from typing import Dict, Any, List
-from nornir import InitNornir
+from contextlib import ExitStack
+from typing import Dict, Any, List, Optional, Union
+from nornir.core import Nornir
+from nornir.core.plugins.connections import ConnectionPluginRegister
+from nornir.core.inventory import Host
+from nornir.plugins.runners import ThreadedRunner
 from nornir_netmiko.tasks import netmiko_send_config, netmiko_send_command
 from nornir_napalm.plugins.tasks import napalm_configure, napalm_get
-from app.network.inventory import SQLAlchemyInventory
+from app.network.inventory import SQLAlchemyInventory, inventory_cache
+from app.network.templating import TemplateRenderer
+from app.network.nornir_processors import HostResultProcessor, host_result_record
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.network import result_cache
+from app.network.device_limiter import device_slot
+from app.core.metrics import OperationTimer
 
 logger = logging.getLogger(__name__)
 
-def get_nornir_object(db: Session, tenant_id: int = None, device_ids: list[int] = None):
+def get_nornir_object(db: Session, tenant_id: int = None, device_ids: list[int] = None, wait_for_inventory: bool = True,
+                      num_workers: Optional[int] = None):
     """
-    Initializes a Nornir object dynamically using the SQLAlchemy inventory plugin.
+    Initializes a Nornir object over a view of the tenant's cached inventory.
+    Without a tenant the SQLAlchemy inventory plugin queries the database directly.
     """
-    inventory_plugin = SQLAlchemyInventory(db=db, tenant_id=tenant_id, device_ids=device_ids)
-    
-    # Init Nornir with memory inventory (since we provide the loaded inventory object directly)
-    nr = InitNornir(
-        inventory={
-            "plugin": "nornir.plugins.inventory.simple.SimpleInventory",
-            "options": {"host_file": "", "group_file": "", "defaults_file": ""}
-        }
-    )
-    
-    # Overwrite the empty inventory with our dynamically loaded one
-    nr.inventory = inventory_plugin.load()
-    return nr
-
-def deploy_config_template_nornir(db: Session, template_content: str, tenant_id: int, device_ids: list[int], dry_run: bool = False) -> Dict[str, Any]:
+    # Built directly rather than via InitNornir, which insists on loading an inventory plugin first
+    ConnectionPluginRegister.auto_register()
+    if tenant_id is not None:
+        inventory = inventory_cache.get(tenant_id, device_ids=device_ids, wait=wait_for_inventory)
+    else:
+        inventory = SQLAlchemyInventory(db=db, device_ids=device_ids).load()
+    return Nornir(inventory=inventory, runner=ThreadedRunner(num_workers=num_workers or settings.NORNIR_NUM_WORKERS))
+
+def _resolve_size(size: Union[int, str, None], total: int) -> int:
+    """Batch size as an absolute count or a percentage string such as "10%"; None means everything."""
+    if size is None:
+        return max(total, 1)
+    if isinstance(size, str) and size.strip().endswith("%"):
+        return max(math.ceil(total * float(size.strip()[:-1]) / 100), 1)
+    return max(int(size), 1)
+
+def plan_batches(hosts: Dict[str, Host], canary_size: int = 0, batch_size: Union[int, str, None] = None,
+                 per_site: bool = False) -> List[List[str]]:
+    """
+    Splits hosts into rollout batches: an optional canary batch, then batches of `batch_size`.
+    The canary is drawn round-robin across sites. With per_site the size applies to each site
+    separately, so no batch takes more than that many hosts out of any one site.
+    """
+    by_site: Dict[Any, List[str]] = {}
+    for name, host in sorted(hosts.items(), key=lambda item: item[1].data.get("device_id") or 0):
+        by_site.setdefault(host.get("site_id"), []).append(name)
+
+    batches = []
+    if canary_size > 0:
+        canary = []
+        queues = [list(names) for names in by_site.values()]
+        while len(canary) < canary_size and any(queues):
+            for names in queues:
+                if names and len(canary) < canary_size:
+                    canary.append(names.pop(0))
+        batches.append(canary)
+        picked = set(canary)
+        by_site = {site: [n for n in names if n not in picked] for site, names in by_site.items()}
+
+    if per_site:
+        chunked = []
+        for names in by_site.values():
+            size = _resolve_size(batch_size, len(names))
+            chunked.append([names[i:i + size] for i in range(0, len(names), size)])
+        for index in range(max((len(chunks) for chunks in chunked), default=0)):
+            batches.append([name for chunks in chunked if index < len(chunks) for name in chunks[index]])
+    else:
+        remaining = [name for names in by_site.values() for name in names]
+        remaining.sort(key=lambda name: hosts[name].data.get("device_id") or 0)
+        size = _resolve_size(batch_size, len(remaining))
+        batches.extend(remaining[i:i + size] for i in range(0, len(remaining), size))
+    return [batch for batch in batches if batch]
+
+def deploy_config_template_nornir(db: Session, template_content: str, tenant_id: int, device_ids: list[int], dry_run: bool = False,
+                                  wait_for_inventory: bool = True, canary_size: int = 0, batch_size: Union[int, str, None] = None,
+                                  batch_per_site: bool = False, max_failure_rate: float = 1.0,
+                                  num_workers: Optional[int] = None, processors: Optional[list] = None,
+                                  template_vars: Optional[Dict[str, Any]] = None,
+                                  host_vars: Optional[Dict[Any, Dict[str, Any]]] = None) -> Dict[str, Any]:
     """
-    Deploys a rendered configuration text to multiple devices concurrently.
+    Deploys a configuration template to multiple devices concurrently.
     Uses NAPALM where supported for safe atomic transactions, and Netmiko as fallback.
+
+    The template is compiled once and rendered per host from `template_vars`, the host's inventory
+    data and its `host_vars` entry (keyed by device id), in that order of precedence.
+
+    By default every host is pushed at once. For a rolling rollout, `canary_size` hosts go first,
+    then batches of `batch_size` (count or "N%"); the rollout halts once the failure rate over the
+    hosts attempted so far exceeds `max_failure_rate`, and untouched hosts are reported as skipped.
+    `processors` receive Nornir's per-host events as they happen.
     """
-    nr = get_nornir_object(db=db, tenant_id=tenant_id, device_ids=device_ids)
-    
+    nr = get_nornir_object(db=db, tenant_id=tenant_id, device_ids=device_ids, wait_for_inventory=wait_for_inventory,
+                           num_workers=num_workers)
+    if processors:
+        nr = nr.with_processors(processors)
+
+    renderer = TemplateRenderer(template_content)
+    # Celery's JSON round trip turns integer keys into strings
+    overrides = {str(device_id): values for device_id, values in (host_vars or {}).items()}
+
+    def render_host_config(host) -> str:
+        context = dict(template_vars or {})
+        context.update({key: value for key, value in host.items() if key != "error"})
+        context.update(hostname=host.name, ip=host.hostname, platform=host.platform)
+        context.update(overrides.get(str(host.data.get("device_id")), {}))
+        return renderer.render(context)
+
     def config_task(task):
+        host = task.host
+        # Rendering runs in the Nornir worker threads, before any device slot is taken
+        try:
+            config = render_host_config(host)
+        except Exception as e:
+            host["error"] = f"Template rendering failed: {str(e)}"
+            return
+        timer = OperationTimer(
+            "deploy_config", vendor=host.platform, device_id=host.data.get("device_id"),
+            site_id=host.get("site_id"), tenant_id=host.get("tenant_id")
+        )
+        with timer, ExitStack() as stack:
+            # Share the per-device (and per-site) slots with the Celery tasks so we never pile onto a busy box
+            with timer.phase("slot_wait"):
+                stack.enter_context(device_slot(host.hostname, site_id=host.get("site_id")))
+            with timer.phase("deploy"):
+                try:
+                    push_config(task, config)
+                finally:
+                    # Log out while still holding the slot; an open Nornir session would outlive it on the device
+                    try:
+                        host.close_connections()
+                    except Exception as e:
+                        logger.debug(f"Ignoring error while closing connections to {host.name}: {str(e)}")
+            timer.add_bytes(sent=len(config))
+
+    def push_config(task, config: str):
         platform = task.host.platform
         
         # Example logic: Try NAPALM for Junos/IOS-XR, fallback to Netmiko for others
@@ -42,7 +149,7 @@ def deploy_config_template_nornir(db: Session, template_content: str, tenant_id:
             try:
                 task.run(
                     task=napalm_configure,
-                    configuration=template_content,
+                    configuration=config,
                     replace=False,
                     dry_run=dry_run
                 )
@@ -54,7 +161,7 @@ def deploy_config_template_nornir(db: Session, template_content: str, tenant_id:
                 task.host["error"] = "Dry-run not supported for platform via Netmiko. Skipping."
                 return
                 
-            config_lines = template_content.splitlines()
+            config_lines = config.splitlines()
             try:
                 task.run(
                     task=netmiko_send_config,
@@ -63,18 +170,82 @@ def deploy_config_template_nornir(db: Session, template_content: str, tenant_id:
             except Exception as e:
                 task.host["error"] = str(e)
 
-    # Run the task concurrently across all filtered hosts
-    result = nr.run(task=config_task)
-    
-    # Format the results for the API response
+    batches = plan_batches(nr.inventory.hosts, canary_size=canary_size, batch_size=batch_size, per_site=batch_per_site)
+
     response = []
-    for host_name, task_result in result.items():
-        is_failed = task_result.failed or "error" in nr.inventory.hosts[host_name].data
-        response.append({
-            "hostname": host_name,
-            "ip": nr.inventory.hosts[host_name].hostname,
-            "failed": is_failed,
-            "result": task_result[0].result if not is_failed and task_result else str(task_result.exception) if task_result.exception else nr.inventory.hosts[host_name].data.get("error", "Unknown error")
-        })
-        
-    return {"status": "completed", "dry_run": dry_run, "details": response}
+    batch_summary = []
+    attempted = failed = 0
+    halted = None
+    for index, batch in enumerate(batches):
+        members = set(batch)
+        # Run the task concurrently across the hosts of this batch
+        result = nr.filter(filter_func=lambda host: host.name in members).run(task=config_task)
+
+        # Pushed configuration makes any cached show output for these devices stale
+        if not dry_run:
+            for host_name in batch:
+                result_cache.invalidate_device(nr.inventory.hosts[host_name].data.get("device_id"))
+
+        # Format the results for the API response
+        batch_failed = 0
+        for host_name, task_result in result.items():
+            record = host_result_record(nr.inventory.hosts[host_name], task_result)
+            batch_failed += record["failed"]
+            response.append({**record, "batch": index})
+
+        attempted += len(batch)
+        failed += batch_failed
+        batch_summary.append({"batch": index, "canary": index == 0 and canary_size > 0, "hosts": len(batch), "failed": batch_failed})
+        logger.info(f"Deploy batch {index + 1}/{len(batches)}: {batch_failed}/{len(batch)} failed")
+
+        if failed / attempted > max_failure_rate and index < len(batches) - 1:
+            halted = {"after_batch": index, "failure_rate": round(failed / attempted, 4)}
+            logger.warning(f"Rollout halted after batch {index + 1}: failure rate {failed}/{attempted} exceeds {max_failure_rate}")
+            break
+
+    if halted:
+        for batch in batches[halted["after_batch"] + 1:]:
+            for host_name in batch:
+                response.append({
+                    "hostname": host_name,
+                    "ip": nr.inventory.hosts[host_name].hostname,
+                    "device_id": nr.inventory.hosts[host_name].data.get("device_id"),
+                    "skipped": True,
+                    "failed": False,
+                    "result": "Not attempted: rollout halted"
+                })
+
+    return {
+        "status": "halted" if halted else "completed",
+        "dry_run": dry_run,
+        "batches": batch_summary,
+        "halted": halted,
+        "details": response
+    }
+
+@celery_app.task(bind=True, name="app.network.nornir_tasks.deploy_mitigation")
+def deploy_mitigation(self, template_content: str, tenant_id: int, device_ids: list[int]):
+    """
+    Pushes an anomaly mitigation config from the dedicated mitigation queue,
+    so it never waits behind backups or bulk work.
+    """
+    # Each router's outcome is published as soon as it lands, readable live by this task's ID
+    results = HostResultProcessor(self.request.id, tenant_id, "mitigation")
+    db = SessionLocal()
+    status = "error"
+    try:
+        outcome = deploy_config_template_nornir(
+            db=db,
+            template_content=template_content,
+            tenant_id=tenant_id,
+            device_ids=device_ids,
+            dry_run=False,
+            # A stale inventory refreshes in the background; the push goes out now
+            wait_for_inventory=False,
+            processors=[results]
+        )
+        status = outcome["status"]
+        return outcome
+    finally:
+        results.finish(status)
+        db.close()
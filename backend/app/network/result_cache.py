@@ -0,0 +1,124 @@
+import re
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "show_cache:stats"
+
+# Only commands that cannot change device state are ever cached
+READ_ONLY_PREFIXES = ("show ", "display ")
+
+# Pipe stages that only filter the output; any other stage (e.g. "| redirect", "| tee") could have side effects
+OUTPUT_FILTERS = {"include", "exclude", "begin", "section", "count", "i", "e", "b", "s"}
+
+# Per-command TTL policy in seconds, first matching prefix wins.
+# Volatile outputs get short TTLs, mostly static ones longer. SHOW_CACHE_TTL_OVERRIDES takes precedence.
+DEFAULT_TTL_POLICIES = [
+    ("show log", 5),
+    ("display log", 5),
+    ("show version", 3600),
+    ("display version", 3600),
+    ("show inventory", 3600),
+    ("show running-config", 300),
+    ("show configuration", 300),
+    ("display current-configuration", 300),
+    ("show ip interface brief", 30),
+    ("show interfaces", 30),
+    ("show ip bgp", 30),
+]
+
+_whitespace = re.compile(r"\s+")
+
+def normalize_command(command: str) -> str:
+    return _whitespace.sub(" ", command.strip()).lower()
+
+def is_cacheable(command: str) -> bool:
+    normalized = normalize_command(command)
+    _, *stages = normalized.split("|")
+    if any(stage.strip().partition(" ")[0] not in OUTPUT_FILTERS for stage in stages):
+        return False
+    return normalized.startswith(READ_ONLY_PREFIXES)
+
+def ttl_for(command: str) -> int:
+    normalized = normalize_command(command)
+    # Overrides are matched the way lookups are normalized, whatever case or spacing they were configured with
+    overrides = [(normalize_command(prefix), ttl) for prefix, ttl in settings.SHOW_CACHE_TTL_OVERRIDES.items()]
+    for prefix, ttl in overrides + DEFAULT_TTL_POLICIES:
+        if normalized.startswith(prefix):
+            return ttl
+    return settings.SHOW_CACHE_DEFAULT_TTL
+
+def _key(device_id: int, command: str, parse_mode: str) -> str:
+    digest = hashlib.sha1(normalize_command(command).encode()).hexdigest()
+    return f"show_cache:{device_id}:{parse_mode}:{digest}"
+
+def _index_key(device_id: int) -> str:
+    return f"show_cache_keys:{device_id}"
+
+def get_cached(device_id: int, command: str, parse_mode: str = "raw", max_age: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns {"result", "cached_at", "age"} for a fresh cached result, or None.
+    `max_age` further limits acceptable staleness; 0 bypasses the cache entirely.
+    """
+    if max_age == 0 or not is_cacheable(command):
+        return None
+    try:
+        raw = redis_client.get(_key(device_id, command, parse_mode))
+        entry = json.loads(raw) if raw else None
+        if entry is not None:
+            entry["age"] = round(time.time() - entry["cached_at"], 3)
+            if max_age is not None and entry["age"] > max_age:
+                entry = None
+        redis_client.hincrby(STATS_KEY, "hits" if entry else "misses", 1)
+        return entry
+    except Exception as e:
+        logger.warning(f"Show cache lookup failed, falling through to device: {str(e)}")
+        return None
+
+def set_cached(device_id: int, command: str, result: Dict[str, Any], parse_mode: str = "raw"):
+    if device_id is None or not is_cacheable(command):
+        return
+    ttl = ttl_for(command)
+    if ttl <= 0:
+        return
+    key = _key(device_id, command, parse_mode)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(key, json.dumps({"result": result, "cached_at": time.time()}), ex=ttl)
+        pipe.sadd(_index_key(device_id), key)
+        pipe.expire(_index_key(device_id), settings.SHOW_CACHE_MAX_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to store show cache entry for device {device_id}: {str(e)}")
+
+def invalidate_device(device_id: int):
+    """
+    Drops every cached result for a device, called after any configuration change touches it.
+    """
+    if device_id is None:
+        return
+    try:
+        index = _index_key(device_id)
+        keys = redis_client.smembers(index)
+        pipe = redis_client.pipeline(transaction=False)
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(index)
+        pipe.hincrby(STATS_KEY, "invalidations", 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to invalidate show cache for device {device_id}: {str(e)}")
+
+def get_stats() -> Dict[str, Any]:
+    stats = {name: int(value) for name, value in redis_client.hgetall(STATS_KEY).items()}
+    for name in ("hits", "misses", "invalidations"):
+        stats.setdefault(name, 0)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,113 @@
+import json
+import time
+import logging
+import threading
+from typing import Callable, Iterator
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+def stream_key(task_id: str) -> str:
+    return f"task_stream:{task_id}"
+
+class TaskOutputStream:
+    """
+    Publishes command output chunks for a task to a Redis Stream as they arrive from the device.
+
+    A stream (rather than plain pub/sub) lets a client that connects a moment after the task
+    starts replay what it missed, while MAXLEN and a short TTL keep Redis memory bounded. From the
+    first event until `end()` the TTL is refreshed in the background, so a long quiet stretch
+    (e.g. a slow deploy batch) cannot expire the stream under a running task; once the worker
+    dies or the task ends, the stream expires TASK_STREAM_TTL later.
+    """
+    def __init__(self, task_id: str):
+        self.key = stream_key(task_id)
+        self.bytes_sent = 0
+        self._ended = threading.Event()
+        self._heartbeat = None
+
+    def _publish(self, fields: dict):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xadd(self.key, fields, maxlen=settings.TASK_STREAM_MAXLEN, approximate=True)
+        pipe.expire(self.key, settings.TASK_STREAM_TTL)
+        pipe.execute()
+        if self._heartbeat is None and not self._ended.is_set():
+            self._heartbeat = threading.Thread(target=self._keep_alive, name="task-stream-ttl", daemon=True)
+            self._heartbeat.start()
+
+    def _keep_alive(self):
+        while not self._ended.wait(settings.TASK_STREAM_TTL / 3):
+            try:
+                redis_client.expire(self.key, settings.TASK_STREAM_TTL)
+            except Exception as e:
+                logger.warning(f"Failed to refresh the TTL of {self.key}: {str(e)}")
+
+    def chunk(self, data: str):
+        if not data:
+            return
+        self.bytes_sent += len(data)
+        self._publish({"type": "chunk", "data": data})
+
+    def record(self, event_type: str, payload: dict):
+        """Publishes a structured event (e.g. one host's progress) as JSON in the `data` field."""
+        self._publish({"type": event_type, "data": json.dumps(payload)})
+
+    def end(self, status: str, message: str = ""):
+        self._ended.set()
+        self._publish({"type": "end", "status": status, "message": message})
+
+def stream_command(net_connect, command: str, on_chunk: Callable[[str], None], read_timeout: float = 120.0, poll_interval: float = 0.05):
+    """
+    Sends a command on a Netmiko session and forwards channel output to `on_chunk` as it arrives,
+    returning once the device prompt shows up again.
+    """
+    prompt = net_connect.find_prompt()
+    net_connect.write_channel(command + net_connect.RETURN)
+
+    tail = ""
+    deadline = time.monotonic() + read_timeout
+    while time.monotonic() < deadline:
+        chunk = net_connect.read_channel()
+        if not chunk:
+            time.sleep(poll_interval)
+            continue
+        on_chunk(chunk)
+        # Only the tail is needed to detect the returning prompt; the output itself is never buffered
+        tail = (tail + chunk)[-(len(prompt) + 64):]
+        if tail.rstrip().endswith(prompt):
+            return
+    raise TimeoutError(f"Prompt '{prompt}' not seen within {read_timeout}s after '{command}'")
+
+def iter_sse_events(task_id: str, last_event_id: str = None, block_ms: int = 15000, start_timeout: float = 600.0) -> Iterator[str]:
+    """
+    Relays a task's output stream as Server-Sent Events, starting from the first chunk
+    (or after `last_event_id` when a client reconnects).
+    Yields keepalive comments while the task is quiet and stops after the end marker, however long
+    the task runs. Ends early with status `timeout` if the task has not started streaming within
+    `start_timeout`, or `lost` if its stream expired (the worker died) before the end marker.
+    """
+    key = stream_key(task_id)
+    last_id = last_event_id or "0-0"
+    started = last_event_id is not None
+    deadline = time.monotonic() + start_timeout
+    while True:
+        response = redis_client.xread({key: last_id}, block=block_ms, count=500)
+        if not response:
+            if not redis_client.exists(key):
+                if started:
+                    yield f"event: end\ndata: {json.dumps({'type': 'end', 'status': 'lost'})}\n\n"
+                    return
+                if time.monotonic() >= deadline:
+                    yield f"event: end\ndata: {json.dumps({'type': 'end', 'status': 'timeout'})}\n\n"
+                    return
+            yield ": keepalive\n\n"
+            continue
+        started = True
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                event = fields.get("type", "chunk")
+                yield f"id: {entry_id}\nevent: {event}\ndata: {json.dumps(fields)}\n\n"
+                if event == "end":
+                    return
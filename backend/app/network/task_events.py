@@ -0,0 +1,81 @@
+import json
+import time
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+from celery import states
+from celery.signals import task_prerun, task_postrun, task_retry
+from app.core.celery_app import celery_app
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+def event_channel(task_id: str) -> str:
+    return f"task_events:{task_id}"
+
+def get_task_metas(task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Fetches many Celery result metas with one MGET instead of one AsyncResult round trip each.
+    Unknown (or not yet started) tasks come back as None.
+    """
+    if not task_ids:
+        return []
+    keys = [celery_app.backend.get_key_for_task(task_id).decode() for task_id in task_ids]
+    return [json.loads(raw) if raw else None for raw in redis_client.mget(keys)]
+
+def publish_state(task_id: str, state: str):
+    try:
+        redis_client.publish(event_channel(task_id), json.dumps({"task_id": task_id, "state": state, "ts": time.time()}))
+    except Exception as e:
+        logger.debug(f"Failed to publish state {state} for task {task_id}: {str(e)}")
+
+@task_prerun.connect
+def _on_task_started(task_id=None, **extra):
+    publish_state(task_id, states.STARTED)
+
+@task_retry.connect
+def _on_task_retry(request=None, **extra):
+    if request is not None:
+        publish_state(request.id, states.RETRY)
+
+@task_postrun.connect
+def _on_task_finished(task_id=None, state=None, **extra):
+    # Retries also pass through postrun; _on_task_retry has already announced those
+    if state in states.READY_STATES:
+        publish_state(task_id, state)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def iter_task_state_events(task_ids: List[str], keepalive: float = 15.0, max_wait: float = 600.0) -> Iterator[str]:
+    """
+    Relays state transitions of a set of tasks as Server-Sent Events, ending once all of them
+    are finished. Subscribes before taking the MGET snapshot so no transition falls in between.
+    """
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(*[event_channel(task_id) for task_id in task_ids])
+    try:
+        pending = set(task_ids)
+        for task_id, meta in zip(task_ids, get_task_metas(task_ids)):
+            state = meta["status"] if meta else states.PENDING
+            yield _sse("state", {"task_id": task_id, "state": state})
+            if state in states.READY_STATES:
+                pending.discard(task_id)
+
+        deadline = time.monotonic() + max_wait
+        last_sent = time.monotonic()
+        while pending and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=1.0)
+            if message is None:
+                if time.monotonic() - last_sent >= keepalive:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield _sse("state", event)
+            last_sent = time.monotonic()
+            if event["state"] in states.READY_STATES:
+                pending.discard(event["task_id"])
+
+        yield _sse("end", {"pending": sorted(pending), "status": "timeout" if pending else "completed"})
+    finally:
+        pubsub.close()
@@ -1,14 +1,48 @@
+import random
 import logging
-from netmiko import ConnectHandler
+from contextlib import contextmanager, ExitStack
+from celery.signals import worker_process_shutdown, worker_shutdown
 from app.core.celery_app import celery_app
+from app.network.connection_pool import connection_pool
+from app.network.device_limiter import site_slot, DistributedSemaphore, clear_backup_inflight
+from app.network.async_engine import execute_fleet
+from app.network.streaming import TaskOutputStream, stream_command
+from app.network import result_cache
+from app.core import metrics
 from app.core.git_manager import GitManager
+from app.network.backup_runs import stage_config, record_unchanged, record_failure
+from app.network.backup_index import record_backups, find_unchanged
+from app.network.config_normalizer import normalize_config
 from app.models.tenant import Tenant
 from app.core.database import SessionLocal
 
 logger = logging.getLogger(__name__)
 
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_pooled_connections(**kwargs):
+    """
+    Logs out of every pooled SSH session when a worker process exits. Prefork children get
+    worker_process_shutdown; gevent/eventlet pools run in the main process and only get worker_shutdown.
+    """
+    connection_pool.close_all()
+
+@contextmanager
+def device_session(device: dict, operation: str, device_id: int = None, site_id: int = None):
+    """
+    Holds the site's fleet-wide concurrency slot, then checks a session out of the local pool;
+    the device's slot comes with the session, which keeps it while parked in the pool. Every
+    phase (slot waits, connect phases on a pool miss, command) is timed for the metrics exporter.
+    """
+    with metrics.OperationTimer(operation, vendor=device["device_type"], device_id=device_id) as timer, ExitStack() as stack:
+        with timer.phase("slot_wait"):
+            stack.enter_context(site_slot(site_id))
+        net_connect = stack.enter_context(connection_pool.connection(device))
+        with timer.phase("command"):
+            yield net_connect
+
 @celery_app.task(bind=True, name="app.network.tasks.execute_command")
-def execute_command(self, host: str, vendor: str, username: str, password: str, command: str):
+def execute_command(self, host: str, vendor: str, username: str, password: str, command: str, device_id: int = None, site_id: int = None):
     """
     Connects to a network device via SSH and executes a command.
     """
@@ -24,15 +58,87 @@ def execute_command(self, host: str, vendor: str, username: str, password: str,
 
     try:
         logger.info(f"Connecting to {host} ({vendor})...")
-        with ConnectHandler(**device) as net_connect:
+        with device_session(device, "execute_command", device_id=device_id, site_id=site_id) as net_connect:
             output = net_connect.send_command(command)
-            return {"status": "success", "output": output}
+            metrics.add_bytes(sent=len(command), received=len(output))
+        result = {"status": "success", "output": output}
+        result_cache.set_cached(device_id, command, result)
+        return result
     except Exception as e:
         logger.error(f"Failed to connect or execute command on {host}: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+@celery_app.task(bind=True, name="app.network.tasks.execute_command_streaming")
+def execute_command_streaming(self, host: str, vendor: str, username: str, password: str, command: str, read_timeout: float = 120.0,
+                              device_id: int = None, site_id: int = None):
+    """
+    Executes a command and publishes its output to the task's stream chunk by chunk.
+    Only a small summary goes to the result backend; the output itself is never buffered.
+    """
+    device = {
+        "device_type": vendor,
+        "host": host,
+        "username": username,
+        "password": password,
+        "fast_cli": True
+    }
+
+    stream = TaskOutputStream(self.request.id)
+    try:
+        logger.info(f"Streaming '{command}' from {host} ({vendor})...")
+        with device_session(device, "execute_command_streaming", device_id=device_id, site_id=site_id) as net_connect:
+            stream_command(net_connect, command, stream.chunk, read_timeout=read_timeout)
+            metrics.add_bytes(sent=len(command), received=stream.bytes_sent)
+        stream.end("success")
+        return {"status": "success", "streamed": True, "bytes": stream.bytes_sent}
+    except Exception as e:
+        logger.error(f"Failed to stream command output from {host}: {str(e)}")
+        stream.end("error", str(e))
+        return {"status": "error", "message": str(e), "bytes": stream.bytes_sent}
+
+@celery_app.task(bind=True, name="app.network.tasks.execute_commands")
+def execute_commands(self, host: str, vendor: str, username: str, password: str, commands: list[str], device_id: int = None, site_id: int = None):
+    """
+    Runs an ordered list of commands inside a single SSH session and returns the outputs keyed by command.
+    If a command fails, the outputs collected so far are returned alongside the error.
+    """
+    device = {
+        "device_type": vendor,
+        "host": host,
+        "username": username,
+        "password": password,
+        "session_log": f"{host}_session.log",
+        "fast_cli": True
+    }
+
+    outputs = {}
+    try:
+        logger.info(f"Connecting to {host} ({vendor}) for {len(commands)} commands...")
+        with device_session(device, "execute_commands", device_id=device_id, site_id=site_id) as net_connect:
+            for command in commands:
+                outputs[command] = net_connect.send_command(command)
+                metrics.add_bytes(sent=len(command), received=len(outputs[command]))
+        for command, output in outputs.items():
+            result_cache.set_cached(device_id, command, {"status": "success", "output": output})
+        return {"status": "success", "outputs": outputs}
+    except Exception as e:
+        logger.error(f"Batch execution failed on {host} after {len(outputs)}/{len(commands)} commands: {str(e)}")
+        return {"status": "error", "message": str(e), "outputs": outputs}
+
+@celery_app.task(bind=True, name="app.network.tasks.execute_commands_fleet")
+def execute_commands_fleet(self, targets: list[dict], max_concurrency: int = None):
+    """
+    Runs command batches on many devices from one worker using the asyncio SSH engine.
+    Each target is a dict with device_id, site_id, tenant_id, vendor, host, port, username, password
+    and commands; only vendors that accept SSH exec channels are supported.
+    """
+    logger.info(f"Async engine fan-out to {len(targets)} devices...")
+    results = execute_fleet(targets, max_concurrency=max_concurrency)
+    failed = sum(1 for result in results.values() if result["status"] != "success")
+    return {"status": "completed", "engine": "async", "failed": failed, "results": results}
+
 @celery_app.task(bind=True, name="app.network.tasks.fetch_interfaces")
-def fetch_interfaces(self, host: str, vendor: str, username: str, password: str):
+def fetch_interfaces(self, host: str, vendor: str, username: str, password: str, device_id: int = None, site_id: int = None):
     """
     Connects to a network device and formats interface addressing into JSON.
     """
@@ -47,26 +153,33 @@ def fetch_interfaces(self, host: str, vendor: str, username: str, password: str)
 
     try:
         logger.info(f"Fetching Interfaces from {host} ({vendor})...")
-        with ConnectHandler(**device) as net_connect:
+        with device_session(device, "fetch_interfaces", device_id=device_id, site_id=site_id) as net_connect:
             # Using TextFSM / Genie built into Netmiko to get Structured Data
             # Note: Requires ntc-templates installed in environment for real prod
             output = net_connect.send_command("show ip interface brief", use_textfsm=True)
             
-            # Fallback mock if TextFSM fails/not configured in this local env
-            if isinstance(output, str):
-                output = [
-                    {"intf": "GigabitEthernet0/0", "ipaddr": "10.0.0.1", "status": "up", "proto": "up"},
-                    {"intf": "GigabitEthernet0/1", "ipaddr": "unassigned", "status": "administratively down", "proto": "down"},
-                    {"intf": "Loopback0", "ipaddr": "192.168.1.1", "status": "up", "proto": "up"}
-                ]
+        # Fallback mock if TextFSM fails/not configured in this local env
+        if isinstance(output, str):
+            output = [
+                {"intf": "GigabitEthernet0/0", "ipaddr": "10.0.0.1", "status": "up", "proto": "up"},
+                {"intf": "GigabitEthernet0/1", "ipaddr": "unassigned", "status": "administratively down", "proto": "down"},
+                {"intf": "Loopback0", "ipaddr": "192.168.1.1", "status": "up", "proto": "up"}
+            ]
                 
-            return {"status": "success", "data": output}
+        result = {"status": "success", "data": output}
+        result_cache.set_cached(device_id, "show ip interface brief", result, parse_mode="textfsm")
+        return result
     except Exception as e:
         logger.error(f"Failed to fetch interfaces on {host}: {str(e)}")
         return {"status": "error", "message": str(e)}
 
 @celery_app.task(bind=True, name="app.network.tasks.backup_config")
-def backup_config(self, host: str, vendor: str, username: str, password: str, tenant_id: int):
+def backup_config(self, host: str, vendor: str, username: str, password: str, tenant_id: int, device_id: int = None, tenant_concurrency: int = None,
+                  backup_run_id: str = None, site_id: int = None):
+    """
+    Pulls a device's configuration. Within a backup run the config is staged for the tenant's
+    run committer; on its own it is committed to the tenant's Git repository right away.
+    """
     device = {
         "device_type": vendor, "host": host, "username": username, "password": password, "fast_cli": True
     }
@@ -75,35 +188,94 @@ def backup_config(self, host: str, vendor: str, username: str, password: str, te
     command = "show configuration"
     if "cisco" in vendor.lower() or "huawei" in vendor.lower() or "ruijie" in vendor.lower():
         command = "show running-config"
+
+    # Scheduled runs cap how many of a tenant's devices back up at once; over the cap we requeue
+    # instead of blocking this worker
+    tenant_slot = None
+    if tenant_concurrency:
+        tenant_slot = DistributedSemaphore(f"tenant_backup:{tenant_id}", tenant_concurrency, timeout=0)
+        if not tenant_slot.acquire():
+            raise self.retry(countdown=random.uniform(15, 60), max_retries=None)
     
     try:
-        with ConnectHandler(**device) as net_connect:
+        with device_session(device, "backup_config", device_id=device_id, site_id=site_id) as net_connect:
             output = net_connect.send_command(command)
-            
-            # Extract configuration and push to Git repository if tenant has Git Repo configured
-            db = SessionLocal()
+            metrics.add_bytes(sent=len(command), received=len(output))
+
+        # Timestamps, clock drift and checksums differ on every pull; only the normalized config
+        # is hashed, staged and committed
+        config = normalize_config(output, vendor)
+
+        # Session is back in the pool before we spend time on DB/Git work
+        db = SessionLocal()
+        try:
             tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
-            if tenant and tenant.git_repo_url:
-                git_manager = GitManager(
-                    tenant_id=tenant_id, 
-                    repo_url=tenant.git_repo_url, 
-                    branch=tenant.git_branch, 
-                    token=tenant.git_token
-                )
-                committed = git_manager.commit_device_config(
-                    hostname=host,
-                    config_content=output,
-                    commit_message=f"Automated config backup for {host}"
-                )
-                logger.info(f"Git Backup Status for {host}: {'Committed' if committed else 'No Changes'}")
+        finally:
+            # Return the connection before the Git push; under the gevent pool it is shared by many tasks
             db.close()
-            
-            return {"status": "success", "config_data": output}
+        versioned = bool(tenant and tenant.git_repo_url)
+
+        # Most backups are identical to the last one; recognise that from the stored digest
+        # before any blob write, Git pull or commit
+        previous = find_unchanged(device_id, config, versioned=versioned)
+        if previous is not None:
+            db = SessionLocal()
+            try:
+                record_backups(db, tenant_id, [{
+                    "device_id": device_id, "config_content": config, "commit_sha": previous["commit_sha"], "changed": False
+                }])
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to index unchanged backup of {host}: {str(e)}")
+            finally:
+                db.close()
+            if backup_run_id:
+                record_unchanged(backup_run_id, device_id, host, previous["commit_sha"])
+            logger.info(f"Git Backup Status for {host}: No Changes")
+            return {"status": "success", "unchanged": True, "commit": previous["commit_sha"], "config_data": output}
+
+        if backup_run_id:
+            stage_config(backup_run_id, device_id, host, config)
+            return {"status": "success", "config_data": output, "backup_run_id": backup_run_id}
+
+        # Extract configuration and push to Git repository if tenant has Git Repo configured
+        # Indexed even without a Git repository, so "last changed" works for every device
+        index_entry = {"device_id": device_id, "config_content": config}
+        if versioned:
+            git_manager = GitManager(
+                tenant_id=tenant_id, 
+                repo_url=tenant.git_repo_url, 
+                branch=tenant.git_branch, 
+                token=tenant.git_token
+            )
+            try:
+                commit_sha = git_manager.commit_device_configs({host: config}, commit_message=f"Automated config backup for {host}")[host]
+                delta = git_manager.line_stats([commit_sha])[commit_sha].get(host, {}) if commit_sha else {}
+                index_entry.update(commit_sha=commit_sha, changed=bool(commit_sha),
+                                   lines_added=delta.get("added", 0), lines_removed=delta.get("removed", 0))
+                logger.info(f"Git Backup Status for {host}: {'Committed' if commit_sha else 'No Changes'}")
+            except Exception as e:
+                logger.error(f"Error during git commit operation for {host}: {str(e)}")
+                index_entry = None
+        if index_entry and device_id is not None:
+            db = SessionLocal()
+            try:
+                record_backups(db, tenant_id, [index_entry])
+            finally:
+                db.close()
+
+        return {"status": "success", "config_data": output}
     except Exception as e:
+        if backup_run_id:
+            record_failure(backup_run_id, device_id, host, str(e))
         return {"status": "error", "message": str(e)}
+    finally:
+        if tenant_slot:
+            tenant_slot.release()
+        clear_backup_inflight(device_id, backup_run_id)
 
 @celery_app.task(bind=True, name="app.network.tasks.configure_ip")
-def configure_ip(self, host: str, vendor: str, username: str, password: str, interface: str, ip_address: str, subnet_mask: str):
+def configure_ip(self, host: str, vendor: str, username: str, password: str, interface: str, ip_address: str, subnet_mask: str, device_id: int = None, site_id: int = None):
     device = {
         "device_type": vendor, "host": host, "username": username, "password": password, "fast_cli": True
     }
@@ -116,14 +288,18 @@ def configure_ip(self, host: str, vendor: str, username: str, password: str, int
     ]
     
     try:
-        with ConnectHandler(**device) as net_connect:
+        with device_session(device, "configure_ip", device_id=device_id, site_id=site_id) as net_connect:
             output = net_connect.send_config_set(config_commands)
+            metrics.add_bytes(sent=sum(len(c) for c in config_commands), received=len(output))
             return {"status": "success", "output": output}
     except Exception as e:
         return {"status": "error", "message": str(e)}
+    finally:
+        # Even a partially applied change makes cached show output stale
+        result_cache.invalidate_device(device_id)
 
 @celery_app.task(bind=True, name="app.network.tasks.configure_bgp")
-def configure_bgp(self, host: str, vendor: str, username: str, password: str, local_as: str, neighbor_ip: str, remote_as: str):
+def configure_bgp(self, host: str, vendor: str, username: str, password: str, local_as: str, neighbor_ip: str, remote_as: str, device_id: int = None, site_id: int = None):
     device = {
         "device_type": vendor, "host": host, "username": username, "password": password, "fast_cli": True
     }
@@ -132,14 +308,18 @@ def configure_bgp(self, host: str, vendor: str, username: str, password: str, lo
         f"neighbor {neighbor_ip} remote-as {remote_as}"
     ]
     try:
-        with ConnectHandler(**device) as net_connect:
+        with device_session(device, "configure_bgp", device_id=device_id, site_id=site_id) as net_connect:
             output = net_connect.send_config_set(config_commands)
+            metrics.add_bytes(sent=sum(len(c) for c in config_commands), received=len(output))
             return {"status": "success", "output": output}
     except Exception as e:
         return {"status": "error", "message": str(e)}
+    finally:
+        # Even a partially applied change makes cached show output stale
+        result_cache.invalidate_device(device_id)
         
 @celery_app.task(bind=True, name="app.network.tasks.configure_policy")
-def configure_policy(self, host: str, vendor: str, username: str, password: str, map_name: str, action: str, sequence: int, match_prefix: str):
+def configure_policy(self, host: str, vendor: str, username: str, password: str, map_name: str, action: str, sequence: int, match_prefix: str, device_id: int = None, site_id: int = None):
     device = {
         "device_type": vendor, "host": host, "username": username, "password": password, "fast_cli": True
     }
@@ -148,8 +328,12 @@ def configure_policy(self, host: str, vendor: str, username: str, password: str,
         f"match ip address prefix-list {match_prefix}"
     ]
     try:
-        with ConnectHandler(**device) as net_connect:
+        with device_session(device, "configure_policy", device_id=device_id, site_id=site_id) as net_connect:
             output = net_connect.send_config_set(config_commands)
+            metrics.add_bytes(sent=sum(len(c) for c in config_commands), received=len(output))
             return {"status": "success", "output": output}
     except Exception as e:
         return {"status": "error", "message": str(e)}
+    finally:
+        # Even a partially applied change makes cached show output stale
+        result_cache.invalidate_device(device_id)
@@ -1,5 +1,15 @@
 import os
-from jinja2 import Environment, FileSystemLoader
+import json
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Any, Dict
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from jinja2.sandbox import SandboxedEnvironment
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
 
 # Path to the directory where Jinja2 templates are stored
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
@@ -10,6 +20,10 @@ os.makedirs(TEMPLATE_DIR, exist_ok=True)
 # Initialize the Jinja2 Environment
 env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), trim_blocks=True, lstrip_blocks=True)
 
+# Templates submitted through the API are sandboxed, and a variable missing for a host fails that
+# host instead of rendering an empty value into its config
+string_env = SandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, undefined=StrictUndefined)
+
 def render_template(template_name: str, context: dict) -> str:
     """
     Renders a Jinja2 template with the provided context variables.
@@ -17,6 +31,38 @@ def render_template(template_name: str, context: dict) -> str:
     template = env.get_template(template_name)
     return template.render(**context)
 
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+@lru_cache(maxsize=64)
+def _compile(template_content: str):
+    return string_env.from_string(template_content)
+
+class TemplateRenderer:
+    """
+    Compiles a template string once and renders it per host. Outputs are cached in Redis by
+    (template hash, vars hash), so re-runs and dry-runs of the same deploy skip rendering.
+    """
+    def __init__(self, template_content: str):
+        self.template = _compile(template_content)
+        self.template_hash = _digest(template_content)
+
+    def render(self, context: Dict[str, Any]) -> str:
+        key = f"render_cache:{self.template_hash}:{_digest(json.dumps(context, sort_keys=True, default=str))}"
+        try:
+            cached = redis_client.get(key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            logger.debug(f"Render cache lookup failed: {str(e)}")
+
+        rendered = self.template.render(**context)
+        try:
+            redis_client.set(key, rendered, ex=settings.RENDER_CACHE_TTL)
+        except Exception as e:
+            logger.debug(f"Render cache store failed: {str(e)}")
+        return rendered
+
 def save_template(template_name: str, template_content: str):
     """
     Utility to programmatically create or update a Jinja2 template on disk.
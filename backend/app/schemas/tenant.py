@@ -5,6 +5,11 @@ from datetime import datetime
 class TenantBase(BaseModel):
     name: str
     description: Optional[str] = None
+    backup_enabled: bool = True
+    backup_interval_hours: int = 24
+    backup_window_start_hour: int = 0
+    backup_window_hours: int = 4
+    backup_max_concurrency: int = 20
 
 class TenantCreate(TenantBase):
     pass
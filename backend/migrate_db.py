@@ -42,6 +42,24 @@ def run_migration():
             print("Adding snmp_community column...")
             cur.execute("ALTER TABLE devices ADD COLUMN snmp_community VARCHAR;")
 
+        # Scheduled backup settings per tenant
+        tenant_columns = {
+            "backup_enabled": "BOOLEAN DEFAULT TRUE NOT NULL",
+            "backup_interval_hours": "INTEGER DEFAULT 24 NOT NULL",
+            "backup_window_start_hour": "INTEGER DEFAULT 0 NOT NULL",
+            "backup_window_hours": "INTEGER DEFAULT 4 NOT NULL",
+            "backup_max_concurrency": "INTEGER DEFAULT 20 NOT NULL",
+        }
+        for column_name, column_type in tenant_columns.items():
+            cur.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name='tenants' and column_name=%s;
+            """, (column_name,))
+            if not cur.fetchone():
+                print(f"Adding tenants.{column_name} column...")
+                cur.execute(f"ALTER TABLE tenants ADD COLUMN {column_name} {column_type};")
+
         # Make credential_id nullable
         print("Altering credential_id to DROP NOT NULL...")
         cur.execute("ALTER TABLE devices ALTER COLUMN credential_id DROP NOT NULL;")
@@ -0,0 +1,66 @@
+import json
+import tempfile
+from app.core.config import settings
+from app.network.config_normalizer import normalize_config, compiled_rules, _rule_keys
+
+IOS_PULL_1 = """Building configuration...
+
+Current configuration : 1520 bytes
+!
+! Last configuration change at 10:02:11 UTC Mon Jan 6 2025 by admin
+! NVRAM config last updated at 10:02:15 UTC Mon Jan 6 2025 by admin
+!
+hostname SW-NORM-01
+!
+interface Vlan1
+ ip address 10.0.0.1 255.255.255.0
+!
+ntp clock-period 36028811
+end
+"""
+
+IOS_PULL_2 = IOS_PULL_1.replace("10:02:11 UTC Mon Jan 6", "03:00:00 UTC Tue Jan 7").replace("36028811", "36028790").replace("1520", "1523")
+
+JUNOS_PULL = """## Last commit: 2025-01-06 10:02:11 UTC by admin
+version 21.4R3;
+system {
+    host-name MX-NORM-01;
+}
+"""
+
+def test_config_normalizer():
+    print("--- Running config normalizer Tests ---")
+
+    # 1. Pulls that differ only in volatile lines normalize to the same config
+    first, second = normalize_config(IOS_PULL_1, "cisco_ios"), normalize_config(IOS_PULL_2, "cisco_ios")
+    print(f"IOS pulls normalize identically: {first == second}")
+    assert first == second
+    assert "Last configuration change" not in first and "ntp clock-period" not in first
+    assert "hostname SW-NORM-01\n" in first, "Trailing whitespace should be stripped, the line kept"
+
+    # 2. Real changes survive normalization
+    changed = normalize_config(IOS_PULL_1.replace("10.0.0.1", "10.0.0.2"), "cisco_ios")
+    assert changed != first and "ip address 10.0.0.2" in changed
+
+    # 3. Rules are per vendor: Junos headers are dropped for Juniper device types only
+    assert "## Last commit" not in normalize_config(JUNOS_PULL, "juniper_junos")
+    assert "## Last commit" in normalize_config(JUNOS_PULL, "cisco_ios")
+    assert "ntp clock-period 36028811" in normalize_config(IOS_PULL_1, "mikrotik_routeros")
+
+    # 4. Extra rules from the configured file extend the defaults
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"cisco": {"drop": [r"! Backup marker"], "replace": [[r"(snmp-server community) \S+", r"\1 <removed>"]]}}, f)
+    settings.CONFIG_NORMALIZATION_RULES_FILE = f.name
+    compiled_rules.cache_clear()
+    _rule_keys.cache_clear()
+    custom = normalize_config("! Backup marker 42\nsnmp-server community s3cret RO\n", "cisco_ios")
+    print(f"Custom rules applied: {custom!r}")
+    assert custom == "snmp-server community <removed> RO\n"
+
+    settings.CONFIG_NORMALIZATION_RULES_FILE = None
+    compiled_rules.cache_clear()
+    _rule_keys.cache_clear()
+    print("--- All config normalizer Tests Passed Successfully! ---")
+
+if __name__ == "__main__":
+    test_config_normalizer()
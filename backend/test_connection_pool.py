@@ -0,0 +1,95 @@
+from app.network.connection_pool import ConnectionPool, PoolExhausted
+
+class FakeConnection:
+    opened = 0
+
+    def __init__(self, **device):
+        FakeConnection.opened += 1
+        self.device = device
+        self.alive = True
+        self.closed = False
+
+    def is_alive(self):
+        return self.alive
+
+    def disconnect(self):
+        self.closed = True
+
+def make_device(host="10.0.0.1", username="admin"):
+    return {"device_type": "cisco_ios", "host": host, "username": username, "password": "x"}
+
+def test_connection_pool():
+    print("--- Running ConnectionPool Tests ---")
+    FakeConnection.opened = 0
+    pool = ConnectionPool(max_per_host=1, max_idle=2, idle_timeout=60, acquire_timeout=0.1, connect=FakeConnection)
+    device = make_device()
+
+    # 1. Back-to-back operations on the same device reuse one session
+    with pool.connection(device) as first:
+        pass
+    with pool.connection(device) as second:
+        pass
+    assert first is second, "Idle session should be reused"
+    assert FakeConnection.opened == 1
+
+    # 2. Dead sessions are replaced transparently
+    second.alive = False
+    with pool.connection(device) as third:
+        pass
+    assert third is not second and second.closed, "Dead session should be closed and replaced"
+
+    # 3. Errors inside the block discard the session
+    try:
+        with pool.connection(device) as broken:
+            raise RuntimeError("channel hung")
+    except RuntimeError:
+        pass
+    assert broken.closed and pool.stats() == {"open": 0, "idle": 0}
+
+    # 4. Per-host limit blocks a second concurrent session
+    held = pool.acquire(device)
+    try:
+        pool.acquire(device)
+        assert False, "Second session should exceed max_per_host"
+    except PoolExhausted:
+        pass
+    pool.release(device, held)
+
+    # 5. LRU eviction once more than max_idle sessions are parked
+    for host in ["10.0.0.2", "10.0.0.3"]:
+        with pool.connection(make_device(host)):
+            pass
+    assert pool.stats()["idle"] == 2 and held.closed, "Least recently used session should be evicted"
+
+    # 6. Idle timeout expires parked sessions
+    pool.idle_timeout = 0
+    with pool.connection(make_device("10.0.0.4")):
+        pass
+    assert pool.stats()["idle"] == 1
+
+    # 7. Sessions not meant to be kept are closed instead of parked
+    pool.close_all()
+    with pool.connection(device, keep=False) as unkept:
+        pass
+    assert unkept.closed and pool.stats() == {"open": 0, "idle": 0}
+
+    # 8. max_per_host counts every session to the host, whatever user it logs in with
+    pool.idle_timeout = 60
+    held = pool.acquire(device)
+    try:
+        pool.acquire(make_device(username="backup"))
+        assert False, "A second user's session should count against the same host"
+    except PoolExhausted:
+        pass
+    pool.release(device, held)
+    with pool.connection(make_device(username="backup")) as backup:
+        pass
+    assert held.closed and not backup.closed, "Another user's idle session should make way"
+    assert pool.stats() == {"open": 1, "idle": 1}
+
+    pool.close_all()
+    assert pool.stats() == {"open": 0, "idle": 0}
+    print("--- All ConnectionPool Tests Passed Successfully! ---")
+
+if __name__ == "__main__":
+    test_connection_pool()
@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from app.core.config import settings
+from app.network import tasks, device_limiter
+from app.network.connection_pool import connection_pool
+
+class FakeStream:
+    def __init__(self, task_id):
+        self.bytes_sent = 0
+        self.chunks = []
+        self.ended = None
+
+    def chunk(self, data):
+        self.chunks.append(data)
+        self.bytes_sent += len(data)
+
+    def end(self, status, message=None):
+        self.ended = (status, message)
+
+class FakeSemaphore:
+    """In-process stand-in for the Redis-backed DistributedSemaphore."""
+    holders = {}
+
+    def __init__(self, name, limit, lease=None, timeout=None):
+        self.name, self.limit, self.timeout = name, limit, timeout
+        self.token = None
+
+    def acquire(self, give_up=None):
+        if FakeSemaphore.holders.get(self.name, 0) >= self.limit:
+            return False
+        FakeSemaphore.holders[self.name] = FakeSemaphore.holders.get(self.name, 0) + 1
+        self.token = "held"
+        return True
+
+    def release(self):
+        if self.token:
+            FakeSemaphore.holders[self.name] -= 1
+            self.token = None
+
+    def park(self, lease):
+        return bool(self.token)
+
+    def resume(self):
+        return bool(self.token)
+
+    def has_waiters(self):
+        return False
+
+class FakeConnection:
+    opened = 0
+
+    def __init__(self, **device):
+        FakeConnection.opened += 1
+        self.closed = False
+
+    def send_command(self, command):
+        return f"output of {command}"
+
+    def is_alive(self):
+        return not self.closed
+
+    def disconnect(self):
+        self.closed = True
+
+def test_pooled_session_reuse():
+    print("--- Running pooled session reuse Tests ---")
+    assert settings.DEVICE_CONCURRENCY_LIMIT == 1, "Runs against the default per-device limit"
+    original = device_limiter.DistributedSemaphore, connection_pool._connect
+    device_limiter.DistributedSemaphore, connection_pool._connect = FakeSemaphore, FakeConnection
+    try:
+        results = [
+            tasks.execute_command.run(host="10.0.0.9", vendor="cisco_ios", username="admin", password="x", command=command)
+            for command in ("show version", "show clock")
+        ]
+        print(f"Sessions opened for two tasks: {FakeConnection.opened}")
+        assert all(result["status"] == "success" for result in results)
+        assert FakeConnection.opened == 1, "Back-to-back tasks should reuse the pooled session"
+        # The parked session keeps counting against the device limit until it is closed
+        assert FakeSemaphore.holders["device:10.0.0.9"] == 1
+        connection_pool.close_all()
+        assert FakeSemaphore.holders["device:10.0.0.9"] == 0
+    finally:
+        connection_pool.close_all()
+        device_limiter.DistributedSemaphore, connection_pool._connect = original
+    print("--- All pooled session reuse Tests Passed Successfully! ---")
+
+def test_execute_command_streaming():
+    print("--- Running streaming task Tests ---")
+    sessions = []
+    streams = []
+
+    @contextmanager
+    def fake_session(device, operation, **kwargs):
+        sessions.append((device["host"], operation, kwargs))
+        yield object()
+
+    def fake_stream_command(net_connect, command, on_chunk, read_timeout=None):
+        on_chunk(f"output of {command}\n")
+
+    original = tasks.device_session, tasks.stream_command, tasks.TaskOutputStream
+    tasks.device_session, tasks.stream_command = fake_session, fake_stream_command
+    tasks.TaskOutputStream = lambda task_id: streams.append(FakeStream(task_id)) or streams[-1]
+    try:
+        result = tasks.execute_command_streaming.run(
+            host="10.0.0.1", vendor="cisco_ios", username="admin", password="x", command="show version", device_id=7, site_id=3
+        )
+    finally:
+        tasks.device_session, tasks.stream_command, tasks.TaskOutputStream = original
+
+    print(f"Streaming result: {result}")
+    assert result["status"] == "success" and result["bytes"] == len("output of show version\n")
+    assert sessions[0][0] == "10.0.0.1" and sessions[0][2]["device_id"] == 7 and sessions[0][2]["site_id"] == 3, "Session should be opened for the device"
+    assert streams[0].ended == ("success", None)
+    print("--- All streaming task Tests Passed Successfully! ---")
+
+if __name__ == "__main__":
+    test_pooled_session_reuse()
+    test_execute_command_streaming()
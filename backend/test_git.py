@@ -1,7 +1,7 @@
 import os
 import shutil
 import logging
-from app.core.git_manager import GitManager
+from app.core.git_manager import GitManager, GitPushError
 
 logging.basicConfig(level=logging.INFO)
 
@@ -56,5 +56,121 @@ def test_git_manager():
     
     print("--- All GitManager Tests Passed Successfully! ---")
 
+def test_batched_commit():
+    import git
+    import tempfile
+
+    print("--- Running batched GitManager commit Tests ---")
+    workdir = tempfile.mkdtemp()
+    remote = git.Repo.init(os.path.join(workdir, "remote.git"), bare=True)
+
+    git_manager = GitManager(tenant_id=998, repo_url=remote.working_dir)
+    git_manager.local_path = os.path.join(workdir, "clone")
+    repo = git.Repo.clone_from(remote.working_dir, git_manager.local_path)
+    git_manager._ensure_repo_ready = lambda: repo
+    git_manager._repo_lock = lambda: open(os.devnull)
+
+    pushes = []
+    failing = []
+    remote_push = git.Remote.push
+
+    def counting_push(self, *args, **kwargs):
+        pushes.append(1)
+        if failing:
+            raise git.GitCommandError("push", 1, stderr="remote unreachable")
+        return remote_push(self, *args, **kwargs)
+
+    git.Remote.push = counting_push
+    try:
+        # 1. Five new configs in chunks of two: three commits, one push
+        configs = {f"SW-{i:02d}": f"hostname SW-{i:02d}\n" for i in range(5)}
+        outcome = git_manager.commit_device_configs(configs, "Backup run", chunk_size=2)
+        print(f"Commits for first run: {len(set(outcome.values()))}, pushes: {len(pushes)}")
+        assert all(outcome.values()) and len(set(outcome.values())) == 3 and len(pushes) == 1
+
+        # 2. One changed config among unchanged ones: only it gets a commit
+        configs["SW-03"] += "interface vlan 3\n"
+        outcome = git_manager.commit_device_configs(configs, "Backup run", chunk_size=2)
+        changed = [hostname for hostname, sha in outcome.items() if sha]
+        print(f"Changed in second run: {changed}")
+        assert changed == ["SW-03"] and len(pushes) == 2
+        assert remote.commit(repo.active_branch.name).hexsha == outcome["SW-03"], "Remote should hold the run's last commit"
+
+        # 3. Nothing changed: no commit and no push
+        outcome = git_manager.commit_device_configs(configs, "Backup run")
+        assert not any(outcome.values()) and len(pushes) == 2
+
+        # 4. A failed push keeps the commit locally and reports it; the next run pushes it even with nothing new
+        configs["SW-04"] += "interface vlan 4\n"
+        failing.append(1)
+        try:
+            git_manager.commit_device_configs(configs, "Backup run")
+            raise AssertionError("A failed push should raise GitPushError")
+        except GitPushError as e:
+            unpushed = e.outcome["SW-04"]
+        failing.clear()
+        assert unpushed and remote.commit(repo.active_branch.name).hexsha != unpushed
+        outcome = git_manager.commit_device_configs(configs, "Backup run")
+        print(f"Unpushed commit retried: {remote.commit(repo.active_branch.name).hexsha == unpushed}")
+        assert not any(outcome.values()) and remote.commit(repo.active_branch.name).hexsha == unpushed
+    finally:
+        git.Remote.push = remote_push
+        shutil.rmtree(workdir)
+    print("--- All batched commit Tests Passed Successfully! ---")
+
+def test_local_reads():
+    import git
+    import time
+    import tempfile
+    from app.core import git_manager as git_manager_module
+
+    print("--- Running local-read GitManager Tests ---")
+    workdir = tempfile.mkdtemp()
+    remote = git.Repo.init(os.path.join(workdir, "remote.git"), bare=True)
+    writer = git.Repo.clone_from(remote.working_dir, os.path.join(workdir, "writer"))
+
+    def push_config(content):
+        with open(os.path.join(writer.working_dir, "SW-READ.conf"), "w") as f:
+            f.write(content)
+        writer.index.add(["SW-READ.conf"])
+        writer.index.commit("Backup")
+        writer.remotes.origin.push("HEAD")
+
+    push_config("hostname SW-READ\n")
+    base_repo_dir = git_manager_module.BASE_REPO_DIR
+    remote_fetch, remote_pull = git.Remote.fetch, git.Remote.pull
+    git_manager_module.BASE_REPO_DIR = workdir
+    try:
+        git_manager = GitManager(tenant_id=997, repo_url=remote.working_dir, branch=writer.active_branch.name)
+
+        # 1. The first read clones; later reads never touch the remote while the copy is fresh
+        assert len(git_manager.get_commit_history("SW-READ")) == 1
+        network = []
+        git.Remote.fetch = lambda self, *args, **kwargs: network.append("fetch") or remote_fetch(self, *args, **kwargs)
+        git.Remote.pull = lambda self, *args, **kwargs: network.append("pull") or remote_pull(self, *args, **kwargs)
+        push_config("hostname SW-READ\nvlan 2\n")
+        history = git_manager.get_commit_history("SW-READ")
+        print(f"Reads while fresh: {len(history)} commits, network calls: {network}")
+        assert len(history) == 1 and network == [] and git_manager.freshness()["stale"] is False
+
+        # 2. A stale copy answers immediately and fetches in the background
+        os.utime(git_manager._fetch_stamp(), (0, 0))
+        assert git_manager.freshness()["stale"] is True
+        assert len(git_manager.get_commit_history("SW-READ")) == 1
+        deadline = time.time() + 10
+        while git_manager.freshness()["stale"] and time.time() < deadline:
+            time.sleep(0.05)
+        history = git_manager.get_commit_history("SW-READ")
+        print(f"After background fetch: {len(history)} commits, network calls: {network}")
+        assert len(history) == 2 and network == ["fetch"]
+        assert git_manager.get_file_content_at_commit("SW-READ", history[0]["commit_hash"]) == "hostname SW-READ\nvlan 2\n"
+    finally:
+        git.Remote.fetch, git.Remote.pull = remote_fetch, remote_pull
+        git_manager_module.BASE_REPO_DIR = base_repo_dir
+        shutil.rmtree(workdir)
+    print("--- All local-read Tests Passed Successfully! ---")
+
 if __name__ == "__main__":
     test_git_manager()
+    test_batched_commit()
+    test_local_reads()